@@ -0,0 +1,4 @@
+"""
+PURE Protocol benchmarks
+Run from the protocol directory, e.g.: python3 -m bench.engines
+"""
@@ -0,0 +1,227 @@
+"""
+Shared helpers for the PURE benchmarks
+- Cached pool of client keypairs so RSA keygen stays out of the measurements
+- Throwaway server processes with their own ~/.pure
+- Minimal asyncio client speaking the HELLO/CHALLENGE/RESPONSE/WELCOME handshake
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.backends import default_backend
+
+PROTOCOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEY_POOL_DIR = os.path.expanduser("~/.pure/bench")
+
+PEM_END = b"-----END PUBLIC KEY-----"
+
+
+# -------------------------
+# Key Pool
+# -------------------------
+
+def load_key_pool(count, key_size=2048):
+    """Return `count` private keys, generating and caching any that are missing"""
+    os.makedirs(KEY_POOL_DIR, exist_ok=True)
+    path = os.path.join(KEY_POOL_DIR, f"keypool-{key_size}.pem")
+    
+    keys = []
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            blobs = f.read().split(b"\n\n")
+        for blob in blobs[:count]:
+            if blob.strip():
+                keys.append(serialization.load_pem_private_key(
+                    blob, password=None, backend=default_backend()
+                ))
+    
+    if len(keys) < count:
+        print(f"[*] Generating {count - len(keys)} client keys (cached in {path})...")
+        with open(path, "ab") as f:
+            while len(keys) < count:
+                key = rsa.generate_private_key(
+                    public_exponent=65537,
+                    key_size=key_size,
+                    backend=default_backend()
+                )
+                f.write(key.private_bytes(
+                    encoding=serialization.Encoding.PEM,
+                    format=serialization.PrivateFormat.TraditionalOpenSSL,
+                    encryption_algorithm=serialization.NoEncryption()
+                ) + b"\n")
+                keys.append(key)
+    
+    return keys
+
+
+def public_pem(key):
+    """PEM string of a private key's public half"""
+    return key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode().strip()
+
+
+def sign(key, challenge):
+    """Sign a challenge the same way client.py does"""
+    return key.sign(
+        challenge.encode(),
+        padding.PSS(
+            mgf=padding.MGF1(hashes.SHA256()),
+            salt_length=padding.PSS.MAX_LENGTH
+        ),
+        hashes.SHA256()
+    ).hex()
+
+
+# -------------------------
+# Server Processes
+# -------------------------
+
+def free_port():
+    """Ask the kernel for an unused TCP port"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """A server.py subprocess with an isolated home directory"""
+    
+    def __init__(self, *args, port=None):
+        self.port = port or free_port()
+        self.args = list(args)
+        self.home = tempfile.TemporaryDirectory(prefix="pure-bench-")
+        self.proc = None
+    
+    def __enter__(self):
+        env = dict(os.environ, HOME=self.home.name)
+        self.proc = subprocess.Popen(
+            [sys.executable, "server.py", "--host", "127.0.0.1",
+             "--port", str(self.port), *self.args],
+            cwd=PROTOCOL_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        self.wait_ready()
+        return self
+    
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.home.cleanup()
+    
+    def wait_ready(self, timeout=30):
+        """Block until the server accepts connections"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"server exited with {self.proc.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("server did not start")
+    
+    def rss_kb(self):
+        """Resident set size of the server process in KiB"""
+        with open(f"/proc/{self.proc.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        return 0
+
+
+def server_cpu(pid):
+    """User plus system CPU seconds the server process has used"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def tree_rss_kb(pid):
+    """RSS of a process and all of its descendants, in KiB"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = f.read().split()
+    except OSError:
+        return total
+    return total + sum(tree_rss_kb(int(child)) for child in children)
+
+
+# -------------------------
+# Client
+# -------------------------
+
+class BenchClient:
+    """Authenticated asyncio connection used to drive load"""
+    
+    def __init__(self, key):
+        self.key = key
+        self.reader = None
+        self.writer = None
+    
+    async def connect(self, host, port, options=""):
+        """Open a connection and complete the handshake, asking for `options`"""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(f"HELLO {public_pem(self.key)}{options}\n".encode())
+        
+        line = (await self.reader.readline()).decode().strip()
+        if not line.startswith("CHALLENGE "):
+            raise ConnectionError(f"expected CHALLENGE, got {line!r}")
+        challenge = line.split(" ", 1)[1]
+        self.writer.write(f"RESPONSE {sign(self.key, challenge)}\n".encode())
+        
+        welcome = await self.reader.readline()
+        if not welcome.startswith(b"WELCOME "):
+            raise ConnectionError(f"expected WELCOME, got {welcome.strip()!r}")
+        await self.reader.readuntil(PEM_END)
+        await self.reader.readline()
+    
+    def send(self, line):
+        self.writer.write(f"{line}\n".encode())
+    
+    async def readline(self):
+        return (await self.reader.readline()).decode().strip()
+    
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def server_counters(client):
+    """Counters from a STATS reply, skipping the chat in front of it"""
+    client.send("STATS")
+    while True:
+        line = await client.readline()
+        if line.startswith('{"type": "STATS"'):
+            return json.loads(line)["counters"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
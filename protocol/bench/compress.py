@@ -0,0 +1,194 @@
+"""
+Compressed transport benchmark
+Runs the same chat fan-out and HISTORY catch-up against a server with
+compression off and at several zlib levels, every client on length framing.
+Reports wire bytes per chat message, compression ratio, server CPU and the
+time clients spend inflating. A batch the server's writer takes from a
+peer's queue is deflated as one block.
+Usage: python3 -m bench.compress [--receivers 20] [--messages 1000] [--levels 1,6,9]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from bench.common import BenchClient, ServerProcess, load_key_pool, server_cpu
+from compress import Decompressor, COMPRESS, ZLIB
+from framing import HEADER, LENGTH, read_frame, encode
+
+TAG = "zc "  # prefix of the chat messages being counted
+WORDS = (
+    "deploy build shipping the release tonight on staging check logs rollback "
+    "metrics look fine anyone seen this error before ok thanks will do later "
+    "merged review please the tests pass locally node restarted again"
+).split()
+
+
+class Receiver:
+    """Length-framed client counting what it reads, before and after inflating"""
+
+    def __init__(self, client, compressed):
+        self.client = client
+        self.decompressor = Decompressor() if compressed else None
+        self.replies = asyncio.Queue()  # HISTORY pages we asked for
+        self.chats = 0
+        self.reset()
+
+    def reset(self):
+        self.wire_bytes = 0
+        self.raw_bytes = 0
+        self.inflate_s = 0.0
+
+    def send(self, line):
+        self.client.writer.write(encode(line.encode(), LENGTH))
+
+    async def read(self):
+        while True:
+            payload = await read_frame(self.client.reader, LENGTH)
+            if payload is None:
+                return
+            self.wire_bytes += HEADER.size + len(payload)
+            payloads = [payload]
+            if self.decompressor:
+                start = time.perf_counter()
+                payloads = self.decompressor.payloads(payload)
+                self.inflate_s += time.perf_counter() - start
+            for payload in payloads:
+                self.raw_bytes += HEADER.size + len(payload)
+                self.receive(payload)
+
+    def receive(self, payload):
+        if payload.startswith(b'{"type": "CHAT"'):
+            if b'"message": "' + TAG.encode() in payload:
+                self.chats += 1
+        elif payload.startswith(b'{"type": "HISTORY"') and b'"first_seq"' in payload:
+            self.replies.put_nowait(json.loads(payload))
+        elif payload == b"PING":
+            self.send("PONG")
+
+    async def catch_up(self, page):
+        """Page through the whole history; returns the messages received"""
+        seq = 0
+        received = 0
+        while True:
+            self.send(f"HISTORY {seq} {page}")
+            reply = await self.replies.get()
+            messages = reply["messages"]
+            received += len(messages)
+            if not messages or messages[-1]["seq"] >= reply["last_seq"]:
+                return received
+            seq = messages[-1]["seq"]
+
+
+async def drain(client):
+    while await client.reader.readline():
+        pass
+
+
+def totals(receivers):
+    return {
+        "wire": sum(r.wire_bytes for r in receivers),
+        "raw": sum(r.raw_bytes for r in receivers),
+        "inflate": sum(r.inflate_s for r in receivers),
+    }
+
+
+async def run(mode, level, keys, port, pid, args):
+    options = f" FRAMING={LENGTH}" + (f" {COMPRESS}={ZLIB}" if level else "")
+    clients = [BenchClient(key) for key in keys[:-1]]
+    await asyncio.gather(*(c.connect("127.0.0.1", port, options) for c in clients))
+    receivers = [Receiver(c, bool(level)) for c in clients]
+    readers = [asyncio.create_task(r.read()) for r in receivers]
+    sender = BenchClient(keys[-1])
+    await sender.connect("127.0.0.1", port)
+    sender_reader = asyncio.create_task(drain(sender))
+    await asyncio.sleep(0.5)  # join announcements settle
+    for receiver in receivers:
+        receiver.reset()
+
+    rng = random.Random(1)
+    texts = [
+        f"{TAG}{i} " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 14)))
+        for i in range(args.messages)
+    ]
+    cpu = server_cpu(pid)
+    start = time.perf_counter()
+    for text in texts:
+        sender.send(f"CHAT {text}")
+    expected = args.messages * len(receivers)
+    deadline = start + args.timeout
+    while sum(r.chats for r in receivers) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.005)
+    chat_s = time.perf_counter() - start
+    chat_cpu = server_cpu(pid) - cpu
+    chat = totals(receivers)
+    delivered = sum(r.chats for r in receivers)
+
+    for receiver in receivers:
+        receiver.reset()
+    cpu = server_cpu(pid)
+    start = time.perf_counter()
+    paged = sum(await asyncio.gather(*(r.catch_up(args.page) for r in receivers)))
+    history_s = time.perf_counter() - start
+    history_cpu = server_cpu(pid) - cpu
+    history = totals(receivers)
+
+    for task in (*readers, sender_reader):
+        task.cancel()
+    await asyncio.gather(*(c.close() for c in clients), sender.close())
+
+    return {
+        "mode": mode,
+        "receivers": len(receivers),
+        "chat_delivered_pct": 100.0 * delivered / expected,
+        "chat_bytes_per_msg": chat["wire"] / delivered if delivered else 0.0,
+        "chat_ratio": chat["raw"] / chat["wire"] if chat["wire"] else 0.0,
+        "chat_s": chat_s,
+        "chat_server_cpu_ms": chat_cpu * 1000,
+        "chat_inflate_us_per_msg": chat["inflate"] / delivered * 1e6 if delivered else 0.0,
+        "history_bytes_per_msg": history["wire"] / paged if paged else 0.0,
+        "history_ratio": history["raw"] / history["wire"] if history["wire"] else 0.0,
+        "history_s": history_s,
+        "history_server_cpu_ms": history_cpu * 1000,
+        "history_inflate_ms": history["inflate"] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compressed and plain transport")
+    parser.add_argument("--receivers", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=1000, help="chat messages broadcast")
+    parser.add_argument("--levels", default="1,6,9", help="zlib levels to compare with plain")
+    parser.add_argument("--compress-min", type=int, help="server's --compress-min")
+    parser.add_argument("--page", type=int, default=500, help="messages per HISTORY request")
+    parser.add_argument("--engine", default="asyncio", choices=["thread", "asyncio"])
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for delivery")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    modes = [("plain", 0)] + [(f"zlib-{level}", int(level)) for level in args.levels.split(",")]
+    keys = load_key_pool(args.receivers + 1)
+    results = []
+    for mode, level in modes:
+        server_args = ["--engine", args.engine, "--no-limits",
+                       "--max-peers", str(args.receivers + 10),
+                       "--queue-limit", str(args.messages + 64),
+                       "--compress-level", str(level)]
+        if args.compress_min is not None:
+            server_args += ["--compress-min", str(args.compress_min)]
+        with ServerProcess(*server_args) as server:
+            results.append(asyncio.run(run(mode, level, keys, server.port, server.proc.pid, args)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.receivers} receivers, {args.messages} messages, {args.engine} engine")
+    print(f"{'metric':<26}" + "".join(f"{r['mode']:>12}" for r in results))
+    for column in list(results[0])[2:]:
+        print(f"{column:<26}" + "".join(f"{r[column]:>12.2f}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
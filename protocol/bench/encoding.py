@@ -0,0 +1,118 @@
+"""
+JSON vs compact message encoding benchmark
+Reports bytes per message and encode/decode throughput for CHAT, HISTORY
+and PEERS payloads shaped like the server's.
+Usage: python3 -m bench.encoding [--senders 20] [--seconds 1.0]
+"""
+
+import argparse
+import json
+import random
+import secrets
+import time
+from datetime import datetime, timedelta
+
+from compact import Decoder, Interner, encode_message
+
+
+def chat(seq, sender, when):
+    return {
+        "type": "CHAT",
+        "sender": sender,
+        "message": f"message {seq}: " + "lorem ipsum dolor sit amet"[:random.randint(5, 26)],
+        "timestamp": when.isoformat(),
+        "seq": seq
+    }
+
+
+def build_messages(sender_count):
+    """Representative server messages, keyed by benchmark name"""
+    random.seed(1)
+    senders = [secrets.token_hex(16) for _ in range(sender_count)]
+    start = datetime.now()
+    history = [
+        chat(seq, random.choice(senders), start + timedelta(milliseconds=seq * 137))
+        for seq in range(1, 501)
+    ]
+    return {
+        "chat": history[-1],
+        "history_10": {"type": "HISTORY", "messages": history[-10:], "last_seq": 500},
+        "history_500": {
+            "type": "HISTORY", "messages": history, "first_seq": 1, "last_seq": 500
+        },
+        "peers_50": {
+            "type": "PEERS",
+            "peers": [
+                {"pubkey": secrets.token_hex(16), "role": "INITIATE", "last_seen": time.time()}
+                for _ in range(50)
+            ]
+        },
+    }
+
+
+def rate(fn, seconds):
+    """Calls per second of fn() over roughly `seconds`"""
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(20):
+            fn()
+        calls += 20
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - start)
+
+
+def run(name, message, seconds):
+    json_payload = json.dumps(message).encode()
+
+    # Intern up front so sizes and timings show the steady state
+    interner = Interner()
+    compact_payload, used = encode_message(message, interner)
+    decoder = Decoder()
+    for sender_id in used:
+        decoder.decode(interner.definition(sender_id))
+
+    return {
+        "message": name,
+        "json_bytes": len(json_payload) + 1,  # newline
+        "compact_bytes": len(compact_payload) + 4,  # length prefix
+        "sender_defs_bytes": sum(len(interner.definition(i)) + 4 for i in used),
+        "json_encode_per_s": rate(lambda: json.dumps(message).encode(), seconds),
+        "compact_encode_per_s": rate(lambda: encode_message(message, interner), seconds),
+        "json_decode_per_s": rate(lambda: json.loads(json_payload), seconds),
+        "compact_decode_per_s": rate(lambda: decoder.decode(compact_payload), seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and compact encodings")
+    parser.add_argument("--senders", type=int, default=20, help="distinct chat senders")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per measurement")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [
+        run(name, message, args.seconds)
+        for name, message in build_messages(args.senders).items()
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'metric':<24}" + "".join(f"{r['message']:>14}" for r in results))
+    for column in list(results[0])[1:]:
+        row = "".join(
+            f"{r[column]:>14.0f}" if isinstance(r[column], float) else f"{r[column]:>14}"
+            for r in results
+        )
+        print(f"{column:<24}{row}")
+    print(f"{'size_ratio':<24}" + "".join(
+        f"{r['compact_bytes'] / r['json_bytes']:>14.2f}" for r in results
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Thread vs asyncio engine load benchmark
+Measures connections held, server memory per peer and chat fan-out latency.
+Usage: python3 -m bench.engines [--peers N] [--messages M] [--engines thread,asyncio]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import BenchClient, ServerProcess, load_key_pool, percentile
+
+
+async def connect_all(keys, port, concurrency):
+    """Connect and authenticate one client per key, `concurrency` at a time"""
+    clients = []
+    failures = 0
+    gate = asyncio.Semaphore(concurrency)
+    
+    async def connect(key):
+        nonlocal failures
+        async with gate:
+            client = BenchClient(key)
+            try:
+                await client.connect("127.0.0.1", port)
+                clients.append(client)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                failures += 1
+    
+    await asyncio.gather(*(connect(k) for k in keys))
+    return clients, failures
+
+
+async def measure_fanout(clients, messages, timeout=30.0):
+    """Send CHATs from the first client and time delivery to every peer"""
+    latencies = []
+    completions = []
+    pending = {}
+    
+    async def receive(client):
+        while True:
+            line = await client.readline()
+            if not line and client.reader.at_eof():
+                return
+            if '"bench-' not in line:
+                continue
+            tag = json.loads(line)["message"]
+            sent, remaining, done = pending.get(tag, (None, None, None))
+            if sent is None:
+                continue
+            latencies.append(time.perf_counter() - sent)
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+    
+    readers = [asyncio.create_task(receive(c)) for c in clients]
+    try:
+        for i in range(messages):
+            tag = f"bench-{i}"
+            done = asyncio.Event()
+            sent = time.perf_counter()
+            pending[tag] = (sent, [len(clients)], done)
+            clients[0].send(f"CHAT {tag}")
+            await asyncio.wait_for(done.wait(), timeout)
+            completions.append(time.perf_counter() - sent)
+    finally:
+        for task in readers:
+            task.cancel()
+    
+    return latencies, completions
+
+
+async def run_engine(engine, keys, messages, concurrency):
+    """Benchmark one engine and return its results"""
+    with ServerProcess("--engine", engine, "--max-peers", str(len(keys) + 10),
+                       "--no-limits") as server:
+        await asyncio.sleep(0.5)
+        base_rss = server.rss_kb()
+        
+        start = time.perf_counter()
+        clients, failures = await connect_all(keys, server.port, concurrency)
+        connect_time = time.perf_counter() - start
+        
+        # Let join announcements settle before measuring
+        await asyncio.sleep(1.0)
+        held_rss = server.rss_kb()
+        
+        latencies, completions = await measure_fanout(clients, messages)
+        
+        for client in clients:
+            await client.close()
+    
+    held = len(clients)
+    return {
+        "engine": engine,
+        "connections_held": held,
+        "connect_failures": failures,
+        "connects_per_s": held / connect_time if connect_time else 0.0,
+        "rss_base_kb": base_rss,
+        "rss_held_kb": held_rss,
+        "kb_per_peer": (held_rss - base_rss) / held if held else 0.0,
+        "fanout_p50_ms": percentile(latencies, 50) * 1000,
+        "fanout_p99_ms": percentile(latencies, 99) * 1000,
+        "fanout_complete_p50_ms": percentile(completions, 50) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare server engines under load")
+    parser.add_argument("--peers", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--engines", default="thread,asyncio")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    
+    keys = load_key_pool(args.peers)
+    results = [
+        asyncio.run(run_engine(engine, keys, args.messages, args.concurrency))
+        for engine in args.engines.split(",")
+    ]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    columns = list(results[0].keys())
+    print(f"{'metric':<24}" + "".join(f"{r['engine']:>14}" for r in results))
+    for column in columns[1:]:
+        row = "".join(
+            f"{r[column]:>14.2f}" if isinstance(r[column], float) else f"{r[column]:>14}"
+            for r in results
+        )
+        print(f"{column:<24}{row}")
+
+
+if __name__ == "__main__":
+    main()
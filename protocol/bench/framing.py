@@ -0,0 +1,97 @@
+"""
+Wire framing throughput benchmark
+Streams messages over a socketpair and parses them with the legacy
+str-buffer splitter, FrameReader in text mode and FrameReader in len mode.
+Usage: python3 -m bench.framing [--sizes 64,65536] [--megabytes 64]
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+
+from framing import FrameReader, TEXT, LENGTH, encode
+
+MODES = ("legacy", TEXT, LENGTH)
+
+
+def legacy_reader(sock):
+    """The pre-framing message loop: decode every recv and split on newlines"""
+    buffer = ""
+    while True:
+        data = sock.recv(4096)
+        if not data:
+            return
+        buffer += data.decode()
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            yield line
+
+
+def frame_reader(sock, framing):
+    """The negotiated-framing message loop; decodes each payload like the server"""
+    for payload in FrameReader(sock, framing).frames():
+        yield str(payload, "utf-8")
+
+
+def run(mode, size, count):
+    """Send `count` messages of `size` bytes and time how fast they parse"""
+    payload = b"CHAT " + b"x" * (size - 5)
+    blob = encode(payload, LENGTH if mode == LENGTH else TEXT) * count
+    receiver, sender = socket.socketpair()
+
+    def send():
+        with sender:
+            sender.sendall(blob)
+
+    writer = threading.Thread(target=send, daemon=True)
+    start = time.perf_counter()
+    writer.start()
+
+    received = 0
+    with receiver:
+        messages = legacy_reader(receiver) if mode == "legacy" else frame_reader(receiver, mode)
+        for message in messages:
+            received += 1
+    elapsed = time.perf_counter() - start
+    writer.join()
+
+    return {
+        "mode": mode,
+        "size": size,
+        "messages": received,
+        "msgs_per_s": received / elapsed,
+        "mb_per_s": received * size / elapsed / 1e6,
+        "wire_overhead_bytes": len(blob) // count - size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare text and length-prefixed framing")
+    parser.add_argument("--sizes", default="64,1024,65536", help="message sizes in bytes")
+    parser.add_argument("--megabytes", type=int, default=64, help="data streamed per run")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        count = max(1, args.megabytes * 1024 * 1024 // size)
+        for mode in args.modes.split(","):
+            results.append(run(mode, size, count))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'size':>8}{'mode':>8}{'msgs/s':>14}{'MB/s':>10}{'overhead':>10}")
+    for r in results:
+        print(
+            f"{r['size']:>8}{r['mode']:>8}{r['msgs_per_s']:>14.0f}"
+            f"{r['mb_per_s']:>10.1f}{r['wire_overhead_bytes']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Handshake throughput benchmark for the signature verification pool
+Reconnect storm: many clients handshake at once against each pool setup.
+Usage: python3 -m bench.handshake [--clients 400] [--workers 1,4,8] [--kinds inline,thread,process]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench.common import BenchClient, ServerProcess, load_key_pool
+
+
+async def storm(keys, port, concurrency):
+    """Handshake every key once; returns (ok, busy, failed, seconds)"""
+    gate = asyncio.Semaphore(concurrency)
+    counts = {"ok": 0, "busy": 0, "failed": 0}
+
+    async def one(key):
+        async with gate:
+            client = BenchClient(key)
+            try:
+                await client.connect("127.0.0.1", port)
+                counts["ok"] += 1
+            except ConnectionError as e:
+                counts["busy" if "busy" in str(e) else "failed"] += 1
+            except (OSError, asyncio.IncompleteReadError):
+                counts["failed"] += 1
+            finally:
+                if client.writer:
+                    await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(k) for k in keys))
+    return counts, time.perf_counter() - start
+
+
+def run(kind, workers, keys, engine, concurrency):
+    args = ["--engine", engine, "--no-chatlog", "--max-peers", str(len(keys) + 10),
+            "--verify-pool", kind, "--verify-workers", str(workers),
+            "--no-limits"]
+    with ServerProcess(*args) as server:
+        counts, seconds = asyncio.run(storm(keys, server.port, concurrency))
+    return {
+        "pool": kind,
+        "workers": workers if kind != "inline" else 0,
+        "handshakes_per_s": counts["ok"] / seconds,
+        **counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark handshake verification pools")
+    parser.add_argument("--clients", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--workers", default=f"1,4,{os.cpu_count() or 1}")
+    parser.add_argument("--kinds", default="inline,thread,process")
+    parser.add_argument("--engine", default="asyncio", choices=["thread", "asyncio"])
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    keys = load_key_pool(args.clients)
+    worker_counts = sorted({int(w) for w in args.workers.split(",")})
+    results = []
+    for kind in args.kinds.split(","):
+        for workers in ([1] if kind == "inline" else worker_counts):
+            results.append(run(kind, workers, keys, args.engine, args.concurrency))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.clients} clients, {args.concurrency} at a time, {args.engine} engine")
+    print(f"{'pool':<10}{'workers':>8}{'hs/s':>10}{'ok':>6}{'busy':>6}{'failed':>8}")
+    for r in results:
+        print(f"{r['pool']:<10}{r['workers']:>8}{r['handshakes_per_s']:>10.1f}"
+              f"{r['ok']:>6}{r['busy']:>6}{r['failed']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Load generator for the PURE server
+Simulates many authenticated peers spread over several generator processes
+(client-side RSA signing would otherwise be the bottleneck), each sending a
+weighted mix of CHAT/PEERS/PING at a Poisson rate. Reports connects/s,
+end-to-end chat latency (sender to every receiver), PING and PEERS round
+trips, server RSS and the server's own STATS, as text or JSON.
+Usage: python3 -m bench.load [--clients 500] [--mix CHAT=5,PEERS=5,PING=90]
+       python3 -m bench.load --output run.json --baseline previous.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import time
+from collections import deque
+
+from bench.common import BenchClient, ServerProcess, load_key_pool, tree_rss_kb
+from metrics import LatencyStats
+
+OPS = ("CHAT", "PEERS", "PING")
+TAG = '"message": "lt '  # CHATs we sent carry "lt <monotonic send time>"
+
+
+def parse_mix(spec):
+    """CHAT=5,PEERS=5,PING=90 -> ([ops], [weights])"""
+    ops, weights = [], []
+    for part in spec.split(","):
+        op, _, weight = part.partition("=")
+        op = op.strip().upper()
+        if op not in OPS:
+            raise ValueError(f"unknown operation {op!r}, expected one of {', '.join(OPS)}")
+        ops.append(op)
+        weights.append(float(weight or 1))
+    return ops, weights
+
+
+def raise_fd_limit():
+    """Thousands of sockets per generator need more than the usual 1024 fds"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Session:
+    """One simulated peer: sends the mix, times whatever comes back"""
+
+    def __init__(self, client, latency, counts):
+        self.client = client
+        self.latency = latency
+        self.counts = counts
+        self.pending = {"PING": deque(), "PEERS": deque()}  # send times, FIFO
+
+    async def drive(self, ops, weights, rate, deadline):
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            if time.monotonic() >= deadline:
+                return
+            op = random.choices(ops, weights)[0]
+            now = time.monotonic()
+            if op == "CHAT":
+                self.client.send(f"CHAT lt {now:.6f}")
+            else:
+                self.pending[op].append(now)
+                self.client.send(op)
+            self.counts["sent_" + op.lower()] += 1
+
+    async def receive(self):
+        while True:
+            line = await self.client.readline()
+            if not line:
+                return
+            now = time.monotonic()
+            if line == "PONG":
+                if self.pending["PING"]:
+                    self.latency["ping"].record(now - self.pending["PING"].popleft())
+            elif line == "PING":
+                self.client.send("PONG")
+            elif line.startswith('{"type": "PEERS"'):
+                if self.pending["PEERS"]:
+                    self.latency["peers"].record(now - self.pending["PEERS"].popleft())
+            elif line.startswith('{"type": "CHAT"'):
+                start = line.find(TAG)
+                if start < 0:
+                    continue
+                start += len(TAG)
+                self.latency["chat"].record(now - float(line[start:line.index('"', start)]))
+                self.counts["delivered"] += 1
+            elif line.startswith("ERR"):
+                self.counts["errors"] += 1
+
+
+async def connect_all(keys, host, port, concurrency, latency):
+    gate = asyncio.Semaphore(concurrency)
+    clients = []
+    failures = 0
+
+    async def one(key):
+        nonlocal failures
+        async with gate:
+            client = BenchClient(key)
+            start = time.monotonic()
+            try:
+                await client.connect(host, port)
+                latency.record(time.monotonic() - start)
+                clients.append(client)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                failures += 1
+
+    await asyncio.gather(*(one(k) for k in keys))
+    return clients, failures
+
+
+async def server_stats(client, timeout=5.0):
+    """The server's STATS reply, read off a connection that is otherwise idle"""
+    client.send("STATS")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            line = await asyncio.wait_for(client.readline(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            break
+        if line.startswith('{"type": "STATS"'):
+            return json.loads(line)
+    return None
+
+
+async def drive(keys, host, port, args, barrier, want_stats):
+    """One generator's share of the run"""
+    ops, weights = parse_mix(args.mix)
+    latency = {name: LatencyStats() for name in ("connect", "chat", "ping", "peers")}
+    counts = dict.fromkeys(
+        ["sent_" + op.lower() for op in OPS] + ["delivered", "errors"], 0
+    )
+
+    barrier.wait()
+    start = time.time()
+    clients, failures = await connect_all(keys, host, port, args.concurrency, latency["connect"])
+    connects = (len(clients), start, time.time())
+
+    barrier.wait()
+    sessions = [Session(c, latency, counts) for c in clients]
+    readers = [asyncio.create_task(s.receive()) for s in sessions]
+    deadline = time.monotonic() + args.seconds
+    await asyncio.gather(*(s.drive(ops, weights, args.rate, deadline) for s in sessions))
+    await asyncio.sleep(args.drain)  # let in-flight fan-out arrive
+    for task in readers:
+        task.cancel()
+
+    server = await server_stats(clients[0]) if want_stats and clients else None
+    barrier.wait()  # still connected while the parent samples server RSS
+    barrier.wait()
+    await asyncio.gather(*(c.close() for c in clients))
+    return {
+        "connects": connects,
+        "failures": failures,
+        "counts": counts,
+        "latency": {name: stats.state() for name, stats in latency.items()},
+        "server": server,
+    }
+
+
+def generator(key_range, host, port, args, barrier, queue, want_stats):
+    """Load-generator process entry point"""
+    raise_fd_limit()
+    keys = load_key_pool(key_range[1])[key_range[0]:key_range[1]]
+    queue.put(asyncio.run(drive(keys, host, port, args, barrier, want_stats)))
+
+
+def run(args, host, port, rss):
+    total = args.clients
+    generators = max(1, min(args.generators, total))
+    bounds = [total * g // generators for g in range(generators + 1)]
+    barrier = multiprocessing.Barrier(generators + 1)  # the parent joins every phase
+    queue = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(
+            target=generator,
+            args=((bounds[g], bounds[g + 1]), host, port, args, barrier, queue, g == 0)
+        )
+        for g in range(generators)
+    ]
+    for proc in procs:
+        proc.start()
+    for _ in range(3):  # connect, load, loaded
+        barrier.wait()
+    rss_kb = rss()
+    barrier.wait()
+    parts = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    latency = {name: LatencyStats() for name in parts[0]["latency"]}
+    for part in parts:
+        for name, state in part["latency"].items():
+            latency[name].merge(state)
+    counts = {name: sum(p["counts"][name] for p in parts) for name in parts[0]["counts"]}
+    connected = sum(p["connects"][0] for p in parts)
+    elapsed = max(p["connects"][2] for p in parts) - min(p["connects"][1] for p in parts)
+    # Every CHAT should reach every connected client, the sender included
+    expected = counts["sent_chat"] * connected
+
+    result = {
+        "clients": connected,
+        "failures": sum(p["failures"] for p in parts),
+        "connects_per_s": connected / elapsed if elapsed > 0 else 0.0,
+        "ops_per_s": sum(counts[f"sent_{op.lower()}"] for op in OPS) / args.seconds,
+        "delivered_pct": 100.0 * counts["delivered"] / expected if expected else 0.0,
+        "server_rss_mb": rss_kb / 1024 if rss_kb else None,
+        **counts,
+    }
+    for name, stats in latency.items():
+        summary = stats.stats()
+        for point in ("p50", "p99"):
+            result[f"{name}_{point}_ms"] = summary[f"{point}_ms"]
+    server = next((p["server"] for p in parts if p["server"]), None)
+    if server:
+        result["server_stats"] = server
+    return result
+
+
+def compare(result, baseline):
+    """Per-metric change against an earlier run's JSON"""
+    rows = []
+    for name, value in result.items():
+        before = baseline.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+            continue
+        change = (value - before) / before * 100 if before else 0.0
+        rows.append((name, before, value, change))
+    return rows
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Drive a PURE server with simulated peers")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--generators", type=int, default=cores, help="load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=100, help="handshakes in flight per generator")
+    parser.add_argument("--mix", default="CHAT=5,PEERS=5,PING=90", help="weighted operation mix")
+    parser.add_argument("--rate", type=float, default=1.0, help="operations per second per client")
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the load phase")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for late replies")
+    parser.add_argument("--target", metavar="HOST:PORT", help="load a running server instead of starting one")
+    parser.add_argument("--engine", default="asyncio", choices=["thread", "asyncio"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--server-arg", action="append", default=[], help="extra server.py argument (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    load_key_pool(args.clients)  # generate once, before the generators fork
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        result = run(args, host, int(port), lambda: None)
+    else:
+        server_args = ["--engine", args.engine, "--no-chatlog", "--workers", str(args.workers),
+                       "--max-peers", str(args.clients + 10), "--no-limits", *args.server_arg]
+        with ServerProcess(*server_args) as server:
+            result = run(args, "127.0.0.1", server.port, lambda: tree_rss_kb(server.proc.pid))
+    result["config"] = {
+        "clients": args.clients, "mix": args.mix, "rate": args.rate, "seconds": args.seconds,
+        "engine": args.engine, "workers": args.workers, "target": args.target,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['clients']} clients ({result['failures']} failed), mix {args.mix} "
+              f"at {args.rate:g}/s each, {args.seconds:g}s")
+        print(f"  connects/s      {result['connects_per_s']:10.1f}")
+        print(f"  ops/s           {result['ops_per_s']:10.1f}")
+        print(f"  delivered       {result['delivered_pct']:9.1f}%")
+        for name in ("connect", "chat", "ping", "peers"):
+            print(f"  {name + ' p50/p99':15} {result[name + '_p50_ms']:10.2f} / "
+                  f"{result[name + '_p99_ms']:.2f} ms")
+        if result["server_rss_mb"] is not None:
+            print(f"  server RSS      {result['server_rss_mb']:10.1f} MB")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\n{'metric':<20}{'baseline':>12}{'now':>12}{'change':>9}")
+        for name, before, now, change in compare(result, baseline):
+            print(f"{name:<20}{before:>12.2f}{now:>12.2f}{change:>+8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
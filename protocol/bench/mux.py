@@ -0,0 +1,137 @@
+"""
+Multiplexed vs separate connections benchmark
+Authenticates N identities either as N TCP connections or as streams of one
+multiplexed connection, then broadcasts chat to all of them. Reports setup
+time, server file descriptors, server CPU and bytes written per delivery,
+and how long the burst takes to reach every identity.
+Usage: python3 -m bench.mux [--identities 100] [--messages 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench.common import BenchClient, ServerProcess, load_key_pool, server_counters, server_cpu
+from pureclient import PureClient
+
+TAG = "mx "  # prefix of the chat messages being counted
+
+
+def server_fds(pid):
+    return len(os.listdir(f"/proc/{pid}/fd"))
+
+
+async def count_lines(client, received):
+    while True:
+        line = await client.readline()
+        if not line:
+            return
+        if '"message": "' + TAG in line:
+            received[0] += 1
+
+
+async def count_messages(identity, received):
+    async for message in identity:
+        if message.get("type") == "CHAT" and message["message"].startswith(TAG):
+            received[0] += 1
+
+
+async def connect(mode, keys, port):
+    """Authenticate every identity; returns (reader tasks, counters, closer)"""
+    if mode == "separate":
+        clients = [BenchClient(key) for key in keys]
+        await asyncio.gather(*(c.connect("127.0.0.1", port) for c in clients))
+        counts = [[0] for _ in clients]
+        tasks = [asyncio.create_task(count_lines(c, n)) for c, n in zip(clients, counts)]
+
+        async def close():
+            await asyncio.gather(*(c.close() for c in clients))
+        return tasks, counts, close
+
+    client = PureClient("127.0.0.1", port, key=keys[0], mux=True)
+    await client.start()
+    streams = await asyncio.gather(*(client.open_stream(key=key) for key in keys[1:]))
+    identities = [client, *streams]
+    counts = [[0] for _ in identities]
+    tasks = [asyncio.create_task(count_messages(i, n)) for i, n in zip(identities, counts)]
+    return tasks, counts, client.close
+
+
+async def run(mode, keys, sender_key, port, pid, messages, timeout):
+    start = time.perf_counter()
+    tasks, counts, close = await connect(mode, keys, port)
+    setup = time.perf_counter() - start
+
+    sender = BenchClient(sender_key)
+    await sender.connect("127.0.0.1", port)
+    await asyncio.sleep(0.5)  # join announcements settle
+    before = await server_counters(sender)
+    cpu = server_cpu(pid)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        sender.send(f"CHAT {TAG}{i}")
+    expected = messages * len(keys)
+    deadline = start + timeout
+    while sum(n[0] for n in counts) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+
+    cpu = server_cpu(pid) - cpu
+    after = await server_counters(sender)
+    fds = server_fds(pid)
+    await close()
+    await sender.close()
+    for task in tasks:
+        task.cancel()
+
+    received = sum(n[0] for n in counts)
+    deliveries = after["deliveries"] - before["deliveries"]
+    return {
+        "mode": mode,
+        "identities": len(keys),
+        "setup_s": setup,
+        "server_fds": fds,
+        "delivered_pct": 100.0 * received / expected,
+        "fanout_s": elapsed,
+        "server_cpu_ms": cpu * 1000,
+        "bytes_per_delivery": (after["bytes_out"] - before["bytes_out"]) / deliveries if deliveries else 0.0,
+        "merged_deliveries": after.get("merged_deliveries", 0) - before.get("merged_deliveries", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare multiplexed and separate connections")
+    parser.add_argument("--identities", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=200, help="chat messages broadcast")
+    parser.add_argument("--engine", default="asyncio", choices=["thread", "asyncio"])
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for delivery")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    keys = load_key_pool(args.identities + 1)
+    results = []
+    for mode in ("separate", "mux"):
+        server_args = ["--engine", args.engine, "--no-chatlog", "--no-limits",
+                       "--max-peers", str(args.identities + 10),
+                       "--max-streams", str(args.identities),
+                       "--queue-limit", str(args.messages + 64)]
+        with ServerProcess(*server_args) as server:
+            results.append(asyncio.run(run(
+                mode, keys[:-1], keys[-1], server.port, server.proc.pid,
+                args.messages, args.timeout
+            )))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.identities} identities, {args.messages} messages, {args.engine} engine")
+    print(f"{'metric':<20}" + "".join(f"{r['mode']:>12}" for r in results))
+    for column in list(results[0])[2:]:
+        print(f"{column:<20}" + "".join(f"{r[column]:>12.2f}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
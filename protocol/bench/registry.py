@@ -0,0 +1,102 @@
+"""
+Peer registry micro-benchmark
+Compares the dict-of-dicts registry with PeerRegistry for simulated peers.
+Usage: python3 -m bench.registry [--peers 10000]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from registry import Peer, PeerRegistry
+
+ROLES = ["INITIATE"] * 97 + ["ADEPT"] * 2 + ["OP"]
+
+
+def timed(fn, repeat=1):
+    """Average seconds per call of fn()"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_dicts(pubkeys, roles, conns, now):
+    """The original layout: peers dict plus active_connections"""
+    peers = {}
+    active = {}
+    results = {}
+
+    def register():
+        for pubkey, role, conn in zip(pubkeys, roles, conns):
+            peers[pubkey] = {"ip": "127.0.0.1", "port": 0, "role": role,
+                             "last_seen": now, "conn": conn, "challenge_passed": True}
+            active[conn] = pubkey
+
+    results["register_all_ms"] = timed(register) * 1000
+    sample = random.sample(conns, 1000)
+    results["lookup_by_conn_us"] = timed(
+        lambda: [peers[active[c]] for c in sample]) / len(sample) * 1e6
+    results["list_all_ms"] = timed(lambda: [
+        {"pubkey": pk[:32], "role": p["role"], "last_seen": p["last_seen"]}
+        for pk, p in peers.items() if p.get("challenge_passed")
+    ], 20) * 1000
+    results["list_role_ms"] = timed(lambda: [
+        {"pubkey": pk[:32], "role": p["role"], "last_seen": p["last_seen"]}
+        for pk, p in peers.items() if p.get("challenge_passed") and p["role"] == "OP"
+    ], 20) * 1000
+    return results
+
+
+def bench_registry(pubkeys, roles, conns, now):
+    """PeerRegistry with its connection and role indexes"""
+    registry = PeerRegistry()
+    results = {}
+
+    def register():
+        for pubkey, role, conn in zip(pubkeys, roles, conns):
+            registry.add(Peer(pubkey, "127.0.0.1", 0, role, now, True, conn))
+
+    results["register_all_ms"] = timed(register) * 1000
+    sample = random.sample(conns, 1000)
+    results["lookup_by_conn_us"] = timed(
+        lambda: [registry.by_connection(c) for c in sample]) / len(sample) * 1e6
+    results["list_all_ms"] = timed(lambda: [
+        p.summary() for p in registry.peers() if p.challenge_passed
+    ], 20) * 1000
+    results["list_role_ms"] = timed(lambda: [
+        p.summary() for p in registry.with_role("OP") if p.challenge_passed
+    ], 20) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark peer registry layouts")
+    parser.add_argument("--peers", type=int, default=10000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    random.seed(1)
+    pubkeys = [f"-----BEGIN PUBLIC KEY-----\n{i:064x}" for i in range(args.peers)]
+    roles = [random.choice(ROLES) for _ in pubkeys]
+    conns = [object() for _ in pubkeys]
+    now = time.time()
+
+    results = {
+        "dicts": bench_dicts(pubkeys, roles, conns, now),
+        "registry": bench_registry(pubkeys, roles, conns, now),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.peers} peers")
+    print(f"{'operation':<20}{'dicts':>12}{'registry':>12}")
+    for name in results["dicts"]:
+        print(f"{name:<20}{results['dicts'][name]:>12.3f}{results['registry'][name]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
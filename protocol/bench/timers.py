@@ -0,0 +1,78 @@
+"""
+Timer wheel benchmark
+Schedules N heartbeat-style timers spread over the wheel, then measures
+schedule/cancel rates and the cost of one tick as N grows. Ticks are driven
+directly, without the wheel's thread, so only the data structure is timed.
+Usage: python3 -m bench.timers [--counts 1000,10000,100000]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from timerwheel import TimerWheel
+
+
+def noop():
+    pass
+
+
+def run(count, horizon):
+    wheel = TimerWheel()
+    random.seed(1)
+    delays = [random.uniform(0.1, horizon) for _ in range(count)]
+
+    start = time.perf_counter()
+    timers = [wheel.schedule(delay, noop) for delay in delays]
+    schedule_s = time.perf_counter() - start
+
+    # One full revolution: every timer fires exactly once
+    ticks = len(wheel.slots)
+    fired = 0
+    worst = 0.0
+    start = time.perf_counter()
+    for _ in range(ticks):
+        tick_start = time.perf_counter()
+        fired += len(wheel.tick())
+        worst = max(worst, time.perf_counter() - tick_start)
+    tick_s = time.perf_counter() - start
+
+    timers = [wheel.schedule(delay, noop) for delay in delays]
+    start = time.perf_counter()
+    for timer in timers:
+        wheel.cancel(timer)
+    cancel_s = time.perf_counter() - start
+
+    return {
+        "timers": count,
+        "fired": fired,
+        "schedule_per_s": count / schedule_s,
+        "cancel_per_s": count / cancel_s,
+        "tick_mean_us": tick_s / ticks * 1e6,
+        "tick_per_timer_ns": tick_s / max(fired, 1) * 1e9,
+        "tick_worst_us": worst * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the timer wheel")
+    parser.add_argument("--counts", default="1000,10000,100000")
+    parser.add_argument("--horizon", type=float, default=90.0, help="longest delay in seconds")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [run(int(n), args.horizon) for n in args.counts.split(",")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'timers':>8}{'sched/s':>12}{'cancel/s':>12}{'tick us':>10}{'ns/timer':>10}{'worst us':>10}")
+    for r in results:
+        print(f"{r['timers']:>8}{r['schedule_per_s']:>12.0f}{r['cancel_per_s']:>12.0f}"
+              f"{r['tick_mean_us']:>10.1f}{r['tick_per_timer_ns']:>10.0f}{r['tick_worst_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
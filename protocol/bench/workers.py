@@ -0,0 +1,199 @@
+"""
+Multi-process scaling benchmark
+Runs the server with 1..N workers and drives it from several load-generator
+processes (client-side RSA signing would otherwise be the bottleneck).
+Per worker count it reports handshakes/s, HISTORY requests/s and chat
+deliveries/s through the worker bus, plus the RSS of the whole process tree.
+Usage: python3 -m bench.workers [--workers 1,2,4] [--clients 200] [--generators 4]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+from bench.common import BenchClient, ServerProcess, load_key_pool, tree_rss_kb
+
+REQUEST = "HISTORY 0 50"  # served from memory, but JSON-encoded on every request
+
+
+async def drain(clients, idle=0.2):
+    """Discard whatever the server pushed, e.g. join announcements"""
+    async def one(client):
+        while True:
+            try:
+                await asyncio.wait_for(client.readline(), idle)
+            except asyncio.TimeoutError:
+                return
+    await asyncio.gather(*(one(c) for c in clients))
+
+
+async def connect_all(keys, port, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+    clients = []
+
+    async def one(key):
+        async with gate:
+            client = BenchClient(key)
+            try:
+                await client.connect("127.0.0.1", port)
+                clients.append(client)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                pass
+
+    await asyncio.gather(*(one(k) for k in keys))
+    return clients
+
+
+async def request_loop(client, deadline, window):
+    """Keep `window` requests in flight until the deadline; returns replies read"""
+    replies = 0
+    for _ in range(window):
+        client.send(REQUEST)
+    outstanding = window
+    while outstanding:
+        line = await client.readline()
+        if not line:
+            break
+        if not line.startswith('{"type": "HISTORY"'):
+            continue
+        replies += 1
+        outstanding -= 1
+        if time.time() < deadline:
+            client.send(REQUEST)
+            outstanding += 1
+    return replies
+
+
+async def receive_chats(client, expected, timeout):
+    """Read until `expected` CHAT messages arrived; returns how many did"""
+    received = 0
+    deadline = time.time() + timeout
+    while received < expected:
+        try:
+            line = await asyncio.wait_for(client.readline(), max(0.01, deadline - time.time()))
+        except asyncio.TimeoutError:
+            break
+        if line.startswith('{"type": "CHAT"'):
+            received += 1
+    return received
+
+
+async def drive(keys, port, args, total_clients, barrier):
+    """One generator's share of every phase; returns (count, start, end) per phase"""
+    results = {}
+
+    barrier.wait()
+    start = time.time()
+    clients = await connect_all(keys, port, args.concurrency)
+    results["handshakes"] = (len(clients), start, time.time())
+
+    barrier.wait()
+    await drain(clients)
+    barrier.wait()
+    start = time.time()
+    counts = await asyncio.gather(
+        *(request_loop(c, start + args.seconds, args.window) for c in clients)
+    )
+    results["requests"] = (sum(counts), start, time.time())
+
+    barrier.wait()
+    start = time.time()
+    for client in clients:
+        for i in range(args.chats):
+            client.send(f"CHAT bench {i}")
+    expected = total_clients * args.chats
+    counts = await asyncio.gather(
+        *(receive_chats(c, expected, args.timeout) for c in clients)
+    )
+    results["deliveries"] = (sum(counts), start, time.time())
+
+    await asyncio.gather(*(c.close() for c in clients))
+    return results
+
+
+def generator(key_range, port, args, total_clients, barrier, queue):
+    """Load-generator process entry point"""
+    keys = load_key_pool(key_range[1])[key_range[0]:key_range[1]]
+    queue.put(asyncio.run(drive(keys, port, args, total_clients, barrier)))
+
+
+def rate(parts):
+    """Aggregate (count, start, end) tuples from every generator into a rate"""
+    count = sum(p[0] for p in parts)
+    elapsed = max(p[2] for p in parts) - min(p[1] for p in parts)
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def run(workers, args):
+    total = args.clients
+    generators = min(args.generators, total)
+    bounds = [total * g // generators for g in range(generators + 1)]
+    server_args = ["--engine", args.engine, "--no-chatlog", "--workers", str(workers),
+                   "--max-peers", str(total + 10), "--ticket-lifetime", "0",
+                   "--no-limits"]
+
+    with ServerProcess(*server_args) as server:
+        barrier = multiprocessing.Barrier(generators)
+        queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(
+                target=generator,
+                args=((bounds[g], bounds[g + 1]), server.port, args, total, barrier, queue)
+            )
+            for g in range(generators)
+        ]
+        for proc in procs:
+            proc.start()
+        parts = [queue.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+        rss = tree_rss_kb(server.proc.pid)
+
+    expected = sum(p["handshakes"][0] for p in parts) ** 2 * args.chats
+    delivered = sum(p["deliveries"][0] for p in parts)
+    return {
+        "workers": workers,
+        "clients": sum(p["handshakes"][0] for p in parts),
+        "handshakes_per_s": rate([p["handshakes"] for p in parts]),
+        "requests_per_s": rate([p["requests"] for p in parts]),
+        "deliveries_per_s": rate([p["deliveries"] for p in parts]),
+        "delivered_pct": 100.0 * delivered / expected if expected else 0.0,
+        "rss_mb": rss / 1024,
+    }
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark --workers scaling")
+    parser.add_argument("--workers", default=",".join(str(n) for n in range(1, max(2, cores) + 1)))
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--generators", type=int, default=cores, help="load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=50, help="handshakes in flight per generator")
+    parser.add_argument("--window", type=int, default=4, help="requests in flight per client")
+    parser.add_argument("--seconds", type=float, default=5.0, help="request phase length")
+    parser.add_argument("--chats", type=int, default=5, help="CHATs sent per client")
+    parser.add_argument("--timeout", type=float, default=30.0, help="longest wait for fan-out")
+    parser.add_argument("--engine", default="asyncio", choices=["thread", "asyncio"])
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    load_key_pool(args.clients)  # generate once, before the generators fork
+    results = [run(int(n), args) for n in args.workers.split(",")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.clients} clients from {args.generators} generators, {args.engine} engine, "
+          f"{cores} cores")
+    print(f"{'workers':>8}{'hs/s':>10}{'req/s':>10}{'deliv/s':>11}{'deliv%':>8}{'rss MB':>9}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['handshakes_per_s']:>10.1f}{r['requests_per_s']:>10.0f}"
+              f"{r['deliveries_per_s']:>11.0f}{r['delivered_pct']:>8.1f}{r['rss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+PURE Protocol worker bus
+- Links the worker processes of one node through the master process
+- One Unix socketpair per worker, created before the fork
+- Frames are length-prefixed: one op byte, then a JSON body
+- The master numbers every CHAT, so all workers store the same seq
+- Peer joins and leaves are relayed so PEERS lists the whole node
+- The master keeps the mailboxes of peers that went away, since they may
+  come back on any worker, and sends their mail to the worker they join
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+
+from framing import FrameReader, HEADER, LENGTH
+from registry import Peer
+
+CHAT = 1  # worker -> master: message to number; master -> workers: numbered message
+JOIN = 2  # a peer authenticated on a worker
+LEAVE = 3  # that peer's connection went away
+DOWN = 4  # master -> workers: a worker exited, forget all of its peers
+MAIL = 5  # master -> one worker: answers a JOIN with what was held for that peer, or null
+
+log = logging.getLogger("pure.bus")
+
+
+def encode(op, body):
+    """Wire bytes for one bus frame; body is already-encoded JSON"""
+    return HEADER.pack(len(body) + 1) + bytes((op,)) + body
+
+
+class Channel:
+    """One end of a worker's socketpair; send() may be called from any thread"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.frames_sent = 0
+        self.frames_received = 0
+
+    def send(self, op, body):
+        data = encode(op, body)
+        with self.lock:
+            self.sock.sendall(data)
+            self.frames_sent += 1
+
+    def receive(self):
+        """Yield (op, body) until the other end closes"""
+        try:
+            for payload in FrameReader(self.sock, LENGTH).frames():
+                self.frames_received += 1
+                yield payload[0], bytes(payload[1:])
+        except OSError:
+            return
+
+    def close(self):
+        # shutdown() wakes a reader blocked in recv; close() alone may not
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def pair():
+    """(master end, worker end) for a worker about to be forked"""
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+
+class BusHub:
+    """Master side: sequences chat and relays registry changes between workers
+
+    `sequence(message)` numbers and logs a chat message and returns its
+    encoded form; `registry` is the master's PeerRegistry, whose remote
+    entries are keyed by (worker, conn) like on the workers; `changed()` is
+    called after every registry update. With mailboxes, `away(pubkey)` is
+    called when a peer's last connection goes and `back(pubkey, send)` when
+    it joins again, passing each encoded MAILBOX message to send() and
+    returning whether there was any.
+    """
+
+    def __init__(self, sequence, registry, changed, away=None, back=None):
+        self.sequence = sequence
+        self.registry = registry
+        self.changed = changed
+        self.away = away
+        self.back = back
+        self.channels = {}  # worker id -> Channel
+        self.lock = threading.Lock()  # one relay at a time keeps seq order per worker
+        self.closed = False
+        self.chats = 0
+        self.joins = 0
+        self.leaves = 0
+
+    def add_worker(self, worker, sock):
+        channel = self.channels[worker] = Channel(sock)
+        thread = threading.Thread(target=self.run, args=(worker, channel), daemon=True)
+        thread.start()
+
+    def run(self, worker, channel):
+        """Reader thread for one worker"""
+        for op, body in channel.receive():
+            try:
+                self.handle(worker, op, body)
+            except (ValueError, KeyError) as e:
+                log.warning("Bad bus frame from worker %d: %s", worker, e)
+        if not self.closed:
+            self.worker_down(worker)
+
+    def handle(self, worker, op, body):
+        with self.lock:
+            if self.closed:
+                return
+            if op == CHAT:
+                self.chats += 1
+                self.relay(CHAT, self.sequence(json.loads(body)))
+                return
+
+            data = json.loads(body)
+            data["worker"] = worker
+            conn = (worker, data["conn"])
+            if op == JOIN:
+                self.joins += 1
+                self.registry.add(peer_from(data, conn))
+                self.deliver_mail(worker, data)
+            elif op == LEAVE:
+                self.leaves += 1
+                self.left(self.registry.remove_conn(conn))
+            else:
+                return
+            self.relay(op, json.dumps(data).encode(), skip=worker)
+        self.changed()
+
+    def worker_down(self, worker):
+        """A worker exited: drop its peers everywhere"""
+        with self.lock:
+            self.channels.pop(worker).close()
+            for peer in self.registry.connected():
+                if peer.conn[0] == worker:
+                    self.left(self.registry.remove_conn(peer.conn))
+            self.relay(DOWN, json.dumps({"worker": worker}).encode())
+        self.changed()
+
+    def left(self, peer):
+        """A peer's last connection went; hold its mail from now on"""
+        if peer and self.away:
+            self.away(peer.pubkey)
+
+    def deliver_mail(self, worker, data):
+        """Answer a JOIN with the peer's mail, a frame at a time, or with null;
+        the worker greets the peer either way
+        """
+        if not self.back:
+            return
+        channel = self.channels.get(worker)
+        if channel is None:
+            return
+
+        def send(mail):
+            channel.send(MAIL, b'{"conn": %d, "mail": %s}' % (data["conn"], mail))
+            return True
+
+        try:
+            if not self.back(data["pubkey"], send):
+                send(b"null")
+        except OSError:
+            pass  # its reader thread notices and calls worker_down
+
+    def relay(self, op, body, skip=None):
+        for worker, channel in list(self.channels.items()):
+            if worker == skip:
+                continue
+            try:
+                channel.send(op, body)
+            except OSError:
+                pass  # its reader thread notices and calls worker_down
+
+    def stop(self):
+        """Stop relaying; the registry keeps its peers for a final write"""
+        with self.lock:
+            self.closed = True
+
+    def close(self):
+        self.stop()
+        for channel in list(self.channels.values()):
+            channel.close()
+
+    def stats(self):
+        return {
+            "workers": len(self.channels),
+            "chats": self.chats,
+            "joins": self.joins,
+            "leaves": self.leaves,
+            "connected": len(self.registry.connected()),
+        }
+
+
+class WorkerBus:
+    """Worker side: publishes local events and applies everything relayed back"""
+
+    def __init__(self, sock, worker):
+        self.channel = Channel(sock)
+        self.worker = worker
+
+    def publish(self, op, data):
+        """Send a dict to the master; CHAT comes back numbered to every worker"""
+        try:
+            self.channel.send(op, json.dumps(data).encode())
+            return True
+        except OSError:
+            return False  # master gone; the reader thread is already stopping us
+
+    def start(self, handler):
+        """Call handler(op, body) for every relayed frame, on a reader thread"""
+        thread = threading.Thread(target=self.run, args=(handler,), daemon=True)
+        thread.start()
+
+    def run(self, handler):
+        for op, body in self.channel.receive():
+            try:
+                handler(op, body)
+            except Exception as e:
+                log.warning("Worker %d: bad bus frame: %s", self.worker, e)
+        # Master is gone; a worker on its own would split the node
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def peer_from(data, conn):
+    """Peer record for a JOIN relayed over the bus"""
+    return Peer(
+        data["pubkey"], data["ip"], data["port"], data["role"], data["last_seen"],
+        challenge_passed=True, conn=conn
+    )
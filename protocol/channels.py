@@ -0,0 +1,131 @@
+"""
+PURE Protocol channels
+- JOIN/LEAVE subscribe a connection to a named channel
+- Channel -> members index, so a message costs one send per member, not per peer
+- Every named channel keeps its own history ring and cached HISTORY reply
+- The default channel is the old global chat; every peer starts in it
+"""
+
+import re
+import threading
+
+from frames import CachedFrame
+from history import ChatRing
+
+DEFAULT_CHANNEL = "#general"
+CHANNEL_NAME = re.compile(r"#[A-Za-z0-9_-]{1,32}")
+CHANNEL_HISTORY = 200  # messages kept per named channel
+MAX_CHANNELS = 1024  # channels a node keeps, with their history
+MAX_JOINED = 32  # channels one connection may subscribe to
+
+
+class ChannelError(ValueError):
+    """JOIN/LEAVE/CHAT refused; the message is sent as ERR"""
+
+
+def valid_name(name):
+    return CHANNEL_NAME.fullmatch(name) is not None
+
+
+class Channel:
+    """One channel's members and, for named channels, its recent history"""
+
+    def __init__(self, name, capacity, welcome_history):
+        self.name = name
+        self.members = {}  # conn -> Peer
+        self.ring = ChatRing(capacity) if capacity else None
+        self.welcome_history = welcome_history
+        self.history = CachedFrame(self.build_history)
+
+    def build_history(self):
+        """HISTORY reply sent right after JOIN"""
+        return {
+            "type": "HISTORY",
+            "channel": self.name,
+            "messages": self.ring.latest(self.welcome_history),
+            "last_seq": self.ring.last_seq
+        }
+
+    def page(self, since_seq, limit):
+        """HISTORY reply with the messages after since_seq"""
+        return {
+            "type": "HISTORY",
+            "channel": self.name,
+            "messages": self.ring.since(since_seq, limit),
+            "first_seq": self.ring.first_seq,
+            "last_seq": self.ring.last_seq
+        }
+
+    def snapshot(self):
+        """Members to fan a message out to"""
+        return list(self.members.values())
+
+
+class ChannelIndex:
+    """Channels by name; each peer also records the channels it joined"""
+
+    def __init__(self, capacity=CHANNEL_HISTORY, welcome_history=10,
+                 max_channels=MAX_CHANNELS, max_joined=MAX_JOINED):
+        self.capacity = capacity
+        self.welcome_history = welcome_history
+        self.max_channels = max_channels
+        self.max_joined = max_joined
+        self.lock = threading.RLock()
+        # The default channel's history is the node's main ring and chat log
+        self.default = Channel(DEFAULT_CHANNEL, 0, welcome_history)
+        self.channels = {DEFAULT_CHANNEL: self.default}
+
+    def __len__(self):
+        return len(self.channels)
+
+    def get(self, name):
+        return self.channels.get(name)
+
+    def open(self, name):
+        """Channel by name, created on first use"""
+        channel = self.channels.get(name)
+        if channel is None:
+            with self.lock:
+                channel = self.channels.get(name)
+                if channel is None:
+                    if not valid_name(name):
+                        raise ChannelError(f"invalid channel name {name!r}")
+                    if len(self.channels) >= self.max_channels:
+                        raise ChannelError("too many channels")
+                    channel = Channel(name, self.capacity, self.welcome_history)
+                    self.channels[name] = channel
+        return channel
+
+    def join(self, name, peer):
+        """Subscribe a connection; returns the channel, or None if already a member"""
+        with self.lock:
+            if name in peer.channels:
+                return None
+            if len(peer.channels) >= self.max_joined:
+                raise ChannelError(f"joined too many channels (max {self.max_joined})")
+            channel = self.open(name)
+            channel.members[peer.conn] = peer
+            peer.channels.add(name)
+            return channel
+
+    def leave(self, name, peer):
+        """Unsubscribe a connection; False if it was not a member"""
+        with self.lock:
+            if name not in peer.channels:
+                return False
+            peer.channels.discard(name)
+            self.channels[name].members.pop(peer.conn, None)
+            return True
+
+    def leave_all(self, peer):
+        """Drop a closing connection from every channel it joined"""
+        with self.lock:
+            for name in peer.channels:
+                self.channels[name].members.pop(peer.conn, None)
+            peer.channels.clear()
+
+    def stats(self):
+        return {
+            "channels": len(self.channels),
+            "subscriptions": sum(len(c.members) for c in list(self.channels.values())),
+        }
@@ -0,0 +1,324 @@
+"""
+PURE Protocol durable chat log
+- Segmented, append-only binary log of chat messages keyed by seq
+- Sparse per-segment offset index for direct seeks
+- Group-commit fsync from a background flusher thread
+- Replay and paging read memory-mapped segments without parsing whole files
+- Read-only instances let other processes page through a log being written
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from metrics import LatencyStats
+
+HEADER = struct.Struct(">IQ")  # payload length, seq
+INDEX_ENTRY = struct.Struct(">QQ")  # seq, byte offset of its record
+
+SEGMENT_BYTES = 16 * 1024 * 1024  # roll to a new segment past this size
+INDEX_INTERVAL = 64  # index every Nth record; lookups scan at most N records
+COMMIT_INTERVAL = 0.05  # seconds between group commits
+COMMIT_BATCH = 256  # records that trigger an early commit
+
+
+class Segment:
+    """One log file plus its sparse index, named after its first seq"""
+
+    def __init__(self, directory, base_seq):
+        self.base_seq = base_seq
+        name = f"{base_seq:020d}"
+        self.log_path = os.path.join(directory, name + ".log")
+        self.idx_path = os.path.join(directory, name + ".idx")
+        self.index_seqs = array("Q")
+        self.index_offsets = array("Q")
+        self.size = 0
+        self.count = 0
+        self.last_seq = base_seq - 1
+        self.log_file = None
+        self.idx_file = None
+        self.map = None
+
+    def load_index(self):
+        """Read the sparse index and the current file size"""
+        self.size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            for offset in range(0, usable, INDEX_ENTRY.size):
+                seq, position = INDEX_ENTRY.unpack_from(data, offset)
+                # The log may have lost a tail the index still points at
+                if position >= self.size:
+                    break
+                self.index_seqs.append(seq)
+                self.index_offsets.append(position)
+
+    def recover(self):
+        """Find the last complete record and cut off any torn write after it"""
+        offset = self.index_offsets[-1] if self.index_offsets else 0
+        count = (len(self.index_seqs) - 1) * INDEX_INTERVAL if self.index_seqs else 0
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        position = 0
+        while position + HEADER.size <= len(data):
+            length, seq = HEADER.unpack_from(data, position)
+            if position + HEADER.size + length > len(data):
+                break
+            self.last_seq = seq
+            count += 1
+            position += HEADER.size + length
+
+        self.count = count
+        if offset + position < self.size:
+            with open(self.log_path, "r+b") as f:
+                f.truncate(offset + position)
+            self.size = offset + position
+        self.rewrite_index()
+
+    def rewrite_index(self):
+        """Persist the in-memory index, dropping entries lost in recovery"""
+        with open(self.idx_path, "wb") as f:
+            for seq, position in zip(self.index_seqs, self.index_offsets):
+                f.write(INDEX_ENTRY.pack(seq, position))
+
+    def open_for_append(self):
+        self.log_file = open(self.log_path, "ab")
+        self.idx_file = open(self.idx_path, "ab")
+
+    def append(self, seq, payload):
+        """Buffer one record; the caller holds the log lock"""
+        if self.count % INDEX_INTERVAL == 0:
+            self.idx_file.write(INDEX_ENTRY.pack(seq, self.size))
+            self.index_seqs.append(seq)
+            self.index_offsets.append(self.size)
+        self.log_file.write(HEADER.pack(len(payload), seq))
+        self.log_file.write(payload)
+        self.size += HEADER.size + len(payload)
+        self.count += 1
+        self.last_seq = seq
+
+    def flush(self):
+        if self.log_file:
+            self.log_file.flush()
+            self.idx_file.flush()
+
+    def fsync(self):
+        os.fsync(self.log_file.fileno())
+        os.fsync(self.idx_file.fileno())
+
+    def close(self):
+        if self.log_file:
+            self.flush()
+            self.fsync()
+            self.log_file.close()
+            self.idx_file.close()
+            self.log_file = self.idx_file = None
+
+    def view(self, size):
+        """First `size` bytes, memory-mapped; remapped if the segment has grown"""
+        if size == 0:
+            return memoryview(b"")
+        current = self.map
+        if current is None or len(current) < size:
+            # Older maps stay alive for as long as slices of them are in use
+            with open(self.log_path, "rb") as f:
+                current = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self.map = current
+        return memoryview(current)[:size]
+
+    def seek(self, seq):
+        """Byte offset at or before the record for seq"""
+        slot = bisect_right(self.index_seqs, seq) - 1
+        return self.index_offsets[slot] if slot >= 0 else 0
+
+
+class ChatLog:
+    """Append-only chat log spread over fixed-size segments"""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES,
+                 commit_interval=COMMIT_INTERVAL, commit_batch=COMMIT_BATCH, readonly=False):
+        self.directory = directory
+        self.readonly = readonly
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self.lock = threading.Condition()
+        self.pending = 0
+        self.closed = False
+        self.appends = 0
+        self.commits = 0
+        self.commit_latency = LatencyStats()  # fsync time per group commit
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        self.load_segments()
+
+        if readonly:
+            if not self.segments:
+                self.segments.append(Segment(directory, 1))
+        elif self.segments:
+            self.segments[-1].recover()
+            # Earlier segments end right before the next one starts
+            for segment, following in zip(self.segments, self.segments[1:]):
+                segment.last_seq = following.base_seq - 1
+        else:
+            self.segments.append(Segment(directory, 1))
+        if not readonly:
+            self.segments[-1].open_for_append()
+
+        # Started by the first append, so a process may fork after opening the log
+        self.flusher = None
+
+    def load_segments(self):
+        """Pick up segment files not seen yet, e.g. ones another process rolled"""
+        known = {segment.base_seq for segment in self.segments}
+        bases = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith(".log") and name[:-4].isdigit()
+        )
+        for base in bases:
+            if base not in known:
+                segment = Segment(self.directory, base)
+                segment.load_index()
+                self.segments.append(segment)
+        self.segments.sort(key=lambda segment: segment.base_seq)
+
+    def refresh(self):
+        """Read-only: catch up with what the writing process has flushed"""
+        self.load_segments()
+        for segment in self.segments:
+            if os.path.exists(segment.log_path) and \
+                    os.path.getsize(segment.log_path) != segment.size:
+                segment.index_seqs = array("Q")
+                segment.index_offsets = array("Q")
+                segment.load_index()
+
+    @property
+    def last_seq(self):
+        """Newest seq written, or 0 for an empty log"""
+        return self.segments[-1].last_seq
+
+    @property
+    def first_seq(self):
+        return self.segments[0].base_seq
+
+    def append(self, seq, payload):
+        """Append one encoded message; durable after the next group commit"""
+        if self.readonly:
+            raise ValueError("chat log opened read-only")
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self.run, daemon=True)
+            self.flusher.start()
+        with self.lock:
+            segment = self.segments[-1]
+            if segment.size >= self.segment_bytes:
+                segment = self.roll(seq)
+            segment.append(seq, payload)
+            self.appends += 1
+            self.pending += 1
+            if self.pending >= self.commit_batch:
+                self.lock.notify()
+
+    def roll(self, seq):
+        """Seal the active segment and start a new one at seq"""
+        self.segments[-1].close()
+        segment = Segment(self.directory, seq)
+        segment.open_for_append()
+        self.segments.append(segment)
+        return segment
+
+    def run(self):
+        """Flusher thread: fsync batches of appends together"""
+        while True:
+            with self.lock:
+                self.lock.wait(self.commit_interval)
+                if self.closed:
+                    return
+                if not self.pending:
+                    continue
+                segment = self.segments[-1]
+                segment.flush()
+                self.pending = 0
+            # fsync outside the lock so appends keep flowing meanwhile
+            start = time.perf_counter()
+            try:
+                segment.fsync()
+                self.commits += 1
+                self.commit_latency.record(time.perf_counter() - start)
+            except (OSError, ValueError, AttributeError):
+                # The segment was sealed (and synced) by a roll meanwhile
+                pass
+
+    def sync(self):
+        """Flush and fsync everything appended so far"""
+        if self.readonly:
+            return
+        with self.lock:
+            segment = self.segments[-1]
+            segment.flush()
+            segment.fsync()
+            self.pending = 0
+            self.commits += 1
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if not self.readonly:
+                self.segments[-1].close()
+            self.lock.notify()
+
+    def read_raw(self, since_seq, limit):
+        """Encoded payloads of up to `limit` records after since_seq
+
+        Returns memoryview slices of the mapped segments, so callers can
+        splice them into a reply without decoding anything.
+        """
+        start = since_seq + 1
+        with self.lock:
+            if self.readonly:
+                self.refresh()
+            else:
+                self.segments[-1].flush()
+            segments = [(segment, segment.size) for segment in self.segments]
+
+        payloads = []
+        slot = max(0, bisect_right([s.base_seq for s, _ in segments], start) - 1)
+        for segment, size in segments[slot:]:
+            if len(payloads) >= limit:
+                break
+            view = segment.view(size)
+            position = segment.seek(start)
+            end = len(view)
+            while position + HEADER.size <= end and len(payloads) < limit:
+                length, seq = HEADER.unpack_from(view, position)
+                position += HEADER.size
+                if position + length > end:
+                    break  # record still being written by another process
+                if seq >= start:
+                    payloads.append(view[position:position + length])
+                position += length
+        return payloads
+
+    def tail(self, count):
+        """Decode the newest `count` messages, oldest first"""
+        return [
+            json.loads(bytes(payload))
+            for payload in self.read_raw(self.last_seq - count, count)
+        ]
+
+    def stats(self):
+        return {
+            "segments": len(self.segments),
+            "last_seq": self.last_seq,
+            "appends": self.appends,
+            "commits": self.commits,
+            "records_per_commit": self.appends / self.commits if self.commits else 0.0,
+        }
@@ -2,48 +2,62 @@
 """
 PURE protocol client v0.3 - FIXED VERSION
 Now includes proper RSA authentication
-Usage: python3 client.py <host> <port>
+Interactive REPL; programs should use the asyncio PureClient in pureclient.py
+Usage: python3 client.py <host> <port> [--framing text|len] [--encoding json|compact] [--compress]
 """
 import socket
 import sys
 import os
 import json
 import threading
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.backends import default_backend
+import time
+
+from compact import Decoder, JSON, COMPACT, ENCODINGS, is_packed
+from compress import Decompressor, COMPRESS, ZLIB
+from framing import FrameReader, TEXT, LENGTH, FRAMINGS, encode
+from pureclient import load_private_key, sign
 
 KEY_DIR = os.path.expanduser("~/.pure/keys")
 PRIVATE_KEY_PATH = os.path.join(KEY_DIR, "node_private.pem")
 PUBLIC_KEY_PATH = os.path.join(KEY_DIR, "node_public.pem")
 IDENTITY_PATH = os.path.expanduser("~/.pure/identity.json")
+TICKETS_PATH = os.path.expanduser("~/.pure/tickets.json")
+PEM_END = "-----END PUBLIC KEY-----"
+
+private_key = None  # loaded on the first handshake
+decompressor = None  # set while the server compresses what it sends us
+
+def read_welcome(reader, first_line):
+    """Finish reading WELCOME and switch to the framing it acknowledged"""
+    global decompressor
+    lines = [first_line]
+    while PEM_END not in lines[-1]:
+        line = reader.readline()
+        if line is None:
+            break
+        lines.append(line)
+    
+    # Accepted options follow the server's key on the last line
+    options = lines[-1].split(PEM_END, 1)[-1].split()
+    reader.framing = LENGTH if f"FRAMING={LENGTH}" in options else TEXT
+    decompressor = Decompressor() if f"{COMPRESS}={ZLIB}" in options else None
+    return "\n".join(lines)
+
+def send_line(sock, reader, line):
+    """Send one command in the session's framing"""
+    sock.sendall(encode(line.encode(), reader.framing))
 
 def load_public():
     """Load public key as PEM string"""
     with open(PUBLIC_KEY_PATH, "rb") as f:
         return f.read().decode().strip()
 
-def load_private_key():
-    """Load private key for signing"""
-    with open(PRIVATE_KEY_PATH, "rb") as f:
-        return serialization.load_pem_private_key(
-            f.read(),
-            password=None,
-            backend=default_backend()
-        )
-
 def sign_challenge(challenge):
-    """Sign a challenge string with our private key"""
-    private_key = load_private_key()
-    signature = private_key.sign(
-        challenge.encode(),
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
-    return signature.hex()
+    """Sign a challenge string with our private key, read from disk only once"""
+    global private_key
+    if private_key is None:
+        private_key = load_private_key(PRIVATE_KEY_PATH)
+    return sign(private_key, challenge)
 
 def load_identity():
     """Load identity configuration"""
@@ -52,58 +66,227 @@ def load_identity():
             return json.load(f)
     return {"role": "INITIATE", "invites": []}
 
-def receive_messages(sock):
+def load_ticket(host, port):
+    """Saved resumption ticket for a server, if it has not expired"""
+    if not os.path.exists(TICKETS_PATH):
+        return None
+    try:
+        with open(TICKETS_PATH, "r") as f:
+            entry = json.load(f).get(f"{host}:{port}")
+    except (OSError, json.JSONDecodeError):
+        return None
+    if entry and entry["expires"] > time.time() + 5:
+        return entry["ticket"]
+    return None
+
+def save_ticket(host, port, ticket, lifetime):
+    """Remember a ticket so the next connection can RESUME; None forgets it"""
+    tickets = {}
+    if os.path.exists(TICKETS_PATH):
+        try:
+            with open(TICKETS_PATH, "r") as f:
+                tickets = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            tickets = {}
+    
+    if ticket:
+        tickets[f"{host}:{port}"] = {"ticket": ticket, "expires": time.time() + lifetime}
+    else:
+        tickets.pop(f"{host}:{port}", None)
+    
+    fd = os.open(TICKETS_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(tickets, f)
+
+def show_message(msg):
+    """Print a CHAT/HISTORY/MAILBOX/PEERS/PEER/STATS message; returns False for other types"""
+    if msg.get("type") == "CHAT":
+        sender = msg.get("sender", "Unknown")
+        message = msg.get("message", "")
+        timestamp = msg.get("timestamp", "")
+        channel = f"{msg['channel']} " if "channel" in msg else ""
+        print(f"\n[{timestamp}] {channel}{sender}: {message}")
+    elif msg.get("type") == "HISTORY":
+        channel = f" {msg['channel']}" if "channel" in msg else ""
+        print(f"\n--- Chat History{channel} ---")
+        for m in msg.get("messages", []):
+            print(f"[{m['timestamp']}] {m['sender']}: {m['message']}")
+        print("--- End History ---")
+    elif msg.get("type") == "MAILBOX":
+        print(f"\n--- While you were away ({len(msg['messages'])} messages) ---")
+        if msg.get("dropped"):
+            print(f"  ({msg['dropped']} older messages did not fit)")
+        for m in msg["messages"]:
+            print(f"[{m['timestamp']}] {m['sender']}: {m['message']}")
+        if msg.get("remaining"):
+            print(f"--- {msg['remaining']} more to follow ---")
+        else:
+            print("--- End Mailbox ---")
+    elif msg.get("type") == "PEERS":
+        version = f" (v{msg['version']})" if "version" in msg else ""
+        print(f"\n--- Connected Peers{version} ---")
+        for p in msg.get("peers", []):
+            print(f"  {p.get('id', p['pubkey'])}... ({p['role']})")
+        for change in msg.get("changes", []):
+            show_message(change)
+        print("--- End Peers ---")
+    elif msg.get("type") == "PEER":
+        if msg["op"] == "leave":
+            print(f"\n[peers v{msg['version']}] - {msg['id']} left")
+        else:
+            peer = msg["peer"]
+            print(f"\n[peers v{msg['version']}] {'+' if msg['op'] == 'join' else '~'} "
+                  f"{peer['id']} ({peer['role']})")
+    elif msg.get("type") == "STATS":
+        print("\n--- Server Stats ---")
+        for name, value in {**msg.get("counters", {}), **msg.get("gauges", {})}.items():
+            print(f"  {name}: {value}")
+        for name, latency in msg.get("latency_ms", {}).items():
+            if latency["count"]:
+                print(f"  {name}: p50 {latency['p50_ms']:.2f}ms, p99 {latency['p99_ms']:.2f}ms"
+                      f" ({latency['count']} samples)")
+        print("--- End Stats ---")
+    else:
+        return False
+    return True
+
+def show_payload(payload, decoder, reader, host, port):
+    """Handle one payload from the server"""
+    if is_packed(payload):
+        # Compact encoding; SENDER entries decode to None
+        msg = decoder.decode(payload)
+        if msg is not None:
+            show_message(msg)
+        return
+    
+    line = str(payload, "utf-8").strip()
+    if not line:
+        return
+    
+    if line == "PING":
+        # Server heartbeat; answering keeps an idle session open
+        send_line(reader.sock, reader, "PONG")
+        return
+    
+    if line.startswith("TICKET "):
+        # Fresh resumption ticket for the next reconnect
+        _, ticket, lifetime = line.split()
+        save_ticket(host, port, ticket, int(lifetime))
+        return
+    
+    # Try to parse as JSON
+    try:
+        if not show_message(json.loads(line)):
+            print(f"\n[SERVER] {line}")
+    except json.JSONDecodeError:
+        print(f"\n[SERVER] {line}")
+
+def receive_messages(reader, host, port):
     """Background thread to receive and display messages"""
-    buffer = ""
+    decoder = Decoder()
     try:
-        while True:
-            data = sock.recv(4096)
-            if not data:
-                print("\n[!] Connection closed by server")
-                break
-            
-            buffer += data.decode()
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                line = line.strip()
-                
-                if not line:
-                    continue
-                
-                # Try to parse as JSON
-                try:
-                    msg = json.loads(line)
-                    if msg.get("type") == "CHAT":
-                        sender = msg.get("sender", "Unknown")
-                        message = msg.get("message", "")
-                        timestamp = msg.get("timestamp", "")
-                        print(f"\n[{timestamp}] {sender}: {message}")
-                    elif msg.get("type") == "HISTORY":
-                        print("\n--- Chat History ---")
-                        for m in msg.get("messages", []):
-                            print(f"[{m['timestamp']}] {m['sender']}: {m['message']}")
-                        print("--- End History ---")
-                    elif msg.get("type") == "PEERS":
-                        print("\n--- Connected Peers ---")
-                        for p in msg.get("peers", []):
-                            print(f"  {p['pubkey']}... ({p['role']})")
-                        print("--- End Peers ---")
-                    else:
-                        print(f"\n[SERVER] {line}")
-                except json.JSONDecodeError:
-                    print(f"\n[SERVER] {line}")
+        for frame in reader.frames():
+            # A compressed frame carries several payloads
+            for payload in decompressor.payloads(frame) if decompressor else [frame]:
+                show_payload(payload, decoder, reader, host, port)
+        
+        print("\n[!] Connection closed by server")
     
     except Exception as e:
         print(f"\n[!] Error receiving messages: {e}")
 
+def resume_session(host, port, ticket, options=""):
+    """Reconnect in one round trip with a ticket; returns (sock, reader) or None"""
+    sock = socket.create_connection((host, port))
+    reader = FrameReader(sock)
+    
+    print("[*] Resuming session with saved ticket...")
+    sock.sendall(f"RESUME {ticket}{options}\n".encode())
+    
+    welcome = reader.readline()
+    if welcome and welcome.startswith("WELCOME "):
+        read_welcome(reader, welcome)
+        print("[✓] Session resumed!")
+        return sock, reader
+    
+    print(f"[!] Resume refused ({welcome}), falling back to full handshake")
+    sock.close()
+    return None
+
+def full_handshake(host, port, hello_msg):
+    """HELLO/CHALLENGE/RESPONSE/WELCOME; returns (sock, reader) or None"""
+    sock = socket.create_connection((host, port))
+    reader = FrameReader(sock)
+    print("[✓] Connected!")
+    
+    # Phase 1: Send HELLO
+    print("[*] Sending HELLO...")
+    sock.sendall(f"{hello_msg}\n".encode())
+    
+    # Phase 2: Receive CHALLENGE
+    response = reader.readline() or ""
+    print(f"[<] {response}")
+    
+    if not response.startswith("CHALLENGE "):
+        print("[!] Expected CHALLENGE, got:", response)
+        sock.close()
+        return None
+    
+    challenge = response.split(" ", 1)[1]
+    print(f"[*] Received challenge: {challenge[:32]}...")
+    
+    # Phase 3: Sign and respond
+    print("[*] Signing challenge...")
+    signature = sign_challenge(challenge)
+    sock.sendall(f"RESPONSE {signature}\n".encode())
+    print("[✓] Sent signature")
+    
+    # Phase 4: Receive WELCOME
+    welcome = reader.readline() or ""
+    print(f"[<] {welcome[:50]}...")
+    
+    if not welcome.startswith("WELCOME "):
+        print("[!] Authentication failed:", welcome)
+        sock.close()
+        return None
+    
+    read_welcome(reader, welcome)
+    print("[✓] Authenticated successfully!")
+    return sock, reader
+
+def parse_flag(args, name, choices, default):
+    """Value following `name` in args, exiting if it is not one of choices"""
+    if name not in args:
+        return default
+    value = (args[args.index(name) + 1:] or [""])[0]
+    if value not in choices:
+        print(f"[!] {name} must be one of: {', '.join(choices)}")
+        sys.exit(1)
+    return value
+
 def main():
     """Main client function"""
     if len(sys.argv) < 3:
-        print("Usage: client.py <host> <port>")
+        print("Usage: client.py <host> <port> [--framing text|len] [--encoding json|compact] [--compress]")
         sys.exit(1)
     
     host = sys.argv[1]
     port = int(sys.argv[2])
+    framing = parse_flag(sys.argv[3:], "--framing", FRAMINGS, TEXT)
+    encoding = parse_flag(sys.argv[3:], "--encoding", ENCODINGS, JSON)
+    compress = "--compress" in sys.argv[3:]
+    if encoding == COMPACT or compress:
+        # Packed and deflated payloads can contain newlines
+        framing = LENGTH
+    
+    # Session options, appended to HELLO and RESUME
+    options = ""
+    if framing != TEXT:
+        options += f" FRAMING={framing}"
+    if encoding != JSON:
+        options += f" ENCODING={encoding}"
+    if compress:
+        options += f" {COMPRESS}={ZLIB}"
     
     # Check if keys exist
     if not os.path.exists(PRIVATE_KEY_PATH):
@@ -112,85 +295,76 @@ def main():
     
     pub = load_public()
     identity = load_identity()
-    invite_code = identity.get("invites", [None])[0]
+    invite_code = (identity.get("invites") or [None])[0]
     
-    # Build HELLO message
+    # Build HELLO message; TICKET asks for a resumption ticket
     hello_msg = f"HELLO {pub}"
     if invite_code:
         hello_msg += f" INVITE {invite_code}"
+    hello_msg += " TICKET" + options
     
     print(f"[*] Connecting to {host}:{port}...")
     
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+    sock = None
+    try:
+        session = None
+        ticket = load_ticket(host, port)
+        if ticket:
+            session = resume_session(host, port, ticket, options)
+            if session is None:
+                save_ticket(host, port, None, 0)
+        if session is None:
+            session = full_handshake(host, port, hello_msg)
+        if session is None:
+            return
+        sock, reader = session
+        
+        print("\n" + "="*50)
+        print("Connected to PURE Network")
+        print("="*50)
+        print("Commands:")
+        print("  CHAT <message>  - Send a chat message")
+        print("  CHAT #chan <msg>- Send to a channel")
+        print("  JOIN #chan      - Subscribe to a channel")
+        print("  LEAVE #chan     - Unsubscribe")
+        print("  PEERS [role]    - List connected peers")
+        print("  PEERS SUBSCRIBE - Follow peers joining and leaving")
+        print("  PING            - Ping the server")
+        print("  HISTORY [seq]   - Show messages sent after seq")
+        print("  STATS           - Show server metrics")
+        print("  quit            - Exit")
+        print("="*50 + "\n")
+        
+        # Start message receiver thread
+        receiver = threading.Thread(
+            target=receive_messages, args=(reader, host, port), daemon=True
+        )
+        receiver.start()
+        
+        # Interactive loop
         try:
-            sock.connect((host, port))
-            print("[✓] Connected!")
-            
-            # Phase 1: Send HELLO
-            print("[*] Sending HELLO...")
-            sock.sendall(f"{hello_msg}\n".encode())
-            
-            # Phase 2: Receive CHALLENGE
-            response = sock.recv(4096).decode().strip()
-            print(f"[<] {response}")
-            
-            if not response.startswith("CHALLENGE "):
-                print("[!] Expected CHALLENGE, got:", response)
-                return
-            
-            challenge = response.split(" ", 1)[1]
-            print(f"[*] Received challenge: {challenge[:32]}...")
-            
-            # Phase 3: Sign and respond
-            print("[*] Signing challenge...")
-            signature = sign_challenge(challenge)
-            sock.sendall(f"RESPONSE {signature}\n".encode())
-            print("[✓] Sent signature")
-            
-            # Phase 4: Receive WELCOME
-            welcome = sock.recv(4096).decode().strip()
-            print(f"[<] {welcome[:50]}...")
-            
-            if not welcome.startswith("WELCOME "):
-                print("[!] Authentication failed:", welcome)
-                return
-            
-            print("[✓] Authenticated successfully!")
-            print("\n" + "="*50)
-            print("Connected to PURE Network")
-            print("="*50)
-            print("Commands:")
-            print("  CHAT <message>  - Send a chat message")
-            print("  PEERS           - List connected peers")
-            print("  PING            - Ping the server")
-            print("  quit            - Exit")
-            print("="*50 + "\n")
-            
-            # Start message receiver thread
-            receiver = threading.Thread(target=receive_messages, args=(sock,), daemon=True)
-            receiver.start()
-            
-            # Interactive loop
-            try:
-                while True:
-                    user_input = input("> ")
-                    
-                    if user_input.lower() == "quit":
-                        break
-                    
-                    if not user_input.strip():
-                        continue
-                    
-                    # Send command to server
-                    sock.sendall(f"{user_input}\n".encode())
-            
-            except KeyboardInterrupt:
-                print("\n[*] Disconnecting...")
+            while True:
+                user_input = input("> ")
+                
+                if user_input.lower() == "quit":
+                    break
+                
+                if not user_input.strip():
+                    continue
+                
+                # Send command to server
+                send_line(sock, reader, user_input)
+        
+        except KeyboardInterrupt:
+            print("\n[*] Disconnecting...")
         
-        except ConnectionRefusedError:
-            print(f"[!] Connection refused. Is the server running on {host}:{port}?")
-        except Exception as e:
-            print(f"[!] Error: {e}")
+    except ConnectionRefusedError:
+        print(f"[!] Connection refused. Is the server running on {host}:{port}?")
+    except Exception as e:
+        print(f"[!] Error: {e}")
+    finally:
+        if sock:
+            sock.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,471 @@
+"""
+PURE Protocol compact message encoding
+- Pure-Python packer/unpacker for a msgpack subset (nil, bool, int, float,
+  str, bin, array, map), wire-compatible with msgpack for those types
+- CHAT/HISTORY/PEERS become small arrays led by an integer type tag
+- Timestamps travel as epoch milliseconds instead of ISO strings
+- Sender prefixes are interned to small integers; a SENDER entry defines
+  an id once per connection, before the first message that uses it
+- Negotiated with ENCODING=compact (requires FRAMING=len); text replies
+  such as PONG or ERR stay plain UTF-8 and are told apart by their first byte
+"""
+
+import struct
+import threading
+from datetime import datetime
+
+JSON = "json"
+COMPACT = "compact"
+ENCODINGS = (JSON, COMPACT)
+
+# Integer type tags, always the first element of a packed message
+CHAT = 1  # [CHAT, seq, sender, timestamp_ms, message]
+HISTORY = 2  # [HISTORY, first_seq, last_seq, [[seq, sender, timestamp_ms, message], ...]]
+PEERS = 3  # [PEERS, [[pubkey, role, last_seen_ms], ...]]
+SENDER = 4  # [SENDER, id, prefix]
+
+MAX_SENDERS = 65536  # interned ids; later senders are sent as plain strings
+
+UINT16 = struct.Struct(">H")
+UINT32 = struct.Struct(">I")
+UINT64 = struct.Struct(">Q")
+INT8 = struct.Struct(">b")
+INT16 = struct.Struct(">h")
+INT32 = struct.Struct(">i")
+INT64 = struct.Struct(">q")
+FLOAT64 = struct.Struct(">d")
+
+# Chat entries pack seq, sender and timestamp at fixed width (still valid
+# msgpack) so both sides handle them with one struct call
+CHAT_FIELDS = struct.Struct(">BIBHBQ")  # 0xce seq, 0xcd sender id, 0xcf timestamp_ms
+
+
+# -------------------------
+# Packer
+# -------------------------
+
+def pack_into(obj, out):
+    """Append the packed form of obj to the bytearray `out`"""
+    kind = type(obj)
+    if kind is int:
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj < 0x100:
+            out += b"\xcc" + bytes((obj,))
+        elif 0 <= obj < 0x10000:
+            out += b"\xcd" + UINT16.pack(obj)
+        elif 0 <= obj < 0x100000000:
+            out += b"\xce" + UINT32.pack(obj)
+        elif obj >= 0:
+            out += b"\xcf" + UINT64.pack(obj)
+        elif obj >= -0x80:
+            out += b"\xd0" + INT8.pack(obj)
+        elif obj >= -0x8000:
+            out += b"\xd1" + INT16.pack(obj)
+        elif obj >= -0x80000000:
+            out += b"\xd2" + INT32.pack(obj)
+        else:
+            out += b"\xd3" + INT64.pack(obj)
+    elif kind is str:
+        data = obj.encode()
+        size = len(data)
+        if size < 0x20:
+            out.append(0xa0 | size)
+        elif size < 0x100:
+            out += b"\xd9" + bytes((size,))
+        elif size < 0x10000:
+            out += b"\xda" + UINT16.pack(size)
+        else:
+            out += b"\xdb" + UINT32.pack(size)
+        out += data
+    elif kind is list or kind is tuple:
+        size = len(obj)
+        if size < 0x10:
+            out.append(0x90 | size)
+        elif size < 0x10000:
+            out += b"\xdc" + UINT16.pack(size)
+        else:
+            out += b"\xdd" + UINT32.pack(size)
+        for item in obj:
+            pack_into(item, out)
+    elif obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif kind is float:
+        out += b"\xcb" + FLOAT64.pack(obj)
+    elif kind is bytes or kind is bytearray or kind is memoryview:
+        size = len(obj)
+        if size < 0x100:
+            out += b"\xc4" + bytes((size,))
+        elif size < 0x10000:
+            out += b"\xc5" + UINT16.pack(size)
+        else:
+            out += b"\xc6" + UINT32.pack(size)
+        out += obj
+    elif kind is dict:
+        size = len(obj)
+        if size < 0x10:
+            out.append(0x80 | size)
+        elif size < 0x10000:
+            out += b"\xde" + UINT16.pack(size)
+        else:
+            out += b"\xdf" + UINT32.pack(size)
+        for key, value in obj.items():
+            pack_into(key, out)
+            pack_into(value, out)
+    else:
+        raise TypeError(f"cannot pack {kind.__name__}")
+
+
+def pack(obj):
+    out = bytearray()
+    pack_into(obj, out)
+    return bytes(out)
+
+
+def pack_array_header(size, out):
+    if size < 0x10:
+        out.append(0x90 | size)
+    elif size < 0x10000:
+        out += b"\xdc" + UINT16.pack(size)
+    else:
+        out += b"\xdd" + UINT32.pack(size)
+
+
+def pack_chat_fields(seq, sender, timestamp_ms, text, out):
+    """The four fields shared by CHAT messages and HISTORY entries"""
+    if type(seq) is int and type(sender) is int and 0 <= seq < 0x100000000 and timestamp_ms >= 0:
+        out += CHAT_FIELDS.pack(0xce, seq, 0xcd, sender, 0xcf, timestamp_ms)
+    else:
+        pack_into(seq, out)
+        pack_into(sender, out)
+        pack_into(timestamp_ms, out)
+    pack_into(text, out)
+
+
+# -------------------------
+# Unpacker
+# -------------------------
+
+class UnpackError(ValueError):
+    """Payload is truncated or uses a type outside the supported subset"""
+
+
+def unpack_from(data, position):
+    """Decode one object at `position`; returns (obj, next_position)"""
+    try:
+        first = data[position]
+    except IndexError:
+        raise UnpackError("truncated payload") from None
+    position += 1
+
+    if first < 0x80:
+        return first, position
+    if first >= 0xe0:
+        return first - 0x100, position
+    if 0xa0 <= first <= 0xbf:
+        return read_str(data, position, first & 0x1f)
+    if 0x90 <= first <= 0x9f:
+        return read_array(data, position, first & 0x0f)
+    if 0x80 <= first <= 0x8f:
+        return read_map(data, position, first & 0x0f)
+
+    if first == 0xc0:
+        return None, position
+    if first == 0xc2:
+        return False, position
+    if first == 0xc3:
+        return True, position
+    if first == 0xcc:
+        return data[position], position + 1
+    if first == 0xcd:
+        return UINT16.unpack_from(data, position)[0], position + 2
+    if first == 0xce:
+        return UINT32.unpack_from(data, position)[0], position + 4
+    if first == 0xcf:
+        return UINT64.unpack_from(data, position)[0], position + 8
+    if first == 0xd0:
+        return INT8.unpack_from(data, position)[0], position + 1
+    if first == 0xd1:
+        return INT16.unpack_from(data, position)[0], position + 2
+    if first == 0xd2:
+        return INT32.unpack_from(data, position)[0], position + 4
+    if first == 0xd3:
+        return INT64.unpack_from(data, position)[0], position + 8
+    if first == 0xcb:
+        return FLOAT64.unpack_from(data, position)[0], position + 8
+    if first == 0xd9:
+        return read_str(data, position + 1, data[position])
+    if first == 0xda:
+        return read_str(data, position + 2, UINT16.unpack_from(data, position)[0])
+    if first == 0xdb:
+        return read_str(data, position + 4, UINT32.unpack_from(data, position)[0])
+    if first == 0xc4:
+        return read_bin(data, position + 1, data[position])
+    if first == 0xc5:
+        return read_bin(data, position + 2, UINT16.unpack_from(data, position)[0])
+    if first == 0xc6:
+        return read_bin(data, position + 4, UINT32.unpack_from(data, position)[0])
+    if first == 0xdc:
+        return read_array(data, position + 2, UINT16.unpack_from(data, position)[0])
+    if first == 0xdd:
+        return read_array(data, position + 4, UINT32.unpack_from(data, position)[0])
+    if first == 0xde:
+        return read_map(data, position + 2, UINT16.unpack_from(data, position)[0])
+    if first == 0xdf:
+        return read_map(data, position + 4, UINT32.unpack_from(data, position)[0])
+    raise UnpackError(f"unsupported type byte 0x{first:02x}")
+
+
+def read_str(data, position, size):
+    end = position + size
+    if end > len(data):
+        raise UnpackError("truncated payload")
+    return str(data[position:end], "utf-8"), end
+
+
+def read_bin(data, position, size):
+    end = position + size
+    if end > len(data):
+        raise UnpackError("truncated payload")
+    return bytes(data[position:end]), end
+
+
+def read_array(data, position, size):
+    items = []
+    for _ in range(size):
+        item, position = unpack_from(data, position)
+        items.append(item)
+    return items, position
+
+
+def read_map(data, position, size):
+    items = {}
+    for _ in range(size):
+        key, position = unpack_from(data, position)
+        items[key], position = unpack_from(data, position)
+    return items, position
+
+
+def read_array_header(data, position):
+    """Size of the array starting at `position`; returns (size, next_position)"""
+    first = data[position]
+    if 0x90 <= first <= 0x9f:
+        return first & 0x0f, position + 1
+    if first == 0xdc:
+        return UINT16.unpack_from(data, position + 1)[0], position + 3
+    if first == 0xdd:
+        return UINT32.unpack_from(data, position + 1)[0], position + 5
+    raise UnpackError(f"expected an array, got type byte 0x{first:02x}")
+
+
+def read_chat_fields(data, position):
+    """Inverse of pack_chat_fields; returns ((seq, sender, ms, text), next_position)"""
+    end = position + CHAT_FIELDS.size
+    if end <= len(data) and data[position] == 0xce and data[position + 5] == 0xcd \
+            and data[position + 8] == 0xcf:
+        _, seq, _, sender, _, timestamp_ms = CHAT_FIELDS.unpack_from(data, position)
+        position = end
+    else:
+        seq, position = unpack_from(data, position)
+        sender, position = unpack_from(data, position)
+        timestamp_ms, position = unpack_from(data, position)
+    text, position = unpack_from(data, position)
+    return (seq, sender, timestamp_ms, text), position
+
+
+def unpack(data):
+    try:
+        obj, end = unpack_from(data, 0)
+    except (struct.error, IndexError):
+        raise UnpackError("truncated payload") from None
+    if end != len(data):
+        raise UnpackError(f"{len(data) - end} trailing bytes")
+    return obj
+
+
+def is_packed(payload):
+    """Packed messages are arrays; their first byte is never valid UTF-8 text"""
+    return len(payload) > 0 and 0x90 <= payload[0] <= 0x9f
+
+
+# -------------------------
+# Message schema
+# -------------------------
+
+class Interner:
+    """Server-wide sender prefix -> small integer id table"""
+
+    def __init__(self, max_size=MAX_SENDERS):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.ids = {}  # prefix -> id
+        self.definitions = []  # id -> packed SENDER message
+
+    def intern(self, prefix):
+        """Id for prefix, or the prefix itself once the table is full"""
+        sender_id = self.ids.get(prefix)
+        if sender_id is not None:
+            return sender_id
+        with self.lock:
+            sender_id = self.ids.get(prefix)
+            if sender_id is None:
+                if len(self.definitions) >= self.max_size:
+                    return prefix
+                sender_id = len(self.definitions)
+                self.definitions.append(pack([SENDER, sender_id, prefix]))
+                self.ids[prefix] = sender_id
+        return sender_id
+
+    def definition(self, sender_id):
+        return self.definitions[sender_id]
+
+    def stats(self):
+        return {"senders": len(self.definitions)}
+
+
+senders = Interner()  # shared by every compact connection
+
+
+# Timestamps of nearby messages share their whole-second part, so the
+# (comparatively slow) datetime conversions are cached per second
+epoch_seconds = {}  # "YYYY-MM-DDTHH:MM:SS" -> epoch seconds
+iso_seconds = {}  # epoch seconds -> "YYYY-MM-DDTHH:MM:SS"
+SECONDS_CACHE = 4096
+
+
+def epoch_ms(timestamp):
+    """ISO timestamp (as stored in messages) to epoch milliseconds"""
+    whole = timestamp[:19]
+    seconds = epoch_seconds.get(whole)
+    if seconds is None:
+        if len(epoch_seconds) >= SECONDS_CACHE:
+            epoch_seconds.clear()
+        seconds = epoch_seconds[whole] = int(datetime.fromisoformat(whole).timestamp())
+    fraction = timestamp[20:23]
+    return seconds * 1000 + (int(fraction.ljust(3, "0")) if fraction else 0)
+
+
+def iso_timestamp(ms):
+    """Epoch milliseconds to a local ISO timestamp with millisecond precision"""
+    seconds, millis = divmod(ms, 1000)
+    whole = iso_seconds.get(seconds)
+    if whole is None:
+        if len(iso_seconds) >= SECONDS_CACHE:
+            iso_seconds.clear()
+        whole = iso_seconds[seconds] = datetime.fromtimestamp(seconds).isoformat()
+    return f"{whole}.{millis:03d}"
+
+
+def encode_message(message, interner=senders):
+    """Pack a server message; returns (payload, sender ids) or None if it has no compact form"""
+    kind = message.get("type")
+    used = set()
+
+    def sender_id(prefix):
+        interned = interner.intern(prefix)
+        if type(interned) is int:
+            used.add(interned)
+        return interned
+
+    if "channel" in message or "version" in message:
+        # Channel traffic and roster updates have no packed form yet;
+        # compact peers get the JSON
+        return None
+    if kind == "CHAT":
+        out = bytearray((0x95, CHAT))
+        pack_chat_fields(
+            message.get("seq"), sender_id(message["sender"]),
+            epoch_ms(message["timestamp"]), message["message"], out
+        )
+    elif kind == "HISTORY":
+        out = bytearray((0x94, HISTORY))
+        pack_into(message.get("first_seq"), out)
+        pack_into(message.get("last_seq"), out)
+        pack_array_header(len(message["messages"]), out)
+        for m in message["messages"]:
+            out.append(0x94)
+            pack_chat_fields(
+                m.get("seq"), sender_id(m["sender"]),
+                epoch_ms(m["timestamp"]), m["message"], out
+            )
+    elif kind == "PEERS":
+        out = bytearray()
+        pack_into([
+            PEERS,
+            [
+                [sender_id(p["pubkey"]), p["role"], int(p["last_seen"] * 1000)]
+                for p in message["peers"]
+            ]
+        ], out)
+    else:
+        return None
+    return bytes(out), tuple(used)
+
+
+class Decoder:
+    """Client side: turns packed messages back into the JSON message shapes"""
+
+    def __init__(self):
+        self.senders = {}  # id -> prefix, from SENDER entries
+
+    def sender(self, value):
+        if type(value) is int:
+            return self.senders.get(value, f"#{value}")
+        return value
+
+    def chat(self, seq, sender, timestamp_ms, text):
+        return {
+            "type": "CHAT",
+            "sender": self.sender(sender),
+            "message": text,
+            "timestamp": iso_timestamp(timestamp_ms),
+            "seq": seq
+        }
+
+    def decode(self, payload):
+        """Message dict, or None for SENDER entries (which only update state)"""
+        try:
+            return self.decode_tagged(payload)
+        except (struct.error, IndexError):
+            raise UnpackError("truncated payload") from None
+
+    def decode_tagged(self, payload):
+        # Every message is a short array whose first element is its tag
+        tag = payload[1]
+        if tag == CHAT:
+            fields, _ = read_chat_fields(payload, 2)
+            return self.chat(*fields)
+        if tag == HISTORY:
+            first_seq, position = unpack_from(payload, 2)
+            last_seq, position = unpack_from(payload, position)
+            count, position = read_array_header(payload, position)
+            messages = []
+            for _ in range(count):
+                fields, position = read_chat_fields(payload, position + 1)
+                messages.append(self.chat(*fields))
+            return {
+                "type": "HISTORY",
+                "messages": messages,
+                "first_seq": first_seq,
+                "last_seq": last_seq
+            }
+
+        packed = unpack(payload)
+        if tag == SENDER:
+            self.senders[packed[1]] = packed[2]
+            return None
+        if tag == PEERS:
+            return {
+                "type": "PEERS",
+                "peers": [
+                    {"pubkey": self.sender(key), "role": role, "last_seen": ms / 1000}
+                    for key, role, ms in packed[1]
+                ]
+            }
+        raise UnpackError(f"unknown message tag {tag}")
@@ -0,0 +1,154 @@
+"""
+PURE Protocol frame compression
+- Negotiated with COMPRESS=zlib in HELLO (requires FRAMING=len), acknowledged
+  as COMPRESS=zlib; applies to what the server sends after WELCOME
+- One raw deflate stream per connection, primed with a preset dictionary of
+  protocol keys, so repeated keys and sender prefixes cost a few bits even in
+  the first frame and back-references reach into the frames before it
+- The writer deflates each batch it takes from the queue in one go: a
+  compressed frame is the byte 0xff (never the start of UTF-8 text, JSON, a
+  packed message or a stream tag) followed by deflated length-prefixed
+  frames, which the reader inflates and reads in order
+- Batches smaller than the threshold, such as a lone PONG, go out as they are
+- Each compressed frame ends in a sync flush, minus its fixed 4-byte tail
+  (as in WebSocket permessage-deflate), so the reader inflates it on arrival
+- The stream only ever sees frames that are actually written, which is why
+  compression happens in the writer, after backpressure has dropped frames
+"""
+
+import zlib
+
+from framing import HEADER, MAX_FRAME, FrameError
+
+COMPRESS = "COMPRESS"
+ZLIB = "zlib"  # the only method; a changed dictionary needs a new name
+LEVEL = 6
+THRESHOLD = 128  # smallest batch worth compressing, in bytes
+BLOCK_SIZE = MAX_FRAME // 2  # most frame bytes deflated into one compressed frame
+WINDOW_BITS = 12  # 4 KiB history: a page of chat, and ~40 KiB of state per connection
+MEM_LEVEL = 5
+MARKER = b"\xff"
+SYNC_TAIL = b"\x00\x00\xff\xff"
+
+# Strings the server sends over and over; deflate finds the ones near the
+# end most cheaply, so the most common come last
+DICTIONARY = (
+    b'{"type": "STATS", "counters": {}, "gauges": {}, "latency_ms": {}}'
+    b'{"type": "PEER", "op": "leave", "id": "'
+    b'{"type": "PEER", "op": "role", "peer": {'
+    b'{"type": "PEERS", "roster": "", "since": , "version": , "changes": [], "peers": ['
+    b'{"type": "PEER", "op": "join", "peer": {'
+    b'{"pubkey": "-----BEGIN PUBLIC KEY-----\\nMIIBI", "role": "INITIATE", "last_seen": , "id": "'
+    b'{"type": "HISTORY", "messages": [], "first_seq": , "last_seq": '
+    b'{"type": "CHAT", "sender": "SERVER", "message": "Peer -----BEG... joined", "timestamp": "20'
+    b'", "channel": "#", "seq": '
+    b'{"type": "CHAT", "sender": "-----BEGIN PUBLIC KEY-----\\nMIIBI", "message": "'
+)
+
+# Counters of connections that have closed, so totals survive disconnects
+closed_totals = {"blocks": 0, "frames": 0, "skipped": 0, "raw_bytes": 0, "wire_bytes": 0}
+
+
+def totals(compressors):
+    """Compression counters summed over closed connections and the given live ones"""
+    result = dict(closed_totals)
+    for compressor in compressors:
+        for name in result:
+            result[name] += getattr(compressor, name)
+    return result
+
+
+class Compressor:
+    """Deflate stream for one connection's outbound frames; used by its writer only"""
+
+    def __init__(self, level=LEVEL, threshold=THRESHOLD):
+        self.deflater = zlib.compressobj(
+            level, zlib.DEFLATED, -WINDOW_BITS, MEM_LEVEL, zdict=DICTIONARY
+        )
+        self.threshold = threshold
+        self.blocks = 0  # compressed frames written
+        self.frames = 0  # frames they carried
+        self.skipped = 0  # frames sent as they were
+        self.raw_bytes = 0  # bytes of the carried frames
+        self.wire_bytes = 0  # bytes of the compressed frames that carried them
+        self.folded = False
+
+    def compress(self, frames, size):
+        """Wire buffers for a run of length-framed frames totalling `size` bytes"""
+        if size < self.threshold:
+            self.skipped += len(frames)
+            return frames
+        buffers = []
+        block = []
+        block_size = 0
+        for data in frames:
+            if block and block_size + len(data) > BLOCK_SIZE:
+                buffers.append(self.deflate(block, block_size))
+                block = []
+                block_size = 0
+            if len(data) > BLOCK_SIZE:
+                self.skipped += 1  # would inflate past what a reader accepts
+                buffers.append(data)
+                continue
+            block.append(data)
+            block_size += len(data)
+        if block:
+            buffers.append(self.deflate(block, block_size))
+        return buffers
+
+    def deflate(self, block, size):
+        deflater = self.deflater
+        deflated = deflater.compress(b"".join(block)) + deflater.flush(zlib.Z_SYNC_FLUSH)
+        length = len(deflated) - len(SYNC_TAIL) + 1
+        self.blocks += 1
+        self.frames += len(block)
+        self.raw_bytes += size
+        self.wire_bytes += HEADER.size + length
+        return HEADER.pack(length) + MARKER + deflated[:-len(SYNC_TAIL)]
+
+    def fold_totals(self):
+        """Add this connection's counters to closed_totals, once"""
+        if not self.folded:
+            self.folded = True
+            for name in closed_totals:
+                closed_totals[name] += getattr(self, name)
+
+    def stats(self):
+        return {
+            "blocks": self.blocks,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "raw_bytes": self.raw_bytes,
+            "wire_bytes": self.wire_bytes,
+            "ratio": self.raw_bytes / self.wire_bytes if self.wire_bytes else 0.0,
+        }
+
+
+class Decompressor:
+    """Client side of a compressed connection"""
+
+    def __init__(self, max_size=MAX_FRAME):
+        self.inflater = zlib.decompressobj(-WINDOW_BITS, zdict=DICTIONARY)
+        self.max_size = max_size
+
+    def payloads(self, payload):
+        """The payloads a frame carries: itself, unless it is compressed"""
+        if payload[:1] != MARKER:
+            return [payload]
+        inflater = self.inflater
+        try:
+            data = inflater.decompress(bytes(payload[1:]) + SYNC_TAIL, self.max_size)
+        except zlib.error as e:
+            raise FrameError(f"bad compressed frame: {e}")
+        if inflater.unconsumed_tail:
+            raise FrameError(f"compressed frame inflates past {self.max_size} bytes")
+        payloads = []
+        start = 0
+        while start < len(data):
+            (length,) = HEADER.unpack_from(data, start)
+            start += HEADER.size
+            if start + length > len(data):
+                raise FrameError("compressed frame ends inside a frame")
+            payloads.append(data[start:start + length])
+            start += length
+        return payloads
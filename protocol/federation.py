@@ -0,0 +1,532 @@
+"""
+PURE Protocol federation
+- Nodes link to each other with the same HELLO/CHALLENGE handshake, flagged NODE
+- Only nodes on the configured allowlist are linked, in either direction; the
+  linking node also challenges the one it dials (NONCE= in HELLO, answered
+  with a signed PROOF line before anything else)
+- Everything a node sends is checked for shape and types before it is stored
+- Chat spreads by gossip: every message carries an ID, each node delivers and
+  forwards it once and remembers recent IDs in a bounded seen-set
+- Peer lists sync by digest: nodes trade {node: [version, heartbeat]} and
+  pull only the changes they miss, or a snapshot once the change log is too short
+- Nodes whose heartbeat stops advancing are dropped along with their peers
+"""
+
+import hashlib
+import json
+import logging
+import secrets
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+
+from frames import Frame, message_too_long
+from framing import FrameReader
+
+SEEN_LIMIT = 65536  # gossip IDs remembered for de-duplication
+MAX_HOPS = 8  # links a gossip message may cross, in case the seen-set forgot it
+SYNC_INTERVAL = 1.0  # seconds between digests, which double as heartbeats
+NODE_TTL = 15.0  # seconds a node's heartbeat may stall before its peers are dropped
+CHANGE_LOG = 1024  # peer changes kept per node for incremental sync
+RECONNECT_MIN = 0.5  # seconds before the first reconnect attempt of a link
+RECONNECT_MAX = 30.0
+
+PEM_END = "-----END PUBLIC KEY-----"
+CHAT_FIELDS = ("type", "sender", "message", "timestamp")
+OPTIONAL_FIELDS = ("channel",)  # absent for the default channel
+SUMMARY_FIELDS = {"pubkey": str, "role": str, "last_seen": (int, float)}  # a PEERS entry
+MAX_FIELD = 256  # longest string accepted in a remote peer entry
+MAX_NONCE = 128
+
+log = logging.getLogger("pure.federation")
+
+
+def fingerprint(pem):
+    """Short stable ID for a public key"""
+    return hashlib.sha256(pem.encode()).hexdigest()[:16]
+
+
+class LinkError(Exception):
+    """Outbound link handshake failed"""
+
+
+def proof_message(nonce):
+    """What a node signs to answer a link's NONCE; never a valid CHALLENGE reply"""
+    return f"PURE node link {nonce}"
+
+
+def integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check_summary(summary):
+    """A remote PEERS entry with just the known fields; ValueError if malformed"""
+    if not isinstance(summary, dict):
+        raise ValueError("peer entry is not an object")
+    for field, kind in SUMMARY_FIELDS.items():
+        value = summary.get(field)
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise ValueError(f"peer entry without a valid {field!r}")
+        if isinstance(value, str) and len(value) > MAX_FIELD:
+            raise ValueError(f"peer entry {field!r} too long")
+    return {field: summary[field] for field in SUMMARY_FIELDS}
+
+
+def check_peer_id(peer):
+    if not isinstance(peer, str) or len(peer) > MAX_FIELD:
+        raise ValueError("malformed peer ID")
+    return peer
+
+
+class SeenSet:
+    """The most recent `limit` gossip IDs; the oldest is forgotten first"""
+
+    def __init__(self, limit=SEEN_LIMIT):
+        self.limit = limit
+        self.ids = OrderedDict()
+
+    def add(self, msg_id):
+        """Remember an ID; False if it was already known"""
+        if msg_id in self.ids:
+            return False
+        self.ids[msg_id] = None
+        if len(self.ids) > self.limit:
+            self.ids.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class PeerTable:
+    """One node's peer list, its version and the changes that led there"""
+
+    def __init__(self, node):
+        self.node = node
+        self.version = 0
+        self.peers = {}  # peer fingerprint -> PEERS summary
+        self.changes = deque(maxlen=CHANGE_LOG)  # (version, fingerprint, summary or None)
+        self.beat = 0
+        self.alive = time.monotonic()
+        self.pulled = 0.0  # when we last asked a link for this table
+
+    def apply(self, version, peer, summary):
+        """Record a join (summary) or leave (None) as `version`"""
+        if summary is None:
+            self.peers.pop(peer, None)
+        else:
+            self.peers[peer] = summary
+        self.version = version
+        self.changes.append((version, peer, summary))
+
+    def since(self, version):
+        """Changes after `version`, or None if the log no longer reaches back"""
+        if version == self.version:
+            return []
+        if version > self.version or not self.changes or self.changes[0][0] > version + 1:
+            return None
+        return [change for change in self.changes if change[0] > version]
+
+    def replace(self, version, peers):
+        """Adopt a snapshot; older changes can no longer be served"""
+        self.peers = dict(peers)
+        self.version = version
+        self.changes.clear()
+
+
+class Link:
+    """A connection to another node, inbound or outbound"""
+
+    def __init__(self, node, out, conn):
+        self.node = node
+        self.out = out
+        self.conn = conn
+
+    def send(self, kind, data):
+        self.out.send(Frame.text(f"{kind} {json.dumps(data)}"))
+
+
+class Federation:
+    """Gossip and peer-list sync between this node and the nodes it links to
+
+    Every method that touches links or tables takes self.lock. Work started
+    by the federation's own threads (timer, outbound links) goes through
+    `dispatch`, which the asyncio engine points at its event loop so that
+    inbound links' queues are only used from the loop.
+    """
+
+    def __init__(self, node_pem, sign, verify, deliver, changed, make_queue, trusted=()):
+        self.node = fingerprint(node_pem)
+        self.node_pem = node_pem
+        self.sign = sign  # challenge -> hex signature with our node key
+        self.verify = verify  # (pem, message, hex signature) -> bool
+        self.trusted = set(trusted)  # IDs of the nodes we link with
+        self.deliver = deliver  # chat message from another node -> local delivery
+        self.changed = changed  # remote peer lists changed
+        self.make_queue = make_queue  # socket -> outbound queue, for outbound links
+        self.dispatch = lambda fn, *args: fn(*args)
+        self.lock = threading.RLock()
+        self.links = {}  # conn -> Link
+        self.local = PeerTable(self.node)
+        self.tables = {}  # node -> PeerTable of every other node we heard of
+        self.expired = {}  # node -> last heartbeat seen before it expired
+        self.seen = SeenSet()
+        self.running = False
+        self.published = 0
+        self.received = 0
+        self.duplicates = 0
+        self.forwarded = 0
+        self.pulls = 0
+        self.deltas = 0
+        self.snapshots = 0
+        self.rejected = 0
+
+    # -------------------------
+    # Links
+    # -------------------------
+
+    def start(self, targets=()):
+        """Start the sync timer and an outbound link per (host, port)"""
+        self.running = True
+        threading.Thread(target=self.run_timer, daemon=True).start()
+        for host, port in targets:
+            threading.Thread(target=self.run_link, args=(host, port), daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def trusts(self, pubkey_pem):
+        """Whether a key belongs to a node on the allowlist"""
+        return fingerprint(pubkey_pem) in self.trusted
+
+    def accept(self, pubkey_pem, out, conn, nonce=None):
+        """Inbound link from a trusted node that completed the handshake
+
+        A NONCE from its HELLO is answered first, proving our key to it.
+        """
+        link = Link(fingerprint(pubkey_pem), out, conn)
+        with self.lock:
+            self.links[conn] = link
+            if isinstance(nonce, str) and len(nonce) <= MAX_NONCE:
+                out.send(Frame.text(f"PROOF {self.sign(proof_message(nonce))}"))
+            link.send("DIGEST", self.digest())
+        log.info("Node linked: %s", link.node)
+        return link
+
+    def drop(self, conn):
+        """Forget a link; True if conn was one"""
+        with self.lock:
+            link = self.links.pop(conn, None)
+        if link is None:
+            return False
+        log.info("Node link closed: %s", link.node)
+        return True
+
+    def run_link(self, host, port):
+        """Keep an outbound link up, reconnecting with exponential backoff"""
+        delay = RECONNECT_MIN
+        while self.running:
+            try:
+                sock, reader, node = self.open_link(host, port)
+            except (OSError, LinkError) as e:
+                log.warning("Link to %s:%d failed: %s", host, port, e)
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
+                continue
+
+            delay = RECONNECT_MIN
+            out = self.make_queue(sock)
+            link = Link(node, out, sock)
+            with self.lock:
+                self.links[sock] = link
+                link.send("DIGEST", self.digest())
+            log.info("Linked to node %s at %s:%d", node, host, port)
+            try:
+                for payload in reader.frames():
+                    line = str(payload, "utf-8").strip()
+                    if line:
+                        self.dispatch(self.handle, link, line)
+            except (OSError, UnicodeDecodeError, RuntimeError):
+                pass  # RuntimeError: the event loop is gone, we are shutting down
+            finally:
+                self.drop(sock)
+                out.close()
+                sock.close()
+            time.sleep(delay)
+
+    def open_link(self, host, port):
+        """Authenticate to another node and it to us; returns (socket, reader, its node ID)"""
+        sock = socket.create_connection((host, port), timeout=10)
+        try:
+            reader = FrameReader(sock)
+            nonce = secrets.token_hex(32)
+            sock.sendall(f"HELLO {self.node_pem} NODE NONCE={nonce}\n".encode())
+            line = reader.readline() or "connection closed"
+            if not line.startswith("CHALLENGE "):
+                raise LinkError(line)
+            sock.sendall(f"RESPONSE {self.sign(line.split(' ', 1)[1])}\n".encode())
+
+            lines = [reader.readline() or "connection closed"]
+            if not lines[0].startswith("WELCOME "):
+                raise LinkError(lines[0])
+            while PEM_END not in lines[-1]:
+                line = reader.readline()
+                if line is None:
+                    raise LinkError("connection closed")
+                lines.append(line)
+            options = lines[-1].split(PEM_END, 1)[1].split()
+            if "NODE=1" not in options:
+                raise LinkError("remote does not accept node links")
+
+            welcome = "\n".join(lines)
+            pem = welcome[len("WELCOME "):welcome.index(PEM_END) + len(PEM_END)]
+            node = fingerprint(pem)
+            if node == self.node:
+                raise LinkError("refusing to link to ourselves")
+            if node not in self.trusted:
+                raise LinkError(f"node {node} is not trusted")
+            proof = reader.readline() or "connection closed"
+            if not proof.startswith("PROOF ") or not self.verify(
+                pem, proof_message(nonce), proof.split(" ", 1)[1].strip()
+            ):
+                raise LinkError(f"node {node} failed our challenge")
+            sock.settimeout(None)
+            return sock, reader, node
+        except BaseException:
+            sock.close()
+            raise
+
+    def handle(self, link, line):
+        """One line from a link"""
+        kind, _, body = line.partition(" ")
+        handler = {
+            "GOSSIP": self.on_gossip,
+            "DIGEST": self.on_digest,
+            "PULL": self.on_pull,
+            "DELTA": self.on_delta,
+        }.get(kind)
+        try:
+            data = json.loads(body)
+            if handler is None:
+                raise ValueError(f"unknown link message {kind!r}")
+            with self.lock:
+                if link.conn in self.links:
+                    handler(link, data)
+        except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+            self.rejected += 1
+            log.warning("Bad message from node %s: %s", link.node, e)
+
+    # -------------------------
+    # Chat Gossip
+    # -------------------------
+
+    def publish(self, message):
+        """Gossip a chat message that originated here"""
+        envelope = {
+            "id": secrets.token_hex(8),
+            "origin": self.node,
+            "hops": 0,
+            "msg": {
+                field: message[field]
+                for field in CHAT_FIELDS + OPTIONAL_FIELDS if field in message
+            },
+        }
+        with self.lock:
+            self.seen.add(envelope["id"])
+            self.published += 1
+            self.forward(envelope, None)
+
+    def forward(self, envelope, source):
+        """Send one GOSSIP frame, encoded once, to every link but `source`"""
+        frame = None
+        for link in self.links.values():
+            if link is source:
+                continue
+            if frame is None:
+                frame = Frame.text(f"GOSSIP {json.dumps(envelope)}")
+            link.out.send(frame)
+            self.forwarded += 1
+
+    def on_gossip(self, link, envelope):
+        msg = envelope["msg"]
+        if not isinstance(envelope["id"], str) or not integer(envelope["hops"]):
+            raise ValueError("malformed gossip envelope")
+        if not isinstance(msg, dict) or msg.get("type") != "CHAT" or not all(
+            isinstance(msg.get(field), str) for field in CHAT_FIELDS
+        ) or not all(isinstance(msg.get(field, ""), str) for field in OPTIONAL_FIELDS):
+            raise ValueError("malformed gossip message")
+        # Held to the limit a local CHAT gets, so relaying cannot build a
+        # frame our clients refuse
+        if any(message_too_long(msg[field]) for field in CHAT_FIELDS + OPTIONAL_FIELDS if field in msg):
+            raise ValueError("gossip message too long")
+        if not self.seen.add(envelope["id"]):
+            self.duplicates += 1
+            return
+
+        self.received += 1
+        self.deliver({
+            field: msg[field] for field in CHAT_FIELDS + OPTIONAL_FIELDS if field in msg
+        })
+        if envelope["hops"] + 1 < MAX_HOPS:
+            envelope["hops"] += 1
+            self.forward(envelope, link)
+
+    # -------------------------
+    # Peer List Sync
+    # -------------------------
+
+    def local_join(self, pubkey_pem, summary):
+        """A peer authenticated on this node"""
+        with self.lock:
+            self.local.apply(self.local.version + 1, fingerprint(pubkey_pem), summary)
+
+    def local_leave(self, pubkey_pem):
+        with self.lock:
+            self.local.apply(self.local.version + 1, fingerprint(pubkey_pem), None)
+
+    def digest(self):
+        """{node: [version, heartbeat]} for this node and every node we know"""
+        digest = {self.node: [self.local.version, self.local.beat]}
+        for node, table in self.tables.items():
+            digest[node] = [table.version, table.beat]
+        return digest
+
+    def run_timer(self):
+        while self.running:
+            time.sleep(SYNC_INTERVAL)
+            try:
+                self.dispatch(self.tick)
+            except RuntimeError:
+                return  # event loop closed
+
+    def tick(self):
+        """Heartbeat, expire silent nodes and send our digest to every link"""
+        now = time.monotonic()
+        with self.lock:
+            self.local.beat += 1
+            stale = [n for n, t in self.tables.items() if now - t.alive > NODE_TTL]
+            for node in stale:
+                self.expired[node] = self.tables.pop(node).beat
+            if len(self.expired) > SEEN_LIMIT:
+                self.expired.clear()
+            if self.links:
+                frame = Frame.text(f"DIGEST {json.dumps(self.digest())}")
+                for link in self.links.values():
+                    link.out.send(frame)
+        if stale:
+            log.warning("Nodes expired: %s", ", ".join(stale))
+            self.changed()
+
+    def on_digest(self, link, digest):
+        entries = [(node, *entry) for node, entry in digest.items()]
+        if not all(len(entry) == 3 and integer(entry[1]) and integer(entry[2]) for entry in entries):
+            raise ValueError("malformed digest")
+        now = time.monotonic()
+        for node, version, beat in entries:
+            if node == self.node:
+                continue
+            table = self.tables.get(node)
+            if table is None:
+                # Only a heartbeat newer than the one it expired with brings a node back
+                if beat <= self.expired.get(node, -1):
+                    continue
+                self.expired.pop(node, None)
+                table = self.tables[node] = PeerTable(node)
+            if beat > table.beat:
+                table.beat = beat
+                table.alive = now
+            # One outstanding pull per table per interval, whichever link offered it
+            if version > table.version and now - table.pulled >= SYNC_INTERVAL:
+                table.pulled = now
+                self.pulls += 1
+                link.send("PULL", {"node": node, "since": table.version})
+
+    def on_pull(self, link, request):
+        node = request["node"]
+        if not integer(request["since"]):
+            raise ValueError("malformed pull")
+        table = self.local if node == self.node else self.tables.get(node)
+        if table is None:
+            return
+        changes = table.since(request["since"])
+        if changes is None:
+            self.snapshots += 1
+            link.send("DELTA", {
+                "node": node, "version": table.version, "snapshot": table.peers
+            })
+        else:
+            self.deltas += 1
+            link.send("DELTA", {
+                "node": node, "since": request["since"], "version": table.version,
+                "changes": changes
+            })
+
+    def on_delta(self, link, delta):
+        """Check the whole delta before storing any of it"""
+        table = self.tables.get(delta["node"])
+        if table is None:
+            return
+        if not integer(delta["version"]):
+            raise ValueError("malformed delta version")
+        if "snapshot" in delta:
+            if not isinstance(delta["snapshot"], dict):
+                raise ValueError("malformed snapshot")
+            snapshot = {
+                check_peer_id(peer): check_summary(summary)
+                for peer, summary in delta["snapshot"].items()
+            }
+            table.pulled = 0.0
+            if delta["version"] <= table.version:
+                return
+            table.replace(delta["version"], snapshot)
+        else:
+            if not isinstance(delta["changes"], list):
+                raise ValueError("malformed changes")
+            changes = []
+            for version, peer, summary in delta["changes"]:
+                if not integer(version):
+                    raise ValueError("malformed change version")
+                changes.append((
+                    version, check_peer_id(peer), None if summary is None else check_summary(summary)
+                ))
+            table.pulled = 0.0
+            if delta["since"] != table.version:
+                return  # raced with another pull; the next digest retries
+            for change in changes:
+                table.apply(*change)
+        self.changed()
+
+    def remote_peers(self, role=None):
+        """PEERS entries for peers connected to other nodes"""
+        with self.lock:
+            return [
+                dict(summary, node=node)
+                for node, table in self.tables.items()
+                for summary in table.peers.values()
+                if role is None or summary.get("role") == role
+            ]
+
+    def peer_tables(self):
+        """{node: {peer fingerprint: summary}} for every node we know"""
+        with self.lock:
+            return {node: dict(table.peers) for node, table in self.tables.items()}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "node": self.node,
+                "links": len(self.links),
+                "nodes": len(self.tables),
+                "remote_peers": sum(len(t.peers) for t in self.tables.values()),
+                "published": self.published,
+                "received": self.received,
+                "duplicates": self.duplicates,
+                "forwarded": self.forwarded,
+                "seen": len(self.seen),
+                "pulls": self.pulls,
+                "deltas": self.deltas,
+                "snapshots": self.snapshots,
+                "rejected": self.rejected,
+                "trusted": len(self.trusted),
+            }
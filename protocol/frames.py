@@ -0,0 +1,133 @@
+"""
+PURE Protocol message frames
+- A Frame is a server message serialized exactly once
+- Every recipient's outbound queue shares the same immutable bytes
+- Length-prefixed peers get the same payload re-framed once, not once per peer
+- Compact-encoding peers share one packed form built on first use
+- CachedFrame keeps read-mostly replies (PEERS, HISTORY) encoded until invalidated
+- MAX_MESSAGE bounds chat text from peers and other nodes alike
+"""
+
+import json
+import threading
+import time
+
+from compact import encode_message
+from framing import HEADER, LENGTH
+
+MAX_MESSAGE = 64 * 1024  # most bytes a chat message may take once escaped into JSON
+
+
+def message_too_long(message):
+    """True if the text would pass MAX_MESSAGE once escaped into a JSON string
+
+    Inbound lines may be up to MAX_FRAME, and escaping can make them longer
+    than the MAX_FRAME every client enforces on what we send.
+    """
+    # No character escapes to more than 12 bytes (a surrogate pair), so most
+    # messages are cleared without encoding them
+    if len(message) * 12 <= MAX_MESSAGE:
+        return False
+    return len(json.dumps(message)) > MAX_MESSAGE
+
+
+class Frame:
+    """An encoded, newline-terminated server message shared by all recipients"""
+
+    __slots__ = ("data", "view", "prefixed", "message", "packed")
+
+    def __init__(self, data, message=None):
+        self.data = data
+        self.view = memoryview(data)
+        self.prefixed = None  # LENGTH encoding, built on first use
+        self.message = message  # source dict, if the frame was built from one
+        self.packed = None  # compact encoding; False if there is none
+
+    @classmethod
+    def from_message(cls, message):
+        """Serialize a JSON message once"""
+        return cls((json.dumps(message) + "\n").encode(), message)
+
+    @classmethod
+    def text(cls, line):
+        """Wrap a plain text reply such as PONG or ERR"""
+        return cls(f"{line}\n".encode())
+
+    def encoded(self, framing):
+        """Wire bytes for a peer using `framing`"""
+        if framing != LENGTH:
+            return self.view
+        prefixed = self.prefixed
+        if prefixed is None:
+            # Racing builders produce identical bytes, so no lock is needed
+            payload = self.view[:-1]
+            prefixed = self.prefixed = memoryview(HEADER.pack(len(payload)) + payload)
+        return prefixed
+
+    def compact(self):
+        """(LENGTH-framed compact encoding, sender ids it uses), or None
+
+        Only CHAT, HISTORY and PEERS have a compact form; everything else is
+        sent to compact peers exactly as to the others.
+        """
+        packed = self.packed
+        if packed is None:
+            message = self.message
+            if message is None and self.data[:1] == b"{":
+                # Spliced from encoded records, e.g. a HISTORY page read from the log
+                message = json.loads(self.data)
+            encoded = encode_message(message) if message is not None else None
+            if encoded is None:
+                packed = False
+            else:
+                payload, used = encoded
+                packed = (memoryview(HEADER.pack(len(payload)) + payload), used)
+            self.packed = packed
+        return packed or None
+
+    def __len__(self):
+        return len(self.data)
+
+
+class CachedFrame:
+    """Frame rebuilt only after invalidate(), or once older than max_age seconds"""
+
+    def __init__(self, build, max_age=None):
+        self.build = build
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.version = 0
+        self.frame = None
+        self.built_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        """Return the cached frame, rebuilding it if the state changed"""
+        with self.lock:
+            frame = self.frame
+            if frame is not None and (
+                self.max_age is None or time.time() - self.built_at < self.max_age
+            ):
+                self.hits += 1
+                return frame
+            version = self.version
+            self.misses += 1
+
+        frame = Frame.from_message(self.build())
+
+        with self.lock:
+            # Only keep it if nothing changed while we were building
+            if version == self.version:
+                self.frame = frame
+                self.built_at = time.time()
+        return frame
+
+    def invalidate(self):
+        """Drop the cached frame; the next get() rebuilds it"""
+        with self.lock:
+            self.version += 1
+            self.frame = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
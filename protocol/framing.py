@@ -0,0 +1,165 @@
+"""
+PURE Protocol wire framing
+- TEXT: newline-terminated UTF-8 lines, what every client has always spoken
+- LENGTH: 4-byte big-endian length prefix, then the payload; any bytes allowed
+- Negotiated with FRAMING=len in HELLO and acknowledged in WELCOME
+- Readers recv_into one reusable buffer and hand out memoryview slices
+"""
+
+import struct
+
+TEXT = "text"
+LENGTH = "len"
+FRAMINGS = (TEXT, LENGTH)
+
+HEADER = struct.Struct(">I")  # payload length
+MAX_FRAME = 1024 * 1024  # largest payload (or text line) a peer may send
+BUFFER_SIZE = 64 * 1024  # initial receive buffer; grows up to MAX_FRAME
+
+
+class FrameError(Exception):
+    """Peer sent a frame we refuse to buffer"""
+
+
+def encode(payload, framing):
+    """Frame one payload (bytes) for the wire"""
+    if framing == LENGTH:
+        return HEADER.pack(len(payload)) + payload
+    return payload + b"\n"
+
+
+class FrameReader:
+    """Reads frames from a blocking socket into one reusable buffer
+
+    Data lands in the buffer through recv_into; complete frames are returned
+    as memoryview slices of it, valid until the next call. Consumed bytes are
+    only moved when the free space at the end runs out, so a burst of small
+    frames costs one copy per buffer-full rather than one per frame.
+    """
+
+    def __init__(self, sock, framing=TEXT, size=BUFFER_SIZE, max_frame=MAX_FRAME):
+        self.sock = sock
+        self.framing = framing  # may be switched between frames, e.g. after WELCOME
+        self.max_frame = max_frame
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first unconsumed byte
+        self.end = 0  # one past the last received byte
+        self.scanned = 0  # text mode: bytes already searched for a newline
+        self.recvs = 0
+
+    def fill(self, needed):
+        """Receive until at least `needed` unconsumed bytes are buffered
+
+        Returns False if the peer closed the connection first.
+        """
+        if self.start + needed > len(self.buffer):
+            self.compact(needed)
+        while self.end - self.start < needed:
+            received = self.sock.recv_into(self.view[self.end:])
+            if not received:
+                return False
+            self.recvs += 1
+            self.end += received
+        return True
+
+    def compact(self, needed):
+        """Move unconsumed bytes to the front, growing the buffer if too small"""
+        pending = self.end - self.start
+        if needed > len(self.buffer):
+            grown = bytearray(max(needed, 2 * len(self.buffer)))
+            grown[:pending] = self.view[self.start:self.end]
+            self.buffer = grown
+            self.view = memoryview(grown)
+        else:
+            self.view[:pending] = self.view[self.start:self.end]
+        self.scanned -= self.start
+        self.start = 0
+        self.end = pending
+
+    def read(self):
+        """Next payload as a memoryview, or None at end of stream"""
+        if self.framing == LENGTH:
+            return self.read_length()
+        return self.read_line()
+
+    def read_length(self):
+        if not self.fill(HEADER.size):
+            return None
+        (length,) = HEADER.unpack_from(self.buffer, self.start)
+        if length > self.max_frame:
+            raise FrameError(f"frame of {length} bytes exceeds {self.max_frame}")
+        if not self.fill(HEADER.size + length):
+            return None
+        begin = self.start + HEADER.size
+        self.start = begin + length
+        return self.view[begin:self.start]
+
+    def read_line(self):
+        while True:
+            position = self.buffer.find(b"\n", max(self.start, self.scanned), self.end)
+            if position >= 0:
+                line = self.view[self.start:position]
+                self.start = self.scanned = position + 1
+                return line
+            self.scanned = self.end
+            pending = self.end - self.start
+            if pending >= self.max_frame:
+                raise FrameError(f"line longer than {self.max_frame} bytes")
+            # Ask for one more byte than we have; fill() grows the buffer if needed
+            if not self.fill(pending + 1):
+                return None
+
+    def frames(self):
+        """Yield payloads until end of stream
+
+        Walks every complete frame already buffered before touching the
+        socket again, which keeps the per-frame cost to a find or an unpack
+        and a slice. The framing must not change while this runs.
+        """
+        unpack = HEADER.unpack_from
+        while True:
+            buffer, view, start, end = self.buffer, self.view, self.start, self.end
+            if self.framing == LENGTH:
+                while end - start >= HEADER.size:
+                    (length,) = unpack(buffer, start)
+                    stop = start + HEADER.size + length
+                    if length > self.max_frame or stop > end:
+                        break
+                    yield view[start + HEADER.size:stop]
+                    start = stop
+            else:
+                find = buffer.find
+                while True:
+                    position = find(b"\n", start, end)
+                    if position < 0:
+                        break
+                    yield view[start:position]
+                    start = position + 1
+            self.start = self.scanned = start
+
+            # Incomplete (or oversized) frame left: let read() wait and check it
+            payload = self.read()
+            if payload is None:
+                return
+            yield payload
+
+    def readline(self):
+        """Next text line, decoded and stripped, or None at end of stream"""
+        line = self.read()
+        return None if line is None else str(line, "utf-8").strip()
+
+
+async def read_frame(reader, framing):
+    """Next payload from an asyncio StreamReader, or None at end of stream"""
+    if framing == LENGTH:
+        try:
+            header = await reader.readexactly(HEADER.size)
+            (length,) = HEADER.unpack(header)
+            if length > MAX_FRAME:
+                raise FrameError(f"frame of {length} bytes exceeds {MAX_FRAME}")
+            return await reader.readexactly(length)
+        except EOFError:
+            return None
+    line = await reader.readline()
+    return line or None
@@ -0,0 +1,60 @@
+"""
+PURE Protocol chat history
+- Fixed-capacity ring buffer with O(1) append and eviction
+- Messages are addressed by a monotonic sequence number
+- Range queries jump straight to a sequence number instead of scanning
+"""
+
+import threading
+
+
+class ChatRing:
+    """Ring buffer holding the most recent `capacity` chat messages"""
+
+    def __init__(self, capacity, first_seq=1):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.next_seq = first_seq
+        self.start_seq = first_seq  # oldest sequence number ever stored
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    @property
+    def first_seq(self):
+        """Oldest sequence number still held"""
+        return max(self.start_seq, self.next_seq - self.capacity)
+
+    @property
+    def last_seq(self):
+        """Newest sequence number handed out, or first_seq - 1 when empty"""
+        return self.next_seq - 1
+
+    def append(self, message):
+        """Store a message, overwriting the oldest once full; returns its seq"""
+        with self.lock:
+            seq = self.next_seq
+            message["seq"] = seq
+            self.slots[seq % self.capacity] = message
+            self.next_seq = seq + 1
+            return seq
+
+    def store(self, message):
+        """Store a message that already carries its seq, e.g. one numbered elsewhere"""
+        with self.lock:
+            seq = message["seq"]
+            self.slots[seq % self.capacity] = message
+            self.next_seq = max(self.next_seq, seq + 1)
+            return seq
+
+    def since(self, since_seq, limit):
+        """Up to `limit` messages with seq > since_seq, oldest first"""
+        with self.lock:
+            start = max(since_seq + 1, self.first_seq)
+            end = min(self.next_seq, start + max(limit, 0))
+            return [self.slots[seq % self.capacity] for seq in range(start, end)]
+
+    def latest(self, count):
+        """The newest `count` messages, oldest first"""
+        return self.since(self.last_seq - count, count)
@@ -0,0 +1,74 @@
+"""
+PURE Protocol public key cache
+- Parsed public key objects keyed by the SHA-256 digest of their PEM
+- LRU eviction past a size bound, entries expire after a TTL
+- Returning peers skip PEM parsing and key construction on reconnect
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.backends import default_backend
+
+MAX_KEYS = 4096
+KEY_TTL = 3600.0  # seconds
+
+
+def key_digest(pubkey_pem):
+    """Full SHA-256 of a PEM public key; federation.fingerprint is the short ID"""
+    return hashlib.sha256(pubkey_pem.encode()).digest()
+
+
+class KeyCache:
+    """LRU + TTL cache of parsed public keys"""
+
+    def __init__(self, max_size=MAX_KEYS, ttl=KEY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key_digest -> (expires_at, key)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, pubkey_pem):
+        """Parsed key for a PEM, loading and caching it on a miss"""
+        fp = key_digest(pubkey_pem)
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(fp)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(fp)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[fp]
+                self.expirations += 1
+            self.misses += 1
+
+        # Parse outside the lock; invalid PEMs raise and are never cached
+        key = serialization.load_pem_public_key(
+            pubkey_pem.encode(),
+            backend=default_backend()
+        )
+
+        with self.lock:
+            self.entries[fp] = (now + self.ttl, key)
+            self.entries.move_to_end(fp)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,74 @@
+"""
+PURE Protocol logging
+- Leveled logging for the server and its components ("pure.*" loggers)
+- Callers only enqueue a record; a listener thread does the blocking writes
+- The listener is stopped around fork() and restarted on both sides, so
+  forked workers and verification processes keep logging
+- Level markers keep the familiar [*] / [-] prefixes
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LEVELS = ("debug", "info", "warning", "error")
+MARKS = {
+    logging.DEBUG: "[.]",
+    logging.INFO: "[*]",
+    logging.WARNING: "[-]",
+    logging.ERROR: "[!]",
+    logging.CRITICAL: "[!]",
+}
+
+root = logging.getLogger("pure")
+listener = None
+output = None
+paused = False  # listener stopped for a fork in progress
+
+
+class MarkFormatter(logging.Formatter):
+    """HH:MM:SS [*] message"""
+
+    def format(self, record):
+        record.mark = MARKS.get(record.levelno, "[?]")
+        return super().format(record)
+
+
+def start(level="info", stream=None):
+    """Route every "pure.*" logger through a queue to a listener thread"""
+    global listener, output
+    stop()
+    output = stream or output or sys.stdout
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(output)
+    handler.setFormatter(MarkFormatter("%(asctime)s %(mark)s %(message)s", "%H:%M:%S"))
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+
+
+def stop():
+    """Write out everything queued so far and stop the listener"""
+    global listener
+    if listener:
+        listener.stop()
+        listener = None
+
+
+def before_fork():
+    """A forked child must not inherit a listener thread it does not have"""
+    global paused
+    paused = listener is not None
+    stop()
+
+
+def after_fork():
+    if paused:
+        start(root.level)
+
+
+os.register_at_fork(before=before_fork, after_in_parent=after_fork, after_in_child=after_fork)
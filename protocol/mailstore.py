@@ -0,0 +1,257 @@
+"""
+PURE Protocol offline mailboxes
+- Chat on the default channel is held for authenticated peers that went
+  away, keyed by public key fingerprint, and handed over in MAILBOX frames
+  when they authenticate again; a mailbox closes only once all of it is
+  queued
+- Every message is stored once however many peers are away: a mailbox is
+  only the position of the first message its peer missed
+- Each mailbox owes at most a quota of messages; older ones are dropped for
+  it and the count is reported with the delivery
+- Messages stay in memory up to a byte budget, then spill to one
+  append-only file; the file is compacted once most of it is no longer
+  owed to anybody, or truncated once none of it is
+- A clean shutdown spills everything and writes an index, so mailboxes
+  survive a restart; after a crash they start empty
+"""
+
+import json
+import os
+import struct
+import threading
+from array import array
+from collections import deque
+from itertools import islice
+
+from peerstore import write_json_atomic
+
+HEADER = struct.Struct(">I")  # payload length of a spilled record
+MAX_MESSAGES = 10000  # most messages one mailbox holds
+MAX_MAILBOXES = 10000  # mailboxes kept; opening another evicts the oldest
+MEMORY_BYTES = 1024 * 1024  # held messages kept in memory before spilling
+COMPACT_BYTES = 1024 * 1024  # dead bytes at the head of the file worth rewriting
+
+
+class MailStore:
+    """Messages held for peers that are away, in posting order"""
+
+    def __init__(self, directory, max_messages=MAX_MESSAGES, max_mailboxes=MAX_MAILBOXES,
+                 memory_bytes=MEMORY_BYTES, compact_bytes=COMPACT_BYTES):
+        self.directory = directory
+        self.path = os.path.join(directory, "spill.log")
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_messages = max_messages
+        self.max_mailboxes = max_mailboxes
+        self.memory_limit = memory_bytes
+        self.compact_bytes = compact_bytes
+        self.boxes = {}  # key -> position of its first message; oldest mailbox first
+        self.tail = 0  # position the next message gets
+        self.first = 0  # oldest position still owed to a mailbox
+        self.disk_base = 0  # position of the first record in the file
+        self.disk_end = 0  # positions below this are in the file, the rest in memory
+        self.offsets = array("Q")  # file offset of each record, from disk_base
+        self.file_size = 0
+        self.memory = deque()  # payloads from disk_end on
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.closed = False  # sessions still ending after close() change nothing
+        self.posted = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.spills = 0
+        self.compactions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    # -------------------------
+    # Mailboxes
+    # -------------------------
+
+    def open(self, key):
+        """Start holding messages for a peer that went away"""
+        with self.lock:
+            if self.closed or key in self.boxes:
+                return
+            if len(self.boxes) >= self.max_mailboxes:
+                del self.boxes[next(iter(self.boxes))]
+                self.evicted += 1
+            self.boxes[key] = self.tail
+            self.trim()
+
+    def post(self, payload):
+        """Hold an encoded message for every open mailbox"""
+        with self.lock:
+            if self.closed or not self.boxes:
+                return
+            self.memory.append(payload)
+            self.memory_bytes += len(payload)
+            self.tail += 1
+            self.posted += 1
+            self.trim()
+            if self.memory_bytes > self.memory_limit:
+                self.spill()
+
+    def peek(self, key):
+        """(payloads, dropped) held for a peer, or None if it has no mailbox
+
+        The mailbox stays open until release(), so nothing is lost if the
+        delivery fails halfway.
+        """
+        with self.lock:
+            if self.closed:
+                return None
+            start = self.boxes.get(key)
+            if start is None:
+                return None
+            first = max(start, self.tail - self.max_messages)
+            return self.read(first), first - start
+
+    def release(self, key, held):
+        """Close a mailbox once what peek() returned has been queued for its peer"""
+        with self.lock:
+            if self.closed or self.boxes.pop(key, None) is None:
+                return
+            self.delivered += len(held[0])
+            self.dropped += held[1]
+            self.trim()
+
+    # -------------------------
+    # Storage
+    # -------------------------
+
+    def trim(self):
+        """Forget what no mailbox is owed any more"""
+        if self.boxes:
+            # Mailboxes are kept in opening order, so the first starts earliest
+            first = max(self.boxes[next(iter(self.boxes))], self.tail - self.max_messages)
+        else:
+            first = self.tail
+        self.first = first
+        if first >= self.disk_end:
+            if self.file_size:
+                self.reset_file()
+            while self.disk_end < first:
+                self.memory_bytes -= len(self.memory.popleft())
+                self.disk_end += 1
+            self.disk_base = self.disk_end
+            return
+        dead = self.offsets[first - self.disk_base]
+        if dead >= self.compact_bytes and dead * 2 >= self.file_size:
+            self.compact()
+
+    def spill(self):
+        """Move every message in memory to the end of the file, in one write"""
+        position = self.file_size
+        for payload in self.memory:
+            self.offsets.append(position)
+            position += HEADER.size + len(payload)
+        self.file.write(b"".join(HEADER.pack(len(p)) + p for p in self.memory))
+        self.file.flush()
+        self.file_size = position
+        self.disk_end = self.tail
+        self.memory.clear()
+        self.memory_bytes = 0
+        self.spills += 1
+
+    def read(self, first):
+        """Payloads from position `first` to the newest"""
+        payloads = []
+        if first < self.disk_end:
+            start = self.offsets[first - self.disk_base]
+            data = os.pread(self.file.fileno(), self.file_size - start, start)
+            position = 0
+            while position < len(data):
+                (length,) = HEADER.unpack_from(data, position)
+                position += HEADER.size
+                payloads.append(data[position:position + length])
+                position += length
+        skip = max(0, first - self.disk_end)
+        payloads.extend(islice(self.memory, skip, None))
+        return payloads
+
+    def compact(self):
+        """Rewrite the file without the records nobody is owed"""
+        index = self.first - self.disk_base
+        start = self.offsets[index]
+        data = os.pread(self.file.fileno(), self.file_size - start, start)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        self.file.close()
+        self.file = open(self.path, "a+b")
+        self.offsets = array("Q", (offset - start for offset in self.offsets[index:]))
+        self.disk_base = self.first
+        self.file_size = len(data)
+        self.compactions += 1
+
+    def reset_file(self):
+        self.file.truncate(0)
+        self.offsets = array("Q")
+        self.file_size = 0
+
+    # -------------------------
+    # Restarts
+    # -------------------------
+
+    def load(self):
+        """Pick up the mailboxes a clean shutdown left; anything else starts empty"""
+        state = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = None
+            # Only valid until the file changes again
+            os.unlink(self.index_path)
+        self.file = open(self.path, "a+b")
+        if state is None:
+            self.file.truncate(0)
+            return
+        data = os.pread(self.file.fileno(), os.path.getsize(self.path), 0)
+        position = 0
+        while position + HEADER.size <= len(data):
+            (length,) = HEADER.unpack_from(data, position)
+            if position + HEADER.size + length > len(data):
+                break
+            self.offsets.append(position)
+            position += HEADER.size + length
+        if position != len(data) or len(self.offsets) != state["tail"] - state["base"]:
+            self.offsets = array("Q")
+            self.file.truncate(0)
+            return
+        self.file_size = position
+        self.tail = self.disk_end = state["tail"]
+        self.first = self.disk_base = state["base"]
+        self.boxes = dict(state["boxes"])
+        self.trim()
+
+    def close(self):
+        """Spill what is left and record the mailboxes for the next start"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.memory:
+                self.spill()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            write_json_atomic(self.index_path, {
+                "tail": self.tail, "base": self.disk_base, "boxes": list(self.boxes.items())
+            })
+
+    def stats(self):
+        return {
+            "mailboxes": len(self.boxes),
+            "held": self.tail - self.first,
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.file_size,
+            "posted": self.posted,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "spills": self.spills,
+            "compactions": self.compactions,
+        }
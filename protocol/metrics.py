@@ -0,0 +1,265 @@
+"""
+PURE Protocol metrics
+- Lightweight latency accumulators for hot-path timings
+- HDR-style log-linear histograms: O(1) record, percentiles within ~3%
+- Named counters and gauges, rendered for STATS and as Prometheus text
+- Labeled per-peer series, exported to Prometheus only
+- Optional local HTTP endpoint serving /metrics
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BITS = 6  # 2**(SUB_BITS-1) = 32 linear buckets per power of two
+MAX_BITS = 36  # largest recordable value, in microseconds (~19 hours)
+PERCENTILES = (50, 90, 99, 99.9)
+# Cumulative bucket bounds exported to Prometheus, in seconds
+EXPORT_BOUNDS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def label_value(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Log-linear buckets over integer microseconds; callers serialize record()
+
+    Values below 2**SUB_BITS get a bucket each; above that every power of two
+    is split into 2**(SUB_BITS-1) equal buckets, so a bucket is never wider
+    than ~3% of the values it holds.
+    """
+
+    def __init__(self, sub_bits=SUB_BITS, max_bits=MAX_BITS):
+        self.sub_bits = sub_bits
+        self.half = sub_bits - 1
+        self.max_value = (1 << max_bits) - 1
+        self.counts = [0] * (self.index(self.max_value) + 1)
+
+    def index(self, value):
+        exponent = max(0, value.bit_length() - self.sub_bits)
+        return (exponent << self.half) + (value >> exponent)
+
+    def bounds(self, index):
+        """[low, high) of the values that land in a bucket"""
+        if index < 1 << self.sub_bits:
+            return index, index + 1
+        exponent = (index >> self.half) - 1
+        mantissa = index - (exponent << self.half)
+        return mantissa << exponent, (mantissa + 1) << exponent
+
+    def record(self, value):
+        self.counts[self.index(min(value, self.max_value))] += 1
+
+    def merge(self, counts):
+        """Add the bucket counts of a histogram with the same layout"""
+        for index, count in enumerate(counts):
+            if count:
+                self.counts[index] += count
+
+    def percentiles(self, points, total):
+        """Upper bound of the bucket holding each percentile"""
+        results = {}
+        targets = sorted(points)
+        seen = 0
+        i = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            while i < len(targets) and seen >= total * targets[i] / 100:
+                results[targets[i]] = self.bounds(index)[1]
+                i += 1
+            if i == len(targets):
+                break
+        return results
+
+    def cumulative(self, limits):
+        """Values below each limit, for Prometheus `le` buckets"""
+        results = []
+        seen = 0
+        index = 0
+        for limit in limits:
+            while index < len(self.counts) and self.bounds(index)[1] <= limit:
+                seen += self.counts[index]
+                index += 1
+            results.append(seen)
+        return results
+
+
+class LatencyStats:
+    """Count, total, min and max of observed durations in seconds, plus a histogram"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.histogram = Histogram()
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if seconds > self.max:
+                self.max = seconds
+            self.histogram.record(int(seconds * 1e6))
+
+    def stats(self):
+        """Summary in milliseconds"""
+        with self.lock:
+            points = self.histogram.percentiles(PERCENTILES, self.count)
+        summary = {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "min_ms": (self.min or 0.0) * 1000,
+            "max_ms": self.max * 1000,
+        }
+        for point in PERCENTILES:
+            # Bucket bounds overshoot the slowest sample at most by the bucket width
+            value = min(points.get(point, 0) / 1e6, self.max)
+            summary[f"p{point:g}_ms"] = value * 1000
+        return summary
+
+    def state(self):
+        """Picklable copy, e.g. to merge results from several processes"""
+        with self.lock:
+            return self.count, self.total, self.min, self.max, list(self.histogram.counts)
+
+    def merge(self, state):
+        """Fold in another LatencyStats' state()"""
+        count, total, low, high, counts = state
+        if not count:
+            return
+        with self.lock:
+            self.count += count
+            self.total += total
+            if self.min is None or low < self.min:
+                self.min = low
+            self.max = max(self.max, high)
+            self.histogram.merge(counts)
+
+    def export(self):
+        """(cumulative counts for EXPORT_BOUNDS, count, sum in seconds)"""
+        limits = [int(bound * 1e6) for bound in EXPORT_BOUNDS]
+        with self.lock:
+            return self.histogram.cumulative(limits), self.count, self.total
+
+
+class Metrics:
+    """Named counters, gauges and latency histograms for one server process"""
+
+    def __init__(self, prefix="pure"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}  # name -> value
+        self.live = {}  # counter name -> callable adding what is not yet counted
+        self.gauges = {}  # name -> callable
+        self.latencies = {}  # name -> LatencyStats
+        self.labeled = {}  # name -> (kind, label, callable returning {label value: value})
+        self.help = {}
+
+    def counter(self, name, help, live=None):
+        """Declare a counter; `live` adds a running total kept elsewhere"""
+        self.counters.setdefault(name, 0)
+        if live:
+            self.live[name] = live
+        self.help[name] = help
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def gauge(self, name, read, help):
+        """Declare a gauge read from `read()` whenever metrics are collected"""
+        self.gauges[name] = read
+        self.help[name] = help
+
+    def series(self, name, kind, label, read, help):
+        """Declare a counter or gauge with one sample per `label` value
+
+        `read()` returns {label value: value}. Labeled series grow with the
+        number of peers, so they go to /metrics only and not into STATS.
+        """
+        self.labeled[name] = (kind, label, read)
+        self.help[name] = help
+
+    def latency(self, name, help, stats=None):
+        """Declare a latency histogram, optionally one owned by another component"""
+        stats = self.latencies[name] = stats or self.latencies.get(name) or LatencyStats()
+        self.help[name] = help
+        return stats
+
+    def value(self, name):
+        value = self.counters[name]
+        live = self.live.get(name)
+        return value + live() if live else value
+
+    def snapshot(self):
+        """Every metric as plain JSON-ready values, for STATS"""
+        return {
+            "counters": {name: self.value(name) for name in self.counters},
+            "gauges": {name: read() for name, read in self.gauges.items()},
+            "latency_ms": {name: stats.stats() for name, stats in self.latencies.items()},
+        }
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for name in self.counters:
+            full = f"{self.prefix}_{name}_total"
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} counter",
+                      f"{full} {self.value(name)}"]
+        for name, read in self.gauges.items():
+            full = f"{self.prefix}_{name}"
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} gauge",
+                      f"{full} {read()}"]
+        for name, (kind, label, read) in self.labeled.items():
+            full = f"{self.prefix}_{name}_total" if kind == "counter" else f"{self.prefix}_{name}"
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} {kind}"]
+            for key, value in read().items():
+                lines.append(f'{full}{{{label}="{label_value(key)}"}} {value}')
+        for name, stats in self.latencies.items():
+            full = f"{self.prefix}_{name}_seconds"
+            cumulative, count, total = stats.export()
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} histogram"]
+            for bound, seen in zip(EXPORT_BOUNDS, cumulative):
+                lines.append(f'{full}_bucket{{le="{bound:g}"}} {seen}')
+            lines += [f'{full}_bucket{{le="+Inf"}} {count}', f"{full}_sum {total:.6f}",
+                      f"{full}_count {count}"]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics; anything else is a 404"""
+
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line each
+
+
+def serve_http(metrics, host, port):
+    """Serve Prometheus text on http://host:port/metrics from a daemon thread"""
+    handler = type("Handler", (MetricsHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
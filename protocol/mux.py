@@ -0,0 +1,139 @@
+"""
+PURE Protocol connection multiplexing
+- Negotiated with MUX in HELLO (requires FRAMING=len), acknowledged as MUX=1
+- The identity that did the HELLO is stream 0; more identities are opened
+  on the same connection with "@<sid> HELLO <pem>" or "@<sid> RESUME <ticket>"
+  and authenticate with their own CHALLENGE/RESPONSE
+- Every frame after WELCOME may carry a stream tag: "@<sid> <payload>" from
+  the client, "@<sid>[,<sid>...] <payload>" from the server; untagged
+  frames belong to stream 0
+- Chat fan-out to several identities on one connection is a single frame
+  tagged with all of their stream ids
+"""
+
+MUX = "MUX"
+MAX_STREAMS = 256  # identities per connection, stream 0 included
+MAX_STREAM_ID = 65535
+
+
+class StreamError(Exception):
+    """Malformed stream tag"""
+
+
+def parse_tag(line):
+    """'@3 CHAT hi' -> (3, 'CHAT hi'); untagged lines belong to stream 0"""
+    if not line.startswith("@"):
+        return 0, line
+    tag, _, rest = line.partition(" ")
+    try:
+        sid = int(tag[1:])
+    except ValueError:
+        raise StreamError(f"bad stream tag {tag[:16]}")
+    if not 0 <= sid <= MAX_STREAM_ID:
+        raise StreamError(f"stream id out of range: {sid}")
+    return sid, rest
+
+
+def split_tag(payload):
+    """b'@1,4 {...}' -> ([1, 4], b'{...}') for frames the server sent"""
+    if payload[:1] != b"@":
+        return [0], payload
+    end = payload.index(b" ")
+    return [int(sid) for sid in bytes(payload[1:end]).split(b",")], payload[end + 1:]
+
+
+def stream_tag(sids):
+    """Tag prefixed to a payload addressed to the given streams"""
+    return b"@" + b",".join(b"%d" % sid for sid in sids) + b" "
+
+
+class Stream:
+    """Registry key of an identity opened on a multiplexed connection
+
+    Stands in for the connection object wherever peers are indexed by
+    connection, so each identity registers, times out and leaves on its own.
+    """
+
+    __slots__ = ("session", "sid")
+
+    def __init__(self, session, sid):
+        self.session = session
+        self.sid = sid
+
+    def __repr__(self):
+        return f"<stream {self.sid}>"
+
+
+class StreamOutbound:
+    """One identity's view of the connection's outbound queue
+
+    Frames are queued on the shared queue with this stream's tag; queue
+    depth, bytes and syscalls are counted there, once per connection.
+    """
+
+    queue = ()
+    queued_bytes = 0
+    bytes_sent = 0
+    high_water = 0
+    messages = 0
+    syscalls = 0
+    batches = 0
+    compressor = None  # the shared queue compresses, if anything does
+
+    def __init__(self, session, sid):
+        self.mux = session
+        self.stream = sid
+        self.tag = stream_tag([sid])
+        self.closed = False
+        self.enqueued = 0
+
+    def send(self, frame):
+        if self.closed:
+            return False
+        self.enqueued += 1
+        return self.mux.out.send(frame, self.tag)
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.closed = True
+        self.mux.out.abort()
+
+    def stats(self):
+        return {"stream": self.stream, "enqueued": self.enqueued}
+
+
+class MuxSession:
+    """Identities sharing one authenticated connection, by stream id"""
+
+    def __init__(self, out, addr, max_streams=MAX_STREAMS):
+        self.out = out  # the connection's OutboundQueue; stream 0 writes to it untagged
+        self.addr = addr
+        self.max_streams = max_streams
+        self.streams = {}  # sid -> Peer, stream 0 included
+        self.pending = {}  # sid -> handshake awaiting RESPONSE; None while verifying
+        self.closed = False
+        self.opened = 0
+        self.frames = 0  # fan-out frames sent to this connection
+        self.merged = 0  # deliveries that rode along in another stream's frame
+
+    def __len__(self):
+        return len(self.streams) + len(self.pending)
+
+    def send(self, frame, sids):
+        """Queue one frame for every listed stream"""
+        self.frames += 1
+        self.merged += len(sids) - 1
+        if sids == [0]:
+            return self.out.send(frame)
+        return self.out.send(frame, stream_tag(sids))
+
+    def stats(self):
+        return {
+            "streams": len(self.streams),
+            "pending": len(self.pending),
+            "opened": self.opened,
+            "frames": self.frames,
+            "merged": self.merged,
+        }
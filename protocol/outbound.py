@@ -0,0 +1,405 @@
+"""
+PURE Protocol outbound queues
+- One bounded queue of shared Frames per peer, drained by a dedicated writer
+- Backpressure policy decides what happens when a peer falls behind
+- Frames are queued already encoded for the peer's wire framing and encoding
+- Writers coalesce queued frames into one scatter/gather write per batch,
+  optionally waiting a short window for a burst to gather
+- Frames for one identity of a multiplexed connection carry its stream tag
+- Negotiated compression deflates each batch in the writer, over the frames
+  that survived the backpressure policy
+- TCP_NODELAY / TCP_CORK control per connection
+- Per-peer counters for queue depth, drops, sends and write syscalls
+"""
+
+import asyncio
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from compact import JSON, COMPACT, senders
+from framing import HEADER, TEXT
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+TCP_DEFAULT = "default"  # leave Nagle as the engine set it
+TCP_NODELAY = "nodelay"  # every write goes out immediately
+TCP_CORK = "cork"  # hold partial segments while a batch is being written
+TCP_MODES = (TCP_DEFAULT, TCP_NODELAY, TCP_CORK)
+
+COALESCE_WINDOW = 0.0  # seconds a writer waits for a burst before writing
+COALESCE_BYTES = 64 * 1024  # queued bytes that end the wait; also the batch size
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+# Counters of queues that have closed, so totals survive disconnects
+closed_totals = {"messages": 0, "bytes": 0, "syscalls": 0, "batches": 0}
+
+
+def set_tcp_mode(sock, mode):
+    """Apply a TCP_MODES setting to a connected socket"""
+    if mode == TCP_NODELAY:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    elif mode == TCP_CORK:
+        # Corking replaces Nagle: the writer uncorks once its queue is empty
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def write_totals(queues):
+    """Write counters summed over closed queues and the given live ones"""
+    totals = dict(closed_totals)
+    for queue in queues:
+        totals["messages"] += queue.messages
+        totals["bytes"] += queue.bytes_sent
+        totals["syscalls"] += queue.syscalls
+        totals["batches"] += queue.batches
+    messages = totals["messages"]
+    totals["syscalls_per_message"] = totals["syscalls"] / messages if messages else 0.0
+    totals["messages_per_batch"] = messages / totals["batches"] if totals["batches"] else 0.0
+    return totals
+
+
+class Preamble(bytes):
+    """Connection state (e.g. sender definitions) queued ahead of a frame
+
+    The backpressure policy never drops a preamble: frames queued after it
+    may depend on it even if the frame it was queued for is dropped.
+    """
+
+
+class OutboundQueue:
+    """Bounded send queue shared by the engines; subclasses supply the writer"""
+
+    def __init__(self, limit=256, policy=DROP_OLDEST, window=COALESCE_WINDOW,
+                 max_bytes=COALESCE_BYTES, tcp_mode=TCP_DEFAULT):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown backpressure policy: {policy}")
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.limit = limit
+        self.policy = policy
+        self.window = window
+        self.max_bytes = max_bytes
+        self.cork = tcp_mode == TCP_CORK
+        self.corked = False
+        self.framing = TEXT  # switched once the handshake has negotiated one
+        self.encoding = JSON
+        self.known_senders = set()  # compact sender ids already defined to this peer
+        self.mux = None  # MuxSession when several identities share the connection
+        self.stream = 0  # stream id of the identity this queue writes for
+        self.compressor = None  # Compressor once COMPRESS was negotiated
+        self.raw_ahead = 0  # frames at the front queued before compression started
+        self.raw_batch = 0  # of which in the batch just taken
+        self.closed = False
+        self.enqueued = 0
+        self.sent = 0
+        self.messages = 0  # frames delivered, not counting preambles
+        self.bytes_sent = 0
+        self.syscalls = 0  # write and cork syscalls issued by the writer
+        self.batches = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.folded = False
+
+    def send(self, frame, tag=None):
+        """Queue a frame for the writer; returns False once the peer is gone
+
+        A stream tag (multiplexed connections only, always length-framed)
+        is spliced in between the length header and the payload.
+        """
+        if self.closed:
+            return False
+
+        if len(self.queue) >= self.limit:
+            if self.policy == DISCONNECT:
+                self.dropped += 1
+                self.abort()
+                return False
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return True
+            self.drop_oldest()
+
+        packed = frame.compact() if self.encoding == COMPACT else None
+        if packed is None:
+            data = frame.encoded(self.framing)
+        else:
+            data, used = packed
+            unknown = [sender_id for sender_id in used if sender_id not in self.known_senders]
+            if unknown:
+                self.known_senders.update(unknown)
+                preamble = Preamble(b"".join(
+                    HEADER.pack(len(definition)) + definition
+                    for definition in map(senders.definition, unknown)
+                ))
+                self.queue.append(preamble)
+                self.queued_bytes += len(preamble)
+        if tag:
+            data = HEADER.pack(len(tag) + len(data) - HEADER.size) + tag + data[HEADER.size:]
+        self.queue.append(data)
+        self.queued_bytes += len(data)
+        self.enqueued += 1
+        if len(self.queue) > self.high_water:
+            self.high_water = len(self.queue)
+        self.wake()
+        return True
+
+    def drop_oldest(self):
+        """Drop the oldest frame, keeping any preambles queued before it"""
+        kept = []
+        while self.queue and type(self.queue[0]) is Preamble:
+            kept.append(self.queue.popleft())
+        if self.queue:
+            self.queued_bytes -= len(self.queue.popleft())
+        if self.raw_ahead:
+            self.raw_ahead = max(0, self.raw_ahead - len(kept) - 1)
+        if kept:
+            # Merge so the queue never fills up with preambles alone
+            self.queue.appendleft(Preamble(b"".join(kept)))
+            if self.raw_ahead:
+                self.raw_ahead += 1
+
+    def take_batch(self):
+        """Pop queued data for one write: up to max_bytes and IOV_MAX buffers"""
+        queue = self.queue
+        batch = [queue.popleft()]
+        size = len(batch[0])
+        while queue and size < self.max_bytes and len(batch) < IOV_MAX:
+            data = queue.popleft()
+            batch.append(data)
+            size += len(data)
+        self.queued_bytes -= size
+        if self.compressor is None:
+            self.raw_batch = len(batch)
+        else:
+            self.raw_batch = min(self.raw_ahead, len(batch))
+            self.raw_ahead -= self.raw_batch
+        return batch, size
+
+    def start_compression(self, compressor):
+        """Compress every frame queued from now on; earlier ones go out as they are"""
+        self.raw_ahead = len(self.queue)
+        self.compressor = compressor
+
+    def compress_batch(self, batch, size):
+        """(buffers to write, their size) for a batch from take_batch()"""
+        compressor = self.compressor
+        raw = self.raw_batch
+        if compressor is None or raw == len(batch):
+            return batch, size
+        plain = batch[:raw]
+        buffers = plain + compressor.compress(batch[raw:], size - sum(map(len, plain)))
+        return buffers, sum(map(len, buffers))
+
+    def delivered(self, batch, size):
+        """Account for a batch the writer has handed to the kernel"""
+        self.batches += 1
+        self.sent += len(batch)
+        self.messages += sum(1 for data in batch if type(data) is not Preamble)
+        self.bytes_sent += size
+
+    def fold_totals(self):
+        """Add this queue's counters to closed_totals, once"""
+        if not self.folded:
+            self.folded = True
+            closed_totals["messages"] += self.messages
+            closed_totals["bytes"] += self.bytes_sent
+            closed_totals["syscalls"] += self.syscalls
+            closed_totals["batches"] += self.batches
+            if self.compressor:
+                self.compressor.fold_totals()
+
+    def stats(self):
+        """Snapshot of this peer's queue counters"""
+        return {
+            "depth": len(self.queue),
+            "high_water": self.high_water,
+            "limit": self.limit,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "syscalls": self.syscalls,
+            "syscalls_per_message": self.syscalls / self.messages if self.messages else 0.0,
+        }
+
+    def wake(self):
+        raise NotImplementedError
+
+    def close(self):
+        """Stop the writer; anything still queued is discarded"""
+        self.closed = True
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.fold_totals()
+        self.wake()
+
+    def abort(self):
+        """Close the queue and tear down the underlying connection"""
+        raise NotImplementedError
+
+
+class ThreadedOutbound(OutboundQueue):
+    """Outbound queue drained by a writer thread doing blocking sendmsg"""
+
+    def __init__(self, conn, limit=256, policy=DROP_OLDEST, window=COALESCE_WINDOW,
+                 max_bytes=COALESCE_BYTES, tcp_mode=TCP_DEFAULT):
+        super().__init__(limit, policy, window, max_bytes, tcp_mode)
+        self.conn = conn
+        self.lock = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, frame, tag=None):
+        with self.lock:
+            return super().send(frame, tag)
+
+    def wake(self):
+        self.lock.notify()
+
+    def start_compression(self, compressor):
+        with self.lock:
+            super().start_compression(compressor)
+
+    def close(self):
+        with self.lock:
+            super().close()
+
+    def abort(self):
+        self.closed = True
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.fold_totals()
+        self.lock.notify()
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def set_cork(self, on):
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(on))
+        self.corked = on
+        self.syscalls += 1
+
+    def run(self):
+        """Writer thread: drain the queue in coalesced batches until closed"""
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    if self.corked:
+                        break
+                    self.lock.wait()
+                if self.closed:
+                    return
+                if self.queue and self.window and self.queued_bytes < self.max_bytes:
+                    # Give a burst the chance to gather into one write
+                    deadline = time.monotonic() + self.window
+                    while not self.closed and self.queued_bytes < self.max_bytes:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.lock.wait(remaining)
+                    if self.closed:
+                        return
+                batch = self.take_batch() if self.queue else None
+
+            try:
+                if batch is None:
+                    # Queue drained: uncork so the tail of the burst goes out
+                    self.set_cork(False)
+                    continue
+                if self.cork and not self.corked:
+                    self.set_cork(True)
+                self.write_batch(*batch)
+            except OSError:
+                with self.lock:
+                    self.abort()
+                return
+
+    def write_batch(self, batch, size):
+        """One sendmsg for the whole batch, plus more only on partial writes"""
+        buffers, size = self.compress_batch(batch, size)
+        remaining = size
+        while True:
+            written = self.conn.sendmsg(buffers)
+            self.syscalls += 1
+            remaining -= written
+            if not remaining:
+                break
+            # Skip what went out and resume mid-buffer
+            index = 0
+            while written >= len(buffers[index]):
+                written -= len(buffers[index])
+                index += 1
+            buffers = [memoryview(buffers[index])[written:]] + buffers[index + 1:]
+        self.delivered(batch, size)
+
+
+class AsyncOutbound(OutboundQueue):
+    """Outbound queue drained by a writer task on the event loop
+
+    Each batch goes to the transport in one writelines() call; syscalls here
+    counts those calls, which is an upper bound on the sends the transport
+    makes for them.
+    """
+
+    def __init__(self, writer, limit=256, policy=DROP_OLDEST, window=COALESCE_WINDOW,
+                 max_bytes=COALESCE_BYTES, tcp_mode=TCP_DEFAULT):
+        super().__init__(limit, policy, window, max_bytes, tcp_mode)
+        self.writer = writer
+        self.ready = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def wake(self):
+        self.ready.set()
+
+    def abort(self):
+        self.closed = True
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.fold_totals()
+        self.ready.set()
+        self.writer.transport.abort()
+
+    def set_cork(self, on):
+        sock = self.writer.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(on))
+        self.corked = on
+        self.syscalls += 1
+
+    async def run(self):
+        """Writer task: hand queued batches to the transport, then wait for drain"""
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                if self.closed:
+                    return
+                if self.window and self.queued_bytes < self.max_bytes:
+                    # Give a burst the chance to gather into one write
+                    await asyncio.sleep(self.window)
+                    if self.closed:
+                        return
+
+                if self.cork and self.queue:
+                    self.set_cork(True)
+                while self.queue:
+                    batch, size = self.take_batch()
+                    buffers, size = self.compress_batch(batch, size)
+                    self.writer.writelines(buffers)
+                    self.syscalls += 1
+                    self.delivered(batch, size)
+                await self.writer.drain()
+                if self.corked:
+                    self.set_cork(False)
+        except (ConnectionError, OSError):
+            self.abort()
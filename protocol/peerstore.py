@@ -0,0 +1,117 @@
+"""
+PURE Protocol peer registry persistence
+- Registry changes only mark the store dirty; a background worker writes
+- Bursts of connects/disconnects coalesce into one write
+- Writes are atomic: temp file in the same directory, fsync, then rename
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from metrics import LatencyStats
+
+WRITE_INTERVAL = 0.5  # seconds a change may wait before it is written
+MAX_CHANGES = 100  # pending changes that force a write right away
+
+log = logging.getLogger("pure.peerstore")
+
+
+def write_json_atomic(path, data):
+    """Replace `path` with `data` so readers see the old or new file, never half"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".peers-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class PeerStore:
+    """Debounced writer for the peer registry file"""
+
+    def __init__(self, path, snapshot, interval=WRITE_INTERVAL, max_changes=MAX_CHANGES):
+        self.path = path
+        self.snapshot = snapshot  # callable returning the JSON-ready registry
+        self.interval = interval
+        self.max_changes = max_changes
+        self.lock = threading.Condition()
+        self.pending = 0
+        self.first_change = 0.0
+        self.closed = False
+        self.changes = 0
+        self.writes = 0
+        self.errors = 0
+        self.write_latency = LatencyStats()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self):
+        """Record a registry change; cheap enough for the connection hot path"""
+        with self.lock:
+            if not self.pending:
+                self.first_change = time.monotonic()
+            self.pending += 1
+            self.changes += 1
+            if self.pending == 1 or self.pending >= self.max_changes:
+                self.lock.notify()
+
+    def run(self):
+        """Worker thread: wait out the debounce window, then write once"""
+        while True:
+            with self.lock:
+                while not self.closed:
+                    if self.pending:
+                        remaining = self.first_change + self.interval - time.monotonic()
+                        if remaining <= 0 or self.pending >= self.max_changes:
+                            break
+                        self.lock.wait(remaining)
+                    else:
+                        self.lock.wait()
+                if self.closed:
+                    return
+                self.pending = 0
+            self.write()
+
+    def write(self):
+        """Snapshot the registry and replace the file atomically"""
+        start = time.perf_counter()
+        try:
+            write_json_atomic(self.path, self.snapshot())
+            self.writes += 1
+            self.write_latency.record(time.perf_counter() - start)
+        except Exception as e:
+            self.errors += 1
+            log.error("Error saving peers: %s", e)
+
+    def close(self):
+        """Stop the worker and write any pending changes"""
+        with self.lock:
+            self.closed = True
+            dirty = self.pending
+            self.pending = 0
+            self.lock.notify()
+        self.thread.join(timeout=5)
+        if dirty:
+            self.write()
+
+    def stats(self):
+        return {
+            "changes": self.changes,
+            "writes": self.writes,
+            "writes_saved": max(0, self.changes - self.writes),
+            "errors": self.errors,
+        }
@@ -0,0 +1,647 @@
+"""
+PURE Protocol asyncio client library
+- PureClient: one authenticated session, many of them per event loop
+- Messages arrive through an async iterator; PING and TICKET are handled inside
+- The private key is loaded once; signing runs off the event loop
+- Drops are retried with exponential backoff, resuming with a ticket when possible
+- After a reconnect it rejoins its channels and fetches the history it missed,
+  so the stream carries every chat message once, in seq order per channel
+- With mux=True more identities share the connection: open_stream() returns
+  a Stream that works like the client itself and is reopened on reconnect
+- watch_peers() keeps `roster` current from pushed PEERS deltas, resyncing
+  from the last version seen after a gap or a reconnect
+- compress=True asks the server to deflate what it sends (COMPRESS=zlib)
+- Chat the server held while this identity was away (MAILBOX) comes through
+  the stream like any other chat, once
+
+    async with PureClient("127.0.0.1", 9000) as client:
+        await client.chat("hello")
+        async for message in client:
+            print(message)
+
+    client = PureClient("127.0.0.1", 9000, mux=True)
+    await client.start()
+    bot = await client.open_stream(key_path="bot_private.pem")
+    await bot.chat("hello from the same socket")
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.backends import default_backend
+
+from compact import Decoder, JSON, COMPACT, is_packed
+from compress import Decompressor, COMPRESS, ZLIB
+from framing import FrameError, read_frame, encode, TEXT, LENGTH, MAX_FRAME
+from mux import MUX, split_tag
+
+PRIVATE_KEY_PATH = os.path.expanduser("~/.pure/keys/node_private.pem")
+PEM_END = "-----END PUBLIC KEY-----"
+DEFAULT_CHANNEL = "#general"
+
+RECONNECT_MIN = 0.5  # seconds before the first reconnect attempt
+RECONNECT_MAX = 30.0
+HISTORY_PAGE = 500  # messages asked for per HISTORY request while catching up
+TICKET_MARGIN = 5  # seconds of validity a ticket needs left to be worth trying
+
+# What ends a session and sends it through reconnect: I/O errors, and
+# anything unreadable from the server. An oversized text line surfaces as
+# ValueError from readline(); so do bad UTF-8, stream tags and packed payloads.
+LOST = (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, FrameError, ValueError)
+
+log = logging.getLogger("pure.client")
+
+
+class HandshakeRefused(ConnectionError):
+    """The server answered the handshake with something other than WELCOME"""
+
+    def __init__(self, line):
+        super().__init__(line or "connection closed")
+        self.retry_after = 0
+        if line and "retry-after=" in line:
+            try:
+                self.retry_after = int(line.rsplit("retry-after=", 1)[1].split()[0])
+            except ValueError:
+                pass
+
+
+def load_private_key(path=PRIVATE_KEY_PATH):
+    """Read an unencrypted PEM private key"""
+    with open(path, "rb") as f:
+        return serialization.load_pem_private_key(
+            f.read(),
+            password=None,
+            backend=default_backend()
+        )
+
+
+def public_pem(key):
+    """PEM string of a private key's public half, as sent in HELLO"""
+    return key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode().strip()
+
+
+def sign(key, challenge):
+    """Hex RSA-PSS signature of a CHALLENGE"""
+    return key.sign(
+        challenge.encode(),
+        padding.PSS(
+            mgf=padding.MGF1(hashes.SHA256()),
+            salt_length=padding.PSS.MAX_LENGTH
+        ),
+        hashes.SHA256()
+    ).hex()
+
+
+class Identity:
+    """One authenticated identity: its message stream, channels and catch-up
+
+    PureClient is the identity that owns the connection; a Stream is another
+    one multiplexed over it.
+    """
+
+    def __init__(self, key, invite=None):
+        self.key = key
+        self.pem = public_pem(key)
+        self.invite = invite
+        self.ticket = None  # (ticket, expiry) from the last session
+        self.last_seq = {}  # channel name -> newest seq delivered
+        self.channels = set()  # named channels to rejoin after a reconnect
+        self.catching_up = {}  # channel -> chats held back while paging its HISTORY
+        self.roster = None  # peer id -> PEERS entry, once watch_peers() was called
+        self.roster_id = None  # server roster our version belongs to
+        self.roster_version = 0
+        self.resyncing = False  # asked for missed roster deltas, waiting for them
+        self.messages = asyncio.Queue()
+        self.connected = asyncio.Event()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def hello(self):
+        """HELLO line for this identity, asking for a resumption ticket"""
+        hello = f"HELLO {self.pem}"
+        if self.invite:
+            hello += f" INVITE {self.invite}"
+        return hello + " TICKET"
+
+    def usable_ticket(self):
+        ticket = self.ticket
+        if ticket and ticket[1] > time.time() + TICKET_MARGIN:
+            return ticket[0]
+        return None
+
+    # -------------------------
+    # Commands
+    # -------------------------
+
+    def write(self, line):
+        raise NotImplementedError
+
+    async def drain(self):
+        raise NotImplementedError
+
+    async def send(self, line):
+        """Send one command line, waiting out a reconnect if one is under way"""
+        while True:
+            await self.connected.wait()
+            try:
+                self.write(line)
+                await self.drain()
+                return
+            except (ConnectionError, OSError):
+                self.connected.clear()  # the reader notices too and reconnects
+
+    async def chat(self, text, channel=None):
+        await self.send(f"CHAT {channel} {text}" if channel else f"CHAT {text}")
+
+    async def join(self, channel):
+        await self.send(f"JOIN {channel}")
+
+    async def leave(self, channel):
+        await self.send(f"LEAVE {channel}")
+
+    async def watch_peers(self):
+        """Subscribe to the server's peer roster; `roster` then follows it"""
+        self.roster = {}
+        self.resyncing = True
+        await self.send(self.subscribe_line())
+
+    def subscribe_line(self):
+        if self.roster_id:
+            return f"PEERS SUBSCRIBE {self.roster_id} {self.roster_version}"
+        return "PEERS SUBSCRIBE"
+
+    def resync(self):
+        """Rejoin our channels, then page through whatever was said while we were away"""
+        for channel in sorted(self.channels):
+            self.write(f"JOIN {channel}")
+        if self.roster is not None:
+            self.resyncing = True
+            self.write(self.subscribe_line())
+        self.catching_up = {}
+        for channel in [DEFAULT_CHANNEL, *sorted(self.channels)]:
+            if channel in self.last_seq:
+                self.catching_up[channel] = []
+                self.request_page(channel)
+
+    # -------------------------
+    # Incoming messages
+    # -------------------------
+
+    def receive(self, line):
+        """One text payload addressed to this identity"""
+        if line == "PING":
+            self.write("PONG")  # heartbeat; keeps an idle session open
+        elif line.startswith("TICKET "):
+            _, ticket, lifetime = line.split()
+            self.ticket = (ticket, time.time() + int(lifetime))
+        elif line.startswith("{"):
+            try:
+                self.deliver(json.loads(line))
+            except json.JSONDecodeError:
+                self.messages.put_nowait({"type": "TEXT", "text": line})
+        else:
+            if line.startswith("JOINED "):
+                channel = line.split()[1]
+                self.channels.add(channel)
+                # Everything said from here on is ours to catch up on
+                self.last_seq.setdefault(channel, 0)
+            elif line.startswith("LEFT "):
+                self.channels.discard(line.split()[1])
+            self.messages.put_nowait({"type": "TEXT", "text": line})
+
+    def deliver(self, message):
+        """Queue a message; HISTORY and MAILBOX replies are flattened into their CHATs"""
+        kind = message.get("type")
+        if kind == "CHAT":
+            self.deliver_chat(message, message.get("channel", DEFAULT_CHANNEL))
+        elif kind == "HISTORY":
+            self.deliver_history(message, message.get("channel", DEFAULT_CHANNEL))
+        elif kind == "MAILBOX":
+            # What the server held for us while we were away, oldest first
+            if message.get("dropped"):
+                log.warning("Mailbox overflowed: %d messages lost", message["dropped"])
+            for chat in message["messages"]:
+                self.deliver_chat(chat, DEFAULT_CHANNEL)
+        else:
+            if kind == "PEER":
+                self.apply_peer_delta(message)
+            elif kind == "PEERS" and "version" in message:
+                self.apply_roster(message)
+            self.messages.put_nowait(message)
+
+    def apply_roster(self, reply):
+        """Snapshot, or the deltas missed since the version we asked from"""
+        if self.roster is None:
+            return
+        if "peers" in reply:
+            self.roster = {entry["id"]: entry for entry in reply["peers"]}
+        else:
+            for delta in reply["changes"]:
+                if delta["version"] > self.roster_version:
+                    self.apply_change(delta)
+        self.roster_id = reply["roster"]
+        self.roster_version = reply["version"]
+        self.resyncing = False
+
+    def apply_peer_delta(self, delta):
+        """Apply a pushed delta in order; a gap asks for what was skipped"""
+        if self.roster is None or self.resyncing or delta["version"] <= self.roster_version:
+            return  # the reply we are waiting for covers it
+        if delta["version"] != self.roster_version + 1:
+            self.resyncing = True
+            self.write(self.subscribe_line())
+            return
+        self.apply_change(delta)
+        self.roster_version = delta["version"]
+
+    def apply_change(self, delta):
+        if delta["op"] == "leave":
+            self.roster.pop(delta["id"], None)
+        else:
+            self.roster[delta["peer"]["id"]] = delta["peer"]
+
+    def deliver_history(self, reply, channel):
+        """Pages we asked for carry first_seq; the greeting after WELCOME or
+        JOIN does not, and while catching up it may skip ahead, so it waits
+        """
+        held = self.catching_up.get(channel)
+        if held is not None and reply.get("first_seq") is None:
+            held.extend(reply.get("messages", []))
+            return
+        if held is not None and reply.get("last_seq", 0) < self.last_seq.get(channel, 0):
+            # The server restarted without this channel's history; its seqs
+            # start over, so anything it still has is new to us
+            log.info("History of %s restarted at the server, resyncing", channel)
+            self.last_seq[channel] = 0
+            self.request_page(channel)
+            return
+        for chat in reply.get("messages", []):
+            self.deliver_chat(chat, channel, direct=True)
+        if held is None:
+            return
+        if reply.get("messages") and self.last_seq.get(channel, 0) < reply.get("last_seq", 0):
+            self.request_page(channel)
+            return
+        # Caught up: release what arrived meanwhile, duplicates drop out
+        del self.catching_up[channel]
+        for chat in sorted(held, key=lambda m: m.get("seq") or 0):
+            self.deliver_chat(chat, channel)
+
+    def deliver_chat(self, message, channel, direct=False):
+        """Queue a chat once: anything at or below the newest seq seen is dropped"""
+        held = self.catching_up.get(channel)
+        if held is not None and not direct:
+            held.append(message)
+            return
+        seq = message.get("seq")
+        if seq is not None:
+            if seq <= self.last_seq.get(channel, 0):
+                return
+            self.last_seq[channel] = seq
+        self.messages.put_nowait(message)
+
+    def request_page(self, channel):
+        seq = self.last_seq.get(channel, 0)
+        if channel == DEFAULT_CHANNEL:
+            self.write(f"HISTORY {seq} {HISTORY_PAGE}")
+        else:
+            self.write(f"HISTORY {channel} {seq} {HISTORY_PAGE}")
+
+    def stats(self):
+        return {
+            "connected": self.connected.is_set(),
+            "channels": sorted(self.channels),
+            "catching_up": sorted(self.catching_up),
+            "last_seq": dict(self.last_seq),
+        }
+
+
+class PureClient(Identity):
+    """Auto-reconnecting session; iterate it for messages"""
+
+    def __init__(self, host, port, key=None, key_path=PRIVATE_KEY_PATH, invite=None,
+                 framing=TEXT, encoding=JSON, backoff_min=RECONNECT_MIN,
+                 backoff_max=RECONNECT_MAX, mux=False, compress=False):
+        super().__init__(key or load_private_key(key_path), invite)
+        self.host = host
+        self.port = port
+        if encoding == COMPACT or mux or compress:
+            framing = LENGTH  # packed or deflated payloads and stream tags need length framing
+        self.options = ""
+        if framing != TEXT:
+            self.options += f" FRAMING={framing}"
+        if encoding != JSON:
+            self.options += f" ENCODING={encoding}"
+        if mux:
+            self.options += f" {MUX}"
+        if compress:
+            self.options += f" {COMPRESS}={ZLIB}"
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+
+        self.reader = None
+        self.writer = None
+        self.framing = TEXT
+        self.decoder = None
+        self.decompressor = None  # set while the server compresses this connection
+        self.muxed = False  # the server accepted MUX on this connection
+        self.streams = {}  # sid -> Stream sharing the connection
+        self.next_sid = 1
+        self.closed = False
+        self.task = None
+        self.last_error = None
+        self.connects = 0
+        self.resumes = 0
+        self.reconnects = 0
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+
+    async def start(self):
+        """Connect in the background and wait for the first session"""
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        await self.connected.wait()
+
+    async def close(self):
+        self.closed = True
+        if self.writer:
+            self.writer.close()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        for stream in self.streams.values():
+            stream.messages.put_nowait(None)
+        self.messages.put_nowait(None)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open_stream(self, key=None, key_path=PRIVATE_KEY_PATH, invite=None):
+        """Authenticate another identity over this connection; needs mux=True"""
+        await self.connected.wait()
+        if not self.muxed:
+            raise HandshakeRefused("ERR server did not accept MUX")
+        stream = Stream(self, self.next_sid, key or load_private_key(key_path), invite)
+        self.next_sid += 1
+        self.streams[stream.sid] = stream
+        stream.begin()
+        try:
+            await stream.opened
+        except HandshakeRefused:
+            del self.streams[stream.sid]
+            raise
+        return stream
+
+    # -------------------------
+    # Connection
+    # -------------------------
+
+    async def run(self):
+        """Keep a session up until close(), reconnecting with exponential backoff"""
+        delay = self.backoff_min
+        while not self.closed:
+            try:
+                await self.open_session()
+            except (*LOST, HandshakeRefused) as e:
+                self.last_error = e
+                wait = max(delay, getattr(e, "retry_after", 0))
+                log.info("Connecting to %s:%d failed (%s), retrying in %.1fs",
+                         self.host, self.port, e, wait)
+                await asyncio.sleep(wait * random.uniform(0.8, 1.2))
+                delay = min(delay * 2, self.backoff_max)
+                continue
+
+            delay = self.backoff_min
+            try:
+                await self.read_loop()
+            except LOST as e:
+                self.last_error = e
+                log.info("Reading from %s:%d failed: %r", self.host, self.port, e)
+            self.connected.clear()
+            for stream in self.streams.values():
+                stream.connected.clear()
+            self.writer.close()
+            if not self.closed:
+                self.reconnects += 1
+                log.info("Connection to %s:%d lost, reconnecting", self.host, self.port)
+
+    async def open_session(self):
+        """RESUME with a ticket if we hold one, else a full handshake; then catch up"""
+        ticket = self.usable_ticket()
+        if ticket:
+            try:
+                await self.resume(ticket)
+            except HandshakeRefused:
+                self.ticket = None
+        if not self.connected.is_set():
+            await self.handshake()
+        self.connects += 1
+
+        # The server forgot our channels and streams with the old connection
+        self.resync()
+        for stream in self.streams.values():
+            stream.begin()
+
+    async def open_connection(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, limit=MAX_FRAME
+        )
+        self.framing = TEXT
+        self.decoder = Decoder()
+
+    async def resume(self, ticket):
+        await self.open_connection()
+        self.writer.write(f"RESUME {ticket}{self.options}\n".encode())
+        await self.read_welcome()
+        self.resumes += 1
+
+    async def handshake(self):
+        await self.open_connection()
+        self.writer.write(f"{self.hello()}{self.options}\n".encode())
+
+        line = (await self.reader.readline()).decode().strip()
+        if not line.startswith("CHALLENGE "):
+            self.writer.close()
+            raise HandshakeRefused(line)
+        # RSA signing takes milliseconds; keep the loop serving other sessions
+        loop = asyncio.get_running_loop()
+        signature = await loop.run_in_executor(None, sign, self.key, line.split(" ", 1)[1])
+        self.writer.write(f"RESPONSE {signature}\n".encode())
+        await self.read_welcome()
+
+    async def read_welcome(self):
+        """WELCOME <server key> [options]; switches to the accepted framing"""
+        line = (await self.reader.readline()).decode()
+        if not line.startswith("WELCOME "):
+            self.writer.close()
+            raise HandshakeRefused(line.strip())
+        while PEM_END not in line:
+            more = await self.reader.readline()
+            if not more:
+                raise HandshakeRefused(None)
+            line = more.decode()
+        options = line.split(PEM_END, 1)[1].split()
+        self.framing = LENGTH if f"FRAMING={LENGTH}" in options else TEXT
+        self.muxed = f"{MUX}=1" in options
+        self.decompressor = Decompressor() if f"{COMPRESS}={ZLIB}" in options else None
+        self.connected.set()
+
+    def write(self, line):
+        self.writer.write(encode(line.encode(), self.framing))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    # -------------------------
+    # Incoming frames
+    # -------------------------
+
+    async def read_loop(self):
+        while not self.closed:
+            payload = await read_frame(self.reader, self.framing)
+            if payload is None:
+                return
+            if self.decompressor:
+                for inflated in self.decompressor.payloads(payload):
+                    self.dispatch(inflated)
+            else:
+                self.dispatch(payload)
+
+    def dispatch(self, payload):
+        """Hand one payload to the identities it is addressed to"""
+        if self.muxed:
+            # One frame may be addressed to several of our identities
+            sids, payload = split_tag(payload)
+            targets = [self.streams.get(sid) if sid else self for sid in sids]
+        else:
+            targets = [self]
+
+        if is_packed(payload):
+            message = self.decoder.decode(payload)
+            if message is not None:
+                for i, target in enumerate(targets):
+                    if target is not None:
+                        target.deliver(dict(message) if i else message)
+            return
+
+        line = payload.decode().strip()
+        if not line:
+            return
+        for target in targets:
+            if target is not None:
+                target.receive(line)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(
+            connects=self.connects,
+            resumes=self.resumes,
+            reconnects=self.reconnects,
+            streams=len(self.streams),
+        )
+        return stats
+
+
+class Stream(Identity):
+    """Another identity authenticated over a PureClient's connection
+
+    Opened with "@sid HELLO" (or RESUME with its own ticket) and reopened by
+    the client after every reconnect; iterate it for its own messages.
+    """
+
+    def __init__(self, client, sid, key, invite=None):
+        super().__init__(key, invite)
+        self.client = client
+        self.sid = sid
+        self.prefix = f"@{sid} "
+        self.opened = asyncio.get_running_loop().create_future()
+        self.resuming = False
+        self.closed = False
+
+    def write(self, line):
+        self.client.write(self.prefix + line)
+
+    async def drain(self):
+        await self.client.drain()
+
+    async def close(self):
+        """Detach this identity; the connection and the other streams stay"""
+        self.closed = True
+        self.client.streams.pop(self.sid, None)
+        if self.connected.is_set():
+            self.write("CLOSE")
+        self.connected.clear()
+        self.messages.put_nowait(None)
+
+    def begin(self):
+        """Open the stream on the client's current connection"""
+        if self.closed or not self.client.connected.is_set():
+            return
+        ticket = self.usable_ticket()
+        self.resuming = ticket is not None
+        self.write(f"RESUME {ticket}" if ticket else self.hello())
+
+    def receive(self, line):
+        if self.connected.is_set():
+            if line.startswith("CLOSED"):
+                # Dropped by the server (e.g. idle); come back like after a reconnect
+                self.connected.clear()
+                self.begin()
+                return
+            super().receive(line)
+        elif line.startswith("CHALLENGE "):
+            asyncio.create_task(self.answer(line.split(" ", 1)[1]))
+        elif line.startswith("WELCOME "):
+            self.connected.set()
+            if not self.opened.done():
+                self.opened.set_result(self)
+            self.resync()
+        elif line.startswith("ERR "):
+            self.refused(HandshakeRefused(line))
+
+    async def answer(self, challenge):
+        writer = self.client.writer
+        loop = asyncio.get_running_loop()
+        signature = await loop.run_in_executor(None, sign, self.key, challenge)
+        if self.client.writer is writer:  # not from a connection that has since dropped
+            self.write(f"RESPONSE {signature}")
+
+    def refused(self, error):
+        if self.resuming:
+            self.ticket = None
+            self.begin()
+        elif not self.opened.done():
+            self.opened.set_exception(error)
+        else:
+            # Reopening after a reconnect failed; try again later
+            log.info("Stream %d refused (%s), retrying", self.sid, error)
+            delay = max(self.client.backoff_min, error.retry_after)
+            asyncio.get_running_loop().call_later(delay, self.begin)
+
+    def stats(self):
+        return dict(super().stats(), sid=self.sid)
@@ -0,0 +1,191 @@
+"""
+PURE Protocol rate limiting and admission control
+- Token bucket per peer and command: lazy refill, O(1) per decision
+- Only the first refusal after an allowed command is answered, so a flood
+  cannot turn into an equal flood of ERR replies
+- Admission controller sheds expensive work while outbound queue depth or
+  process CPU is over its threshold; the inputs are sampled on a timer, so
+  the per-command check is a single flag test
+"""
+
+import logging
+import math
+import time
+
+# command -> (tokens per second, burst); "*" covers every other command
+LIMITS = {
+    "CHAT": (10.0, 30),
+    "PEERS": (2.0, 10),
+    "HISTORY": (5.0, 20),
+    "STATS": (1.0, 5),
+    "JOIN": (2.0, 16),
+    "*": (20.0, 60),
+}
+# Replies to the server's own traffic are never limited
+EXEMPT = ("PONG",)
+# Work refused while shedding; PING, PONG and LEAVE stay cheap and always pass
+SHED = ("HELLO", "CHAT", "PEERS", "HISTORY", "JOIN", "STATS")
+
+SAMPLE_INTERVAL = 0.5  # seconds between load samples
+MAX_QUEUED = 50000  # outbound frames queued across all peers before shedding
+MAX_CPU = 0  # process CPU percent (100 = one core) before shedding; 0 disables
+RECOVER = 0.8  # shedding stops once every input is below this share of its threshold
+MAX_RETRY_AFTER = 10  # seconds
+
+log = logging.getLogger("pure.ratelimit")
+
+
+def parse_limit(spec):
+    """CMD=RATE/BURST (or CMD=off) -> (command, (rate, burst) or None)"""
+    command, sep, value = spec.partition("=")
+    command = command.strip().upper()
+    if not sep or not command:
+        raise ValueError(f"expected CMD=RATE/BURST, got {spec!r}")
+    if value.strip().lower() in ("off", "0"):
+        return command, None
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    burst = int(burst) if burst else max(1, math.ceil(rate))
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"rate and burst must be positive, got {spec!r}")
+    return command, (rate, burst)
+
+
+def limit_label(limit):
+    """(rate, burst) as RATE/BURST, None as off"""
+    return f"{limit[0]:g}/{limit[1]}" if limit else "off"
+
+
+class TokenBucket:
+    """Refilled lazily from the time of the last call, so idle peers cost nothing"""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "warned")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+        self.warned = False  # refusal already reported since the last allowed call
+
+    def take(self, now):
+        """Spend one token; returns 0.0, or seconds until one is available"""
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens >= 1.0:
+            self.tokens = tokens - 1.0
+            self.warned = False
+            return 0.0
+        self.tokens = tokens
+        return (1.0 - tokens) / self.rate
+
+
+class RateLimiter:
+    """Per-command limits; each peer carries its own buckets"""
+
+    def __init__(self, limits=None):
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.allowed = {}
+        self.limited = {}
+        self.silenced = 0  # refusals dropped without a reply
+
+    def configure(self, command, limit):
+        """Set one command's limit; None leaves the command unlimited"""
+        self.limits[command] = limit
+
+    def check(self, buckets, command, now):
+        """None when allowed; otherwise the retry-after hint in seconds, or 0
+        when this peer was already told and the refusal should be silent
+        """
+        if command in EXEMPT:
+            return None
+        key = command if command in self.limits else "*"
+        limit = self.limits.get(key)
+        if limit is None:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(limit[0], limit[1], now)
+        wait = bucket.take(now)
+        if not wait:
+            self.allowed[key] = self.allowed.get(key, 0) + 1
+            return None
+        self.limited[key] = self.limited.get(key, 0) + 1
+        if bucket.warned:
+            self.silenced += 1
+            return 0
+        bucket.warned = True
+        return max(1, math.ceil(wait))
+
+    def stats(self):
+        return {
+            "limits": {k: limit_label(v) for k, v in sorted(self.limits.items())},
+            "allowed": dict(self.allowed),
+            "limited": dict(self.limited),
+            "silenced": self.silenced,
+        }
+
+
+class Admission:
+    """Global load shedding driven by periodic samples of queue depth and CPU"""
+
+    def __init__(self, measure_queued, max_queued=MAX_QUEUED, max_cpu=MAX_CPU):
+        self.measure_queued = measure_queued
+        self.max_queued = max_queued
+        self.max_cpu = max_cpu
+        self.shedding = False
+        self.since = 0.0  # when the current shedding episode began
+        self.queued = 0
+        self.cpu = 0.0
+        self.last_wall = time.monotonic()
+        self.last_cpu = time.process_time()
+        self.samples = 0
+        self.episodes = 0
+        self.shed = {}
+
+    def enabled(self):
+        return bool(self.max_queued or self.max_cpu)
+
+    def sample(self):
+        """Refresh the load inputs and switch shedding on or off"""
+        wall, cpu = time.monotonic(), time.process_time()
+        if wall > self.last_wall:
+            self.cpu = 100.0 * (cpu - self.last_cpu) / (wall - self.last_wall)
+        self.last_wall, self.last_cpu = wall, cpu
+        self.queued = self.measure_queued()
+        self.samples += 1
+
+        queue_load = self.queued / self.max_queued if self.max_queued else 0.0
+        cpu_load = self.cpu / self.max_cpu if self.max_cpu else 0.0
+        load = max(queue_load, cpu_load)
+        if not self.shedding and load > 1.0:
+            self.shedding = True
+            self.since = wall
+            self.episodes += 1
+            log.warning("Overloaded (%d frames queued, cpu %.0f%%), shedding load", self.queued, self.cpu)
+        elif self.shedding and load < RECOVER:
+            self.shedding = False
+            log.info("Load back to normal after %.1fs", wall - self.since)
+
+    def admit(self, command):
+        """False when the command should be refused with ERR busy"""
+        if not self.shedding or command not in SHED:
+            return True
+        self.shed[command] = self.shed.get(command, 0) + 1
+        return False
+
+    def retry_after(self):
+        """Whole seconds; grows with the length of the overload"""
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(time.monotonic() - self.since)))
+
+    def stats(self):
+        return {
+            "shedding": self.shedding,
+            "queued": self.queued,
+            "cpu_pct": round(self.cpu, 1),
+            "max_queued": self.max_queued,
+            "max_cpu": self.max_cpu,
+            "samples": self.samples,
+            "episodes": self.episodes,
+            "shed": dict(self.shed),
+        }
@@ -0,0 +1,133 @@
+"""
+PURE Protocol peer registry
+- Compact __slots__ Peer records instead of per-peer dicts
+- Secondary indexes by connection and by role
+"""
+
+import threading
+
+
+class Peer:
+    """One registered peer and, while connected, its live session"""
+
+    __slots__ = (
+        "pubkey", "ip", "port", "role", "last_seen",
+        "challenge_passed", "conn", "out", "channels", "timer", "buckets"
+    )
+
+    def __init__(self, pubkey, ip, port, role, last_seen,
+                 challenge_passed=False, conn=None):
+        self.pubkey = pubkey
+        self.ip = ip
+        self.port = port
+        self.role = role
+        self.last_seen = last_seen
+        self.challenge_passed = challenge_passed
+        self.conn = conn
+        self.out = None  # OutboundQueue, set once authenticated
+        self.channels = set()  # channel names this connection joined
+        self.timer = None  # heartbeat timer while connected
+        self.buckets = None  # command -> TokenBucket while connected
+
+    @classmethod
+    def from_dict(cls, pubkey, data):
+        """Rebuild a peer saved by to_dict()"""
+        return cls(
+            pubkey, data["ip"], data["port"], data["role"], data["last_seen"],
+            data.get("challenge_passed", False)
+        )
+
+    def to_dict(self):
+        """Persistent fields, without connection objects"""
+        return {
+            "ip": self.ip,
+            "port": self.port,
+            "role": self.role,
+            "last_seen": self.last_seen,
+            "challenge_passed": self.challenge_passed
+        }
+
+    def summary(self):
+        """Entry in a PEERS reply"""
+        return {
+            "pubkey": self.pubkey[:32],
+            "role": self.role,
+            "last_seen": self.last_seen
+        }
+
+
+class PeerRegistry:
+    """Peers keyed by pubkey, indexed by connection and role"""
+
+    def __init__(self):
+        self.by_key = {}  # pubkey -> Peer
+        self.by_conn = {}  # conn -> Peer
+        self.by_role = {}  # role -> {pubkey: Peer}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def __contains__(self, pubkey):
+        return pubkey in self.by_key
+
+    def get(self, pubkey):
+        return self.by_key.get(pubkey)
+
+    def peers(self):
+        """Snapshot of every registered peer"""
+        return list(self.by_key.values())
+
+    def connected(self):
+        """Snapshot of every peer with a live connection"""
+        return list(self.by_conn.values())
+
+    def by_connection(self, conn):
+        return self.by_conn.get(conn)
+
+    def with_role(self, role):
+        """Snapshot of the peers holding `role`"""
+        return list(self.by_role.get(role, {}).values())
+
+    def roles(self):
+        return list(self.by_role)
+
+    def add(self, peer):
+        """Register a peer, replacing any earlier record for its pubkey
+
+        A replaced record keeps its connection entry until that connection
+        goes away, so the older session still receives broadcasts.
+        """
+        with self.lock:
+            old = self.by_key.get(peer.pubkey)
+            if old is not None:
+                self.unindex_role(old)
+            self.by_key[peer.pubkey] = peer
+            self.by_role.setdefault(peer.role, {})[peer.pubkey] = peer
+            if peer.conn is not None:
+                self.by_conn[peer.conn] = peer
+
+    def remove_conn(self, conn):
+        """Drop a connection; returns its peer if that peer was also removed"""
+        with self.lock:
+            peer = self.by_conn.pop(conn, None)
+            if peer is None or self.by_key.get(peer.pubkey) is not peer:
+                return None
+            del self.by_key[peer.pubkey]
+            self.unindex_role(peer)
+            return peer
+
+    def unindex_role(self, peer):
+        members = self.by_role.get(peer.role)
+        if members is not None and members.get(peer.pubkey) is peer:
+            del members[peer.pubkey]
+            if not members:
+                del self.by_role[peer.role]
+
+    def touch(self, peer, now):
+        """Record activity; idle checks run from the peer's heartbeat timer"""
+        peer.last_seen = now
+
+    def snapshot(self):
+        """JSON-ready registry for persistence"""
+        return {pubkey: peer.to_dict() for pubkey, peer in list(self.by_key.items())}
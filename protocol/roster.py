@@ -0,0 +1,162 @@
+"""
+PURE Protocol peer roster subscriptions
+- PEERS SUBSCRIBE answers with one versioned snapshot, then pushes join,
+  leave and role deltas, each carrying the roster version it produces
+- Kept incrementally: every source of PEERS entries (this process, the other
+  workers, each federated node) holds its own entries, so a change costs
+  O(1) and nobody rebuilds or polls the full list
+- A bounded change log answers "PEERS SUBSCRIBE <roster> <version>" with just
+  the missed deltas; an older version or another roster gets a new snapshot
+"""
+
+import secrets
+import threading
+from collections import deque
+
+from frames import Frame
+
+CHANGE_LOG = 1024  # deltas kept for resyncs
+JOIN = "join"
+LEAVE = "leave"
+ROLE = "role"
+
+
+class Roster:
+    """Versioned PEERS list that pushes its changes to subscribed peers"""
+
+    def __init__(self, send, log_size=CHANGE_LOG):
+        self.send = send  # send(peers, frame): queue one frame for several peers
+        self.id = secrets.token_hex(4)  # versions are only comparable within one roster
+        self.version = 0
+        self.entries = {}  # peer id -> summary as listed
+        self.holders = {}  # peer id -> {source: summary}; the first holder is listed
+        self.held = {}  # source -> peer ids it holds
+        self.changes = deque(maxlen=log_size)  # delta messages, oldest first
+        self.subscribers = set()
+        self.lock = threading.RLock()
+        self.cached = None  # (version, snapshot frame)
+        self.snapshots = 0
+        self.resyncs = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # -------------------------
+    # Sources
+    # -------------------------
+
+    def put(self, source, peer_id, summary):
+        """A source lists a peer, or updates its entry"""
+        with self.lock:
+            self.holders.setdefault(peer_id, {})[source] = summary
+            self.held.setdefault(source, set()).add(peer_id)
+            self.refresh(peer_id)
+
+    def drop(self, source, peer_id):
+        """A source no longer lists a peer"""
+        with self.lock:
+            holders = self.holders.get(peer_id)
+            if holders is None or holders.pop(source, None) is None:
+                return
+            self.held[source].discard(peer_id)
+            if not holders:
+                del self.holders[peer_id]
+            self.refresh(peer_id)
+
+    def replace(self, source, summaries):
+        """Make a source hold exactly `summaries` (peer id -> summary)"""
+        with self.lock:
+            for peer_id in self.held.get(source, set()) - summaries.keys():
+                self.drop(source, peer_id)
+            for peer_id, summary in summaries.items():
+                if self.holders.get(peer_id, {}).get(source) != summary:
+                    self.put(source, peer_id, summary)
+            if not self.held.get(source, True):
+                del self.held[source]
+
+    def sources(self):
+        with self.lock:
+            return list(self.held)
+
+    def refresh(self, peer_id):
+        """Publish whatever changed in the listed entry of one peer"""
+        old = self.entries.get(peer_id)
+        holders = self.holders.get(peer_id)
+        if not holders:
+            if old is not None:
+                del self.entries[peer_id]
+                self.publish({"type": "PEER", "op": LEAVE, "id": peer_id})
+            return
+        summary = self.entries[peer_id] = dict(next(iter(holders.values())), id=peer_id)
+        if old is None:
+            self.publish({"type": "PEER", "op": JOIN, "peer": summary})
+        elif old.get("role") != summary.get("role"):
+            self.publish({"type": "PEER", "op": ROLE, "peer": summary})
+        # A new last_seen alone is not worth a delta; snapshots carry it
+
+    def publish(self, delta):
+        self.version += 1
+        delta["version"] = self.version
+        self.changes.append(delta)
+        if self.subscribers:
+            # Still under the lock, so every subscriber sees versions in order
+            self.send(list(self.subscribers), Frame.from_message(delta))
+
+    # -------------------------
+    # Subscribers
+    # -------------------------
+
+    def since(self, version):
+        """Deltas after `version`, or None if the log no longer reaches back"""
+        if version == self.version:
+            return []
+        if version > self.version or not self.changes or self.changes[0]["version"] > version + 1:
+            return None
+        return [delta for delta in self.changes if delta["version"] > version]
+
+    def snapshot(self):
+        """Snapshot frame of the current version, built once per version"""
+        cached = self.cached
+        if cached is None or cached[0] != self.version:
+            cached = self.cached = (self.version, Frame.from_message({
+                "type": "PEERS", "roster": self.id, "version": self.version,
+                "peers": list(self.entries.values())
+            }))
+        return cached[1]
+
+    def subscribe(self, peer, roster_id=None, version=None):
+        """Bring a peer up to date and push it every later delta
+
+        A peer that knows (roster_id, version) gets only what it missed.
+        """
+        with self.lock:
+            changes = self.since(version) if roster_id == self.id and version is not None else None
+            if changes is None:
+                self.snapshots += 1
+                frame = self.snapshot()
+            else:
+                self.resyncs += 1
+                frame = Frame.from_message({
+                    "type": "PEERS", "roster": self.id, "since": version,
+                    "version": self.version, "changes": changes
+                })
+            self.subscribers.add(peer)
+            self.send([peer], frame)
+
+    def unsubscribe(self, peer):
+        """False if the peer was not subscribed"""
+        with self.lock:
+            if peer not in self.subscribers:
+                return False
+            self.subscribers.discard(peer)
+            return True
+
+    def stats(self):
+        return {
+            "id": self.id,
+            "version": self.version,
+            "peers": len(self.entries),
+            "subscribers": len(self.subscribers),
+            "snapshots": self.snapshots,
+            "resyncs": self.resyncs,
+        }
@@ -5,20 +5,64 @@ PURE Protocol Server v0.3
 - RSA key authentication with challenge-response
 - Chat message broadcasting
 - Peer discovery and registry
+- Optional worker processes sharing one port, linked by a local bus
+- Federation: nodes link to each other and gossip chat and peer lists
+- Channels: JOIN/LEAVE and CHAT #channel, fanned out to subscribers only
+- Timer wheel for handshake deadlines, heartbeat PINGs and idle eviction
+- Per-peer token-bucket rate limits and load shedding with ERR busy
+- Metrics via STATS and an optional Prometheus endpoint; leveled async logging
+- Multiplexed connections: several identities authenticated over one socket
+- PEERS SUBSCRIBE: versioned roster snapshot, then pushed join/leave/role deltas
+- Optional per-connection zlib compression of server frames, negotiated in HELLO
+- Offline mailboxes: chat held for peers that went away, handed over on return
 """
 
+import argparse
+import asyncio
 import socket
 import threading
 import os
 import json
+import logging
 import time
 import hashlib
 import secrets
+import signal
 from datetime import datetime
+from functools import partial
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.backends import default_backend
 
+from bus import BusHub, WorkerBus, CHAT, JOIN, LEAVE, DOWN, MAIL, pair as bus_pair, peer_from
+from channels import ChannelIndex, ChannelError, DEFAULT_CHANNEL, CHANNEL_HISTORY
+from chatlog import ChatLog
+from compact import JSON, COMPACT
+from compress import Compressor, COMPRESS, ZLIB, LEVEL, THRESHOLD, totals as compress_totals
+from federation import Federation, fingerprint
+from frames import Frame, CachedFrame, MAX_MESSAGE, message_too_long
+from framing import FrameReader, FrameError, read_frame, TEXT, LENGTH, FRAMINGS, MAX_FRAME
+from history import ChatRing
+from keycache import KeyCache, MAX_KEYS, KEY_TTL
+import logs
+from mailstore import MailStore, MAX_MESSAGES, MAX_MAILBOXES, MEMORY_BYTES
+from metrics import Metrics, LatencyStats, serve_http
+from mux import MuxSession, Stream, StreamOutbound, StreamError, parse_tag, MUX, MAX_STREAMS
+from ratelimit import (
+    RateLimiter, Admission, parse_limit, limit_label, SAMPLE_INTERVAL, MAX_QUEUED, MAX_CPU
+)
+from timerwheel import TimerWheel
+from tickets import TicketIssuer, TicketError, SharedReplaySet, TICKET_LIFETIME
+from verifypool import VerifyPool, Busy, KINDS as VERIFY_KINDS, INLINE, MAX_PENDING, MAX_WAIT
+from registry import Peer, PeerRegistry
+from roster import Roster
+from peerstore import PeerStore, write_json_atomic, WRITE_INTERVAL, MAX_CHANGES
+from outbound import (
+    AsyncOutbound, ThreadedOutbound, DROP_OLDEST, POLICIES,
+    TCP_DEFAULT, TCP_CORK, TCP_NODELAY, TCP_MODES, COALESCE_WINDOW, COALESCE_BYTES,
+    set_tcp_mode, write_totals
+)
+
 # Configuration
 HOST = "0.0.0.0"
 PORT = 9000
@@ -27,16 +71,57 @@ PRIVATE_KEY_PATH = os.path.join(KEY_DIR, "node_private.pem")
 PUBLIC_KEY_PATH = os.path.join(KEY_DIR, "node_public.pem")
 PEERS_PATH = os.path.expanduser("~/.pure/peers.json")
 CONFIG_PATH = os.path.expanduser("~/.pure/config.json")
+CHATLOG_DIR = os.path.expanduser("~/.pure/chatlog")
+MAILBOX_DIR = os.path.expanduser("~/.pure/mailbox")
 
 # Global state
-peers = {}  # pubkey -> {ip, port, role, last_seen, conn, challenge_passed}
-active_connections = {}  # conn -> pubkey
-chat_history = []  # List of chat messages
+peers = PeerRegistry()  # pubkey -> Peer, indexed by conn, role and last_seen
+peer_store = None  # PeerStore writing `peers` in the background, started in main()
+key_cache = KeyCache()  # parsed peer public keys, so reconnects skip PEM parsing
+handshake_latency = {"parse": LatencyStats(), "verify": LatencyStats(), "total": LatencyStats()}
+verify_pool = None  # VerifyPool when verification is offloaded, else inline
+ticket_issuer = TicketIssuer()  # resumption tickets; None when disabled
 private_key = None
 public_key = None
+bus = None  # WorkerBus when running as one of several worker processes
+remote_peers = PeerRegistry()  # peers connected to other workers, keyed by (worker, conn)
+federation = None  # Federation when linking to other nodes
+timers = TimerWheel()  # deadlines and heartbeats, ticked by its own thread
+metrics = Metrics()  # counters, gauges and histograms behind STATS and --metrics-port
+fanout_latency = LatencyStats()
+log = logging.getLogger("pure.server")
+limiter = RateLimiter()  # per-peer command rate limits; None with --no-limits
+admission = None  # Admission shedding load when overloaded, set up in main()
+mailboxes = None  # MailStore of peers that went away; with workers the master's only
 
 MAX_PEERS = 50
 MAX_CHAT_HISTORY = 1000
+WELCOME_HISTORY = 10  # messages replayed to a peer right after WELCOME
+HISTORY_PAGE_LIMIT = 500  # most messages a single HISTORY request returns
+PEERS_CACHE_TTL = 1.0  # seconds a PEERS reply may serve stale last_seen values
+QUEUE_LIMIT = 256  # frames buffered per peer before the backpressure policy applies
+BACKPRESSURE_POLICY = DROP_OLDEST
+COALESCE_US = int(COALESCE_WINDOW * 1e6)  # microseconds a writer waits for a burst
+TCP_MODE = TCP_DEFAULT
+LINK_TARGETS = []  # (host, port) of nodes we keep federation links to
+TRUSTED_NODES = []  # IDs of the nodes allowed to link with us, either way
+HANDSHAKE_TIMEOUT = 10.0  # seconds from accept until the handshake must be done
+HEARTBEAT_INTERVAL = 30.0  # quiet seconds before we PING a peer
+IDLE_TIMEOUT = 90.0  # quiet seconds before we drop a peer; 0 disables
+STREAM_LIMIT = MAX_STREAMS  # identities per multiplexed connection; 0 refuses MUX
+COMPRESS_LEVEL = LEVEL  # zlib level for connections asking for COMPRESS; 0 refuses it
+COMPRESS_MIN = THRESHOLD  # payloads shorter than this are sent uncompressed
+MAILBOX_SIZE = MAX_MESSAGES  # messages held per peer that went away; 0 disables mailboxes
+MAILBOX_BYTES = MAX_FRAME // 2  # most held mail spliced into one MAILBOX frame
+
+chat_history = ChatRing(MAX_CHAT_HISTORY)  # seq -> chat message
+chat_log = None  # ChatLog persisting every message, opened in main()
+chat_lock = threading.Lock()  # keeps ring and log appends in seq order
+channels = ChannelIndex(CHANNEL_HISTORY, WELCOME_HISTORY)  # name -> subscribers and history
+roster = None  # Roster behind PEERS SUBSCRIBE; each serving process builds its own
+LOCAL = "local"  # roster sources: peers of this process,
+WORKERS = "workers"  # of the other workers,
+NODE = "node:"  # and of each federated node
 
 # -------------------------
 # Cryptographic Functions
@@ -49,7 +134,7 @@ def ensure_keys():
     os.makedirs(KEY_DIR, exist_ok=True)
     
     if not os.path.exists(PRIVATE_KEY_PATH):
-        print("[*] Generating new RSA keypair...")
+        log.info("Generating new RSA keypair...")
         private_key = rsa.generate_private_key(
             public_exponent=65537,
             key_size=2048,
@@ -73,9 +158,9 @@ def ensure_keys():
         with open(PUBLIC_KEY_PATH, "wb") as f:
             f.write(pem_pub)
         
-        print(f"[*] Keypair saved to {KEY_DIR}")
+        log.info("Keypair saved to %s", KEY_DIR)
     else:
-        print("[*] Loading existing keypair...")
+        log.info("Loading existing keypair...")
         with open(PRIVATE_KEY_PATH, "rb") as f:
             private_key = serialization.load_pem_private_key(
                 f.read(),
@@ -84,7 +169,7 @@ def ensure_keys():
             )
         public_key = private_key.public_key()
     
-    print("[✓] Keys loaded successfully")
+    log.info("Keys loaded successfully")
 
 
 def load_public_pem():
@@ -93,13 +178,16 @@ def load_public_pem():
         return f.read().decode().strip()
 
 
-def verify_signature(pubkey_pem, message, signature):
-    """Verify a signature using peer's public key"""
+def check_signature(pubkey_pem, message, signature):
+    """Verify a signature; returns (ok, parse_seconds, verify_seconds)
+
+    Runs inline or on a verification pool worker, so it reports its timings
+    instead of recording them itself.
+    """
     try:
-        pubkey = serialization.load_pem_public_key(
-            pubkey_pem.encode(),
-            backend=default_backend()
-        )
+        start = time.perf_counter()
+        pubkey = key_cache.get(pubkey_pem)
+        parsed = time.perf_counter()
         pubkey.verify(
             bytes.fromhex(signature),
             message.encode(),
@@ -109,10 +197,24 @@ def verify_signature(pubkey_pem, message, signature):
             ),
             hashes.SHA256()
         )
-        return True
+        return True, parsed - start, time.perf_counter() - parsed
     except Exception as e:
-        print(f"[-] Signature verification failed: {e}")
-        return False
+        log.warning("Signature verification failed: %s", e)
+        return False, 0.0, 0.0
+
+
+def record_verification(result):
+    """Record the phase timings of a check_signature() result"""
+    ok, parse_seconds, verify_seconds = result
+    if ok:
+        handshake_latency["parse"].record(parse_seconds)
+        handshake_latency["verify"].record(verify_seconds)
+    return ok
+
+
+def verify_signature(pubkey_pem, message, signature):
+    """Verify a signature using peer's public key"""
+    return record_verification(check_signature(pubkey_pem, message, signature))
 
 
 def sign_message(message):
@@ -135,282 +237,1842 @@ def sign_message(message):
 def load_peers():
     """Load peer registry from disk"""
     global peers
+    peers = PeerRegistry()
     if os.path.exists(PEERS_PATH):
         try:
             with open(PEERS_PATH, "r") as f:
-                peers = json.load(f)
-            print(f"[*] Loaded {len(peers)} known peers")
+                for pubkey, data in json.load(f).items():
+                    peers.add(Peer.from_dict(pubkey, data))
+            log.info("Loaded %d known peers", len(peers))
         except Exception as e:
-            print(f"[-] Error loading peers: {e}")
-            peers = {}
-    else:
-        peers = {}
+            log.error("Error loading peers: %s", e)
+            peers = PeerRegistry()
+
+
+def peers_snapshot():
+    """Peer registry without connection objects, ready for JSON"""
+    return peers.snapshot()
 
 
 def save_peers():
-    """Save peer registry to disk"""
+    """Save peer registry to disk right away"""
     try:
-        # Remove connection objects before saving
-        peers_to_save = {}
-        for pubkey, data in peers.items():
-            peers_to_save[pubkey] = {
-                "ip": data["ip"],
-                "port": data["port"],
-                "role": data["role"],
-                "last_seen": data["last_seen"],
-                "challenge_passed": data.get("challenge_passed", False)
-            }
-        
-        with open(PEERS_PATH, "w") as f:
-            json.dump(peers_to_save, f, indent=2)
+        write_json_atomic(PEERS_PATH, peers_snapshot())
     except Exception as e:
-        print(f"[-] Error saving peers: {e}")
+        log.error("Error saving peers: %s", e)
+
+
+def peers_changed():
+    """Schedule a registry write; the store coalesces bursts of changes"""
+    peers_frame.invalidate()
+    role_frames.clear()
+    if peer_store:
+        peer_store.mark_dirty()
 
 
 def register_peer(pubkey, addr, role="INITIATE", conn=None):
-    """Register or update a peer"""
-    if len(peers) >= MAX_PEERS and pubkey not in peers:
-        print(f"[-] Peer limit reached ({MAX_PEERS}), rejecting new peer")
-        return False
+    """Register or update a peer; returns its Peer, or None when full"""
+    if len(peers) + len(remote_peers) >= MAX_PEERS and pubkey not in peers:
+        log.warning("Peer limit reached (%d), rejecting new peer", MAX_PEERS)
+        return None
     
-    peers[pubkey] = {
-        "ip": addr[0],
-        "port": addr[1],
-        "role": role,
-        "last_seen": time.time(),
-        "conn": conn,
-        "challenge_passed": False
-    }
-    
-    if conn:
-        active_connections[conn] = pubkey
+    peer = Peer(pubkey, addr[0], addr[1], role, time.time(), conn=conn)
+    peers.add(peer)
     
-    save_peers()
-    print(f"[+] Registered peer: {pubkey[:32]}..., role={role}, addr={addr}")
-    return True
+    peers_changed()
+    log.debug("Registered peer: %s..., role=%s, addr=%s", pubkey[:32], role, addr)
+    return peer
 
 
 def remove_peer(conn):
     """Remove a peer when they disconnect"""
-    if conn in active_connections:
-        pubkey = active_connections[conn]
-        if pubkey in peers:
-            print(f"[-] Peer disconnected: {pubkey[:32]}...")
-            del peers[pubkey]
-        del active_connections[conn]
-        save_peers()
+    if federation and federation.drop(conn):
+        return
+    
+    peer = peers.by_connection(conn)
+    if peer is None:
+        return
+    
+    if peer.out and peer.out.mux and not peer.out.stream:
+        # The connection itself is going: so is every identity on it
+        close_streams(peer.out.mux)
+    channels.leave_all(peer)
+    timers.cancel(peer.timer)
+    roster.unsubscribe(peer)
+    if peers.remove_conn(conn):
+        log.info("Peer disconnected: %s...", peer.pubkey[:32])
+        roster.drop(LOCAL, fingerprint(peer.pubkey))
+        peers_changed()
+        if federation and peer.out:
+            federation.local_leave(peer.pubkey)
+        if mailboxes and peer.out:
+            hold_mail(peer.pubkey)
+    
+    if peer.out:
+        peer.out.close()
+        metrics.inc("bytes_out", peer.out.bytes_sent)
+        if bus:
+            bus.publish(LEAVE, {"conn": id(conn)})
+
+
+def close_connection(conn):
+    """Abort a session from outside its handler; the handler then cleans up"""
+    if isinstance(conn, Stream):
+        # One identity of a multiplexed connection; the others stay
+        close_stream(conn.session, conn.sid, "idle")
+    elif isinstance(conn, socket.socket):
+        # Wakes a handler thread blocked in recv
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    else:
+        conn.transport.abort()
+
+
+def expire_handshake(conn, addr):
+    """Timer: the connection did not authenticate in time"""
+    metrics.inc("handshake_timeouts")
+    log.info("Handshake timeout for %s", addr)
+    close_connection(conn)
+
+
+def check_idle(peer):
+    """Timer: PING a quiet peer, drop one that stayed silent past the deadline
+    
+    Activity only updates last_seen; the timer re-arms itself from it, so a
+    busy peer costs one timer firing per heartbeat interval.
+    """
+    if peers.by_connection(peer.conn) is not peer:
+        return
+    quiet = time.time() - peer.last_seen
+    if quiet >= IDLE_TIMEOUT:
+        metrics.inc("idle_evictions")
+        log.info("Idle timeout: %s... silent for %.0fs", peer.pubkey[:32], quiet)
+        close_connection(peer.conn)
+        return
+    if quiet >= HEARTBEAT_INTERVAL:
+        metrics.inc("pings")
+        peer.out.send(PING_FRAME)
+        delay = min(HEARTBEAT_INTERVAL, IDLE_TIMEOUT - quiet)
+    else:
+        delay = min(HEARTBEAT_INTERVAL, IDLE_TIMEOUT) - quiet
+    peer.timer = timers.schedule(delay, check_idle, peer)
+
+
+def queued_frames():
+    """Outbound frames waiting across every connected peer"""
+    return sum(len(peer.out.queue) for peer in peers.connected() if peer.out)
+
+
+def sample_load():
+    """Timer: refresh the admission controller's view of queue depth and CPU"""
+    admission.sample()
+    timers.schedule(SAMPLE_INTERVAL, sample_load)
+
+
+def start_timers():
+    """Start the wheel and the timers that run for the server's lifetime"""
+    timers.start()
+    if admission:
+        timers.schedule(SAMPLE_INTERVAL, sample_load)
+
+
+def admit_handshake():
+    """Refuse a new session up front while the node is shedding load"""
+    if admission and not admission.admit("HELLO"):
+        raise HandshakeError(f"busy retry-after={admission.retry_after()}")
+
+
+def write_options():
+    """Coalescing and TCP settings for a new outbound queue"""
+    return {"window": COALESCE_US / 1e6, "max_bytes": COALESCE_BYTES, "tcp_mode": TCP_MODE}
+
+
+def new_link_queue(sock):
+    """Outbound queue for a federation link we opened"""
+    set_tcp_mode(sock, TCP_MODE)
+    return ThreadedOutbound(sock, QUEUE_LIMIT, BACKPRESSURE_POLICY, **write_options())
+
+
+def outbound_stats():
+    """Per-peer outbound queue depth and drop counters, keyed by key fingerprint"""
+    return {
+        fingerprint(peer.pubkey): peer.out.stats()
+        for peer in peers.connected()
+        if peer.out
+    }
+
+
+def outbound_series(field):
+    """One outbound_stats() field per peer, for a labeled metric"""
+    return {peer: stats[field] for peer, stats in outbound_stats().items()}
+
+
+# -------------------------
+# Metrics
+# -------------------------
+
+def live_queues():
+    """Outbound queues of the peers connected right now"""
+    return [peer.out for peer in peers.connected() if peer.out]
+
+
+def compression_totals():
+    return compress_totals(out.compressor for out in live_queues() if out.compressor)
+
+
+def declare_metrics():
+    """Register what this process exports through STATS and --metrics-port"""
+    metrics.counter("connections", "TCP connections accepted")
+    metrics.counter("sessions", "handshakes completed")
+    metrics.counter("handshake_failures", "handshakes refused with ERR")
+    metrics.counter("handshake_timeouts", "connections closed for not authenticating in time")
+    metrics.counter("pings", "heartbeat PINGs sent to quiet peers")
+    metrics.counter("idle_evictions", "peers disconnected after staying silent")
+    metrics.counter("commands", "command lines handled")
+    metrics.counter("deliveries", "chat frames queued to peers")
+    metrics.counter("streams", "identities opened on multiplexed connections")
+    metrics.counter(
+        "merged_deliveries", "deliveries that shared a frame with another identity on the same connection"
+    )
+    metrics.counter("bytes_in", "frame payload bytes received")
+    metrics.counter(
+        "mailbox_delivered", "held messages handed to returning peers",
+        live=lambda: mailboxes.delivered if mailboxes else 0
+    )
+    metrics.counter(
+        "compressed_frames", "frames sent deflated to COMPRESS connections",
+        live=lambda: compression_totals()["frames"]
+    )
+    metrics.counter(
+        "compressed_raw_bytes", "bytes of those frames before compression",
+        live=lambda: compression_totals()["raw_bytes"]
+    )
+    metrics.counter(
+        "compressed_wire_bytes", "bytes written for them",
+        live=lambda: compression_totals()["wire_bytes"]
+    )
+    metrics.counter(
+        "bytes_out", "bytes written to peers",
+        live=lambda: sum(out.bytes_sent for out in live_queues())
+    )
+    metrics.counter(
+        "outbound_syscalls", "send/sendmsg calls made by outbound writers",
+        live=lambda: write_totals(live_queues())["syscalls"]
+    )
+    if limiter:
+        metrics.counter(
+            "rate_limited", "commands refused by a rate limit",
+            live=lambda: sum(limiter.limited.values())
+        )
+    if admission:
+        metrics.counter(
+            "shed", "handshakes and commands refused while overloaded",
+            live=lambda: sum(admission.shed.values())
+        )
+        metrics.gauge("shedding", lambda: int(admission.shedding), "1 while shedding load")
+    
+    metrics.gauge("peers_connected", lambda: len(peers.connected()), "authenticated sessions")
+    metrics.gauge("outbound_queued_frames", queued_frames, "frames waiting in outbound queues")
+    metrics.gauge(
+        "outbound_queued_bytes", lambda: sum(out.queued_bytes for out in live_queues()),
+        "bytes waiting in outbound queues"
+    )
+    metrics.gauge(
+        "outbound_high_water", lambda: max((out.high_water for out in live_queues()), default=0),
+        "deepest any connected peer's outbound queue has been"
+    )
+    metrics.gauge(
+        "syscalls_per_message", lambda: write_totals(live_queues())["syscalls_per_message"],
+        "write syscalls per delivered message since startup"
+    )
+    metrics.series(
+        "outbound_queue_depth", "gauge", "peer", lambda: outbound_series("depth"),
+        "frames waiting in each connected peer's outbound queue"
+    )
+    metrics.series(
+        "outbound_dropped", "counter", "peer", lambda: outbound_series("dropped"),
+        "frames each connected peer's backpressure policy dropped"
+    )
+    metrics.gauge(
+        "verify_pending", lambda: verify_pool.pending if verify_pool else 0,
+        "handshakes waiting for signature verification"
+    )
+    metrics.gauge("timers_pending", lambda: timers.pending, "timers scheduled on the wheel")
+    metrics.gauge("channels", lambda: len(channels), "channels with members or history")
+    metrics.gauge("chat_seq", lambda: chat_history.last_seq, "sequence number of the newest chat")
+    metrics.gauge("roster_version", lambda: roster.version if roster else 0, "peer roster version")
+    metrics.gauge(
+        "roster_subscribers", lambda: len(roster.subscribers) if roster else 0,
+        "peers subscribed to roster deltas"
+    )
+    metrics.gauge("mailboxes", lambda: len(mailboxes.boxes) if mailboxes else 0, "away peers with mail held")
+    metrics.gauge(
+        "mailbox_held", lambda: mailboxes.stats()["held"] if mailboxes else 0,
+        "messages held for away peers, each stored once"
+    )
+    
+    metrics.latency("handshake_parse", "public key parsing per handshake", handshake_latency["parse"])
+    metrics.latency("handshake_verify", "signature verification per handshake", handshake_latency["verify"])
+    metrics.latency("handshake", "accept to WELCOME", handshake_latency["total"])
+    metrics.latency("fanout", "queueing one chat frame to every member", fanout_latency)
+
+
+def stats_frame():
+    """STATS reply: every metric of this process"""
+    return Frame.from_message(dict(type="STATS", **metrics.snapshot()))
+
+
+def start_metrics_http(args):
+    """Prometheus endpoint; each worker takes the next port up"""
+    if not args.metrics_port:
+        return
+    port = args.metrics_port + (bus.worker - 1 if bus else 0)
+    try:
+        serve_http(metrics, args.metrics_host, port)
+    except OSError as e:
+        log.error("Metrics endpoint on %s:%d failed: %s", args.metrics_host, port, e)
+        return
+    log.info("Metrics at http://%s:%d/metrics", args.metrics_host, port)
 
 
 # -------------------------
 # Chat System
 # -------------------------
 
-def broadcast_message(message, sender_pubkey=None):
-    """Broadcast a chat message to all connected peers"""
+def broadcast_message(message, sender_pubkey=None, channel=None):
+    """Broadcast a chat message to a channel, by default the global one"""
     msg_data = {
         "type": "CHAT",
         "sender": sender_pubkey[:32] if sender_pubkey else "SERVER",
         "message": message,
         "timestamp": datetime.now().isoformat()
     }
+    if channel:
+        msg_data["channel"] = channel
+    
+    if bus:
+        # The master numbers and logs it, then sends it back to every
+        # worker, this one included
+        bus.publish(CHAT, msg_data)
+        return
+    
+    record_chat(msg_data)
+    if federation and sender_pubkey:
+        # Peer chat reaches the other nodes; our join notices stay local
+        federation.publish(msg_data)
+
+
+def record_chat(msg_data):
+    """Number, log and fan out a chat message, from a local peer or another node"""
+    name = msg_data.get("channel")
+    if name:
+        # Named channels keep their own ring, in memory only
+        channel = channels.open(name)
+        channel.ring.append(msg_data)
+        channel.history.invalidate()
+        fan_out(Frame.from_message(msg_data), channel)
+        return
     
-    # Add to history
-    chat_history.append(msg_data)
-    if len(chat_history) > MAX_CHAT_HISTORY:
-        chat_history.pop(0)
+    # Add to history, then serialize once; the log and the mailboxes store
+    # the same bytes the peers receive, minus the newline
+    with chat_lock:
+        seq = chat_history.append(msg_data)
+        frame = Frame.from_message(msg_data)
+        if chat_log:
+            chat_log.append(seq, frame.data[:-1])
+        if mailboxes and msg_data["sender"] != "SERVER":
+            mailboxes.post(frame.data[:-1])
+    history_frame.invalidate()
+    fan_out(frame)
+
+
+def fan_out(frame, channel=None):
+    """Hand a frame to the outbound queue of every member of a channel
     
-    # Broadcast to all connected peers
-    msg_json = json.dumps(msg_data) + "\n"
-    disconnected = []
+    The writers do the actual I/O so a slow peer cannot stall the sender.
+    """
+    start = time.perf_counter()
+    members = (channel or channels.default).snapshot()
+    send_to(members, frame)
+    fanout_latency.record(time.perf_counter() - start)
+    metrics.inc("deliveries", len(members))
+
+
+def send_to(members, frame):
+    """Queue a frame for each peer; identities sharing a connection share one frame"""
+    shared = None  # MuxSession -> stream ids of its members
+    for peer in members:
+        # Peers still in the handshake have no queue and must not see chat
+        out = peer.out
+        if out is None:
+            continue
+        if out.mux is not None:
+            if shared is None:
+                shared = {}
+            shared.setdefault(out.mux, []).append(out.stream)
+            continue
+        if not out.send(frame):
+            # The queue disconnected the peer; its handler cleans up
+            log.debug("Failed to send to %s...: peer disconnected", peer.pubkey[:32])
+    if shared:
+        # Identities sharing a connection get one frame tagged with all of them
+        for session, sids in shared.items():
+            session.send(frame, sids)
+        metrics.inc("merged_deliveries", sum(len(sids) - 1 for sids in shared.values()))
+
+
+def sequence_chat(message):
+    """Master: number and log a chat message from a worker; returns its encoding"""
+    name = message.get("channel")
+    if name:
+        channels.open(name).ring.append(message)
+        return json.dumps(message).encode()
+    with chat_lock:
+        seq = chat_history.append(message)
+        payload = json.dumps(message).encode()
+        if chat_log:
+            chat_log.append(seq, payload)
+        if mailboxes and message["sender"] != "SERVER":
+            mailboxes.post(payload)
+    return payload
+
+
+def deliver_chat(payload):
+    """Worker: store a chat message the master numbered and send it to our peers"""
+    message = json.loads(payload)
+    frame = Frame(payload + b"\n", message)
+    name = message.get("channel")
+    if name:
+        channel = channels.open(name)
+        channel.ring.store(message)
+        channel.history.invalidate()
+        fan_out(frame, channel)
+        return
+    chat_history.store(message)
+    history_frame.invalidate()
+    fan_out(frame)
+
+
+def handle_bus_message(op, body):
+    """Worker: apply one frame relayed by the master"""
+    if op == CHAT:
+        deliver_chat(body)
+        return
+    if op == MAIL:
+        greet_joined(json.loads(body))
+        return
     
-    for conn, pubkey in active_connections.items():
+    data = json.loads(body)
+    gone = []
+    if op == JOIN:
+        peer = peer_from(data, (data["worker"], data["conn"]))
+        remote_peers.add(peer)
+        roster.put(WORKERS, fingerprint(peer.pubkey), peer.summary())
+    elif op == LEAVE:
+        gone.append(remote_peers.remove_conn((data["worker"], data["conn"])))
+    elif op == DOWN:
+        for peer in remote_peers.connected():
+            if peer.conn[0] == data["worker"]:
+                gone.append(remote_peers.remove_conn(peer.conn))
+    for peer in gone:
+        if peer:
+            roster.drop(WORKERS, fingerprint(peer.pubkey))
+    peers_changed()
+
+
+# -------------------------
+# Offline Mailboxes
+# -------------------------
+
+def hold_mail(pubkey):
+    """A peer's last connection went: hold its chat until it is back"""
+    mailboxes.open(fingerprint(pubkey))
+
+
+def mailbox_messages(payloads, dropped):
+    """Encoded MAILBOX messages carrying `payloads` in order, each well under MAX_FRAME
+
+    The held records are spliced in as they are, like a HISTORY page read
+    from the chat log. `remaining` tells the peer how many follow.
+    """
+    if not payloads and not dropped:
+        return []
+    batches = [[]]
+    size = 0
+    for payload in payloads:
+        if batches[-1] and size + len(payload) > MAILBOX_BYTES:
+            batches.append([])
+            size = 0
+        batches[-1].append(payload)
+        size += len(payload) + 2
+    messages = []
+    remaining = len(payloads)
+    for batch in batches:
+        remaining -= len(batch)
+        messages.append(
+            b'{"type": "MAILBOX", "messages": ['
+            + b", ".join(batch)
+            + b'], "dropped": %d, "remaining": %d}' % (dropped, remaining)
+        )
+        dropped = 0  # reported once, with the first frame
+    return messages
+
+
+def deliver_mail(pubkey, send):
+    """Pass a returning peer's mail to send(encoded message); False if it had none
+
+    The mailbox closes only after every message was handed over; an
+    exception from send() or a False return keeps it for the next return.
+    """
+    key = fingerprint(pubkey)
+    held = mailboxes.peek(key)
+    if held is None:
+        return False
+    messages = mailbox_messages(*held)
+    for message in messages:
+        if not send(message):
+            return True
+    mailboxes.release(key, held)
+    return bool(messages)
+
+
+def greet(peer):
+    """First frames after WELCOME: held mail replaces the recent history"""
+    out = peer.out
+    if mailboxes and deliver_mail(peer.pubkey, lambda mail: out.send(Frame(mail + b"\n"))):
+        return
+    if len(chat_history):
+        out.send(history_frame.get())
+
+
+def greet_joined(data):
+    """Worker: the master answered our JOIN with a frame of the peer's mail, or null"""
+    for peer in peers.connected():
+        if id(peer.conn) == data["conn"] and peer.out:
+            if data["mail"]:
+                peer.out.send(Frame.from_message(data["mail"]))
+            elif len(chat_history):
+                peer.out.send(history_frame.get())
+            return
+
+
+# -------------------------
+# Protocol Handling
+# -------------------------
+
+PEM_BEGIN = "-----BEGIN PUBLIC KEY-----"
+PEM_END = "-----END PUBLIC KEY-----"
+
+
+class HandshakeError(Exception):
+    """Raised when a peer violates the handshake; the message is sent as ERR"""
+
+
+def parse_options(tokens):
+    """Handshake options: KEY=VALUE pairs and bare flags, keys upper-cased"""
+    options = {}
+    for token in tokens:
+        key, _, value = token.partition("=")
+        options[key.upper()] = value or True
+    return options
+
+
+def parse_hello(data):
+    """Parse a HELLO message into (pubkey, role, options)"""
+    parts = data.split()
+    if not parts or parts[0].upper() != "HELLO" or len(parts) < 2:
+        raise HandshakeError("malformed handshake")
+    
+    # Extract public key
+    pubkey_start = data.find(PEM_BEGIN)
+    pubkey_end = data.find(PEM_END)
+    if pubkey_start == -1 or pubkey_end == -1:
+        raise HandshakeError("invalid public key")
+    
+    client_pubkey = data[pubkey_start:pubkey_end + len(PEM_END)]
+    
+    # Check for invite code (future feature)
+    client_role = "INITIATE"
+    if "INVITE" in data:
+        # TODO: Validate invite code
+        pass
+    
+    options = parse_options(data[pubkey_end + len(PEM_END):].split())
+    return client_pubkey, client_role, options
+
+
+def parse_resume(data):
+    """Redeem a RESUME <ticket> [options] line; returns (pubkey, role, options)"""
+    parts = data.split()
+    if len(parts) < 2:
+        raise HandshakeError("malformed resume")
+    if ticket_issuer is None:
+        raise HandshakeError("resumption disabled")
+    
+    try:
+        client_pubkey = ticket_issuer.redeem(parts[1])
+    except TicketError as e:
+        raise HandshakeError(str(e))
+    
+    # A resumed session always gets a fresh ticket for next time
+    options = parse_options(parts[2:])
+    options["TICKET"] = True
+    return client_pubkey, "INITIATE", options
+
+
+def parse_response(response):
+    """Extract the signature from a RESPONSE line"""
+    if not response.startswith("RESPONSE "):
+        raise HandshakeError("invalid challenge response")
+    
+    return response.split(" ", 1)[1]
+
+
+def authenticate(pubkey, challenge, signature):
+    """Check a challenge signature, on the verification pool if there is one"""
+    try:
+        if verify_pool:
+            ok = record_verification(verify_pool.call(pubkey, challenge, signature))
+        else:
+            ok = verify_signature(pubkey, challenge, signature)
+    except Busy as e:
+        raise HandshakeError(str(e))
+    
+    if not ok:
+        raise HandshakeError("authentication failed")
+
+
+async def authenticate_async(pubkey, challenge, signature):
+    """authenticate() for the event loop; never blocks it on a busy pool"""
+    try:
+        if verify_pool:
+            result = await verify_pool.call_async(pubkey, challenge, signature)
+            ok = record_verification(result)
+        else:
+            ok = verify_signature(pubkey, challenge, signature)
+    except Busy as e:
+        raise HandshakeError(str(e))
+    
+    if not ok:
+        raise HandshakeError("authentication failed")
+
+
+def build_history():
+    """HISTORY reply sent to newly authenticated peers"""
+    return {
+        "type": "HISTORY",
+        "messages": chat_history.latest(WELCOME_HISTORY),
+        "last_seq": chat_history.last_seq
+    }
+
+
+def history_page(since_seq, limit):
+    """HISTORY reply with the messages a peer missed after since_seq"""
+    limit = min(limit, HISTORY_PAGE_LIMIT)
+    
+    if chat_log and since_seq + 1 < chat_history.first_seq:
+        # Older than the ring: splice the encoded records straight out of
+        # the mapped log segments instead of decoding them
+        payloads = chat_log.read_raw(since_seq, limit)
+        return Frame(
+            b'{"type": "HISTORY", "messages": ['
+            + b", ".join(payloads)
+            + f'], "first_seq": {chat_log.first_seq}, '
+              f'"last_seq": {chat_history.last_seq}}}\n'.encode()
+        )
+    
+    return Frame.from_message({
+        "type": "HISTORY",
+        "messages": chat_history.since(since_seq, limit),
+        "first_seq": chat_history.first_seq,
+        "last_seq": chat_history.last_seq
+    })
+
+
+def build_peer_list(role=None):
+    """PEERS reply listing every authenticated peer, optionally of one role
+    
+    Peers on other workers are included, once per pubkey.
+    """
+    listed = {}
+    for registry in (peers, remote_peers):
+        candidates = registry.peers() if role is None else registry.with_role(role)
+        for p in candidates:
+            if p.challenge_passed:
+                listed.setdefault(p.pubkey, p)
+    peer_list = [p.summary() for p in listed.values()]
+    if federation:
+        peer_list += federation.remote_peers(role)
+    return {"type": "PEERS", "peers": peer_list}
+
+
+def peers_reply(role=None):
+    """Cached PEERS frame; role-filtered replies read only that role's index"""
+    if role is None:
+        return peers_frame.get()
+    
+    cached = role_frames.get(role)
+    if cached is None:
+        if role not in peers.roles() and role not in remote_peers.roles() and not federation:
+            return Frame.from_message({"type": "PEERS", "peers": []})
+        cached = CachedFrame(lambda: build_peer_list(role), max_age=PEERS_CACHE_TTL)
+        role_frames[role] = cached
+    return cached.get()
+
+
+def subscribe_peers(peer, args):
+    """PEERS SUBSCRIBE [roster version]: snapshot or missed deltas, then live deltas"""
+    roster_id = version = None
+    if args:
         try:
-            conn.sendall(msg_json.encode())
-        except Exception as e:
-            print(f"[-] Failed to send to {pubkey[:32]}...: {e}")
-            disconnected.append(conn)
+            roster_id, version = args[0], int(args[1])
+        except (IndexError, ValueError):
+            peer.out.send(Frame.text("ERR usage: PEERS SUBSCRIBE [roster version]"))
+            return
+    roster.subscribe(peer, roster_id, version)
+
+
+def start_roster():
+    """Index the peers PEERS lists, for PEERS SUBSCRIBE"""
+    global roster
+    roster = Roster(send_to)
+    for registry, source in ((peers, LOCAL), (remote_peers, WORKERS)):
+        for peer in registry.peers():
+            if peer.challenge_passed:
+                roster.put(source, fingerprint(peer.pubkey), peer.summary())
+    if federation:
+        sync_node_peers()
+
+
+def sync_node_peers():
+    """Bring the roster's federated node sources in line with their peer tables"""
+    tables = federation.peer_tables()
+    for source in roster.sources():
+        if source.startswith(NODE) and source[len(NODE):] not in tables:
+            roster.replace(source, {})
+    for node, table in tables.items():
+        roster.replace(NODE + node, {
+            peer_id: dict(summary, node=node) for peer_id, summary in table.items()
+        })
+
+
+def node_peers_changed():
+    """Federation callback: another node's peer list changed"""
+    if roster:
+        sync_node_peers()
+    peers_changed()
+
+
+# Encoded replies shared by every request until the underlying state changes
+history_frame = CachedFrame(build_history)
+peers_frame = CachedFrame(build_peer_list, max_age=PEERS_CACHE_TTL)
+role_frames = {}  # role -> CachedFrame, dropped whenever the peer set changes
+welcome_pem = None  # our public key, loaded once in main()
+welcome_frames = {}  # accepted options -> WELCOME frame acknowledging them
+PONG_FRAME = Frame.text("PONG")
+PING_FRAME = Frame.text("PING")  # heartbeat; clients answer PONG
+
+
+def check_node(pubkey, options):
+    """A NODE handshake is only taken from a node on the --trust-node allowlist"""
+    if federation and options.get("NODE") and not federation.trusts(pubkey):
+        raise HandshakeError("node not trusted")
+
+
+def negotiate(options):
+    """Options from HELLO/RESUME that we accept, to be echoed in WELCOME"""
+    accepted = {}
+    framing = str(options.get("FRAMING", TEXT)).lower()
+    if framing in FRAMINGS and framing != TEXT:
+        accepted["FRAMING"] = framing
+    # Packed payloads may contain newlines, so they need length framing
+    encoding = str(options.get("ENCODING", JSON)).lower()
+    if encoding == COMPACT and accepted.get("FRAMING") == LENGTH:
+        accepted["ENCODING"] = encoding
+    # So are deflated ones
+    compress = str(options.get(COMPRESS, "")).lower()
+    if COMPRESS_LEVEL and compress == ZLIB and accepted.get("FRAMING") == LENGTH:
+        accepted[COMPRESS] = ZLIB
+    if federation and options.get("NODE"):
+        accepted["NODE"] = "1"
+    # Stream tags travel inside length-prefixed frames
+    elif STREAM_LIMIT and options.get(MUX) and accepted.get("FRAMING") == LENGTH:
+        accepted[MUX] = "1"
+    return accepted
+
+
+def welcome_for(accepted):
+    """WELCOME with our public key, followed by the accepted options"""
+    key = " ".join(f"{name}={value}" for name, value in sorted(accepted.items()))
+    frame = welcome_frames.get(key)
+    if frame is None:
+        frame = welcome_frames[key] = Frame.text(f"WELCOME {welcome_pem} {key}".rstrip())
+    return frame
+
+
+def complete_handshake(peer, out, options):
+    """Mark a peer authenticated, greet it and announce it to the network
+    
+    Returns the callable that handles the rest of the session's lines.
+    """
+    # Send welcome with our public key; from here on every write goes
+    # through the peer's outbound queue. WELCOME itself is always a text
+    # line, the negotiated framing applies to everything after it.
+    accepted = negotiate(options)
+    out.send(welcome_for(accepted))
+    out.framing = accepted.get("FRAMING", TEXT)
+    out.encoding = accepted.get("ENCODING", JSON)
+    if COMPRESS in accepted:
+        out.start_compression(Compressor(COMPRESS_LEVEL, COMPRESS_MIN))
+    if ticket_issuer and options.get("TICKET"):
+        ticket = ticket_issuer.issue(peer.pubkey)
+        out.send(Frame.text(f"TICKET {ticket} {ticket_issuer.lifetime}"))
+    if "NODE" in accepted:
+        # Another node linking to us: it speaks gossip, not chat, so it
+        # leaves the peer registry and never sees the chat fan-out. The
+        # store may have queued it when the handshake registered it, so
+        # schedule a write without it
+        if peers.remove_conn(peer.conn):
+            roster.drop(LOCAL, fingerprint(peer.pubkey))
+            peers_changed()
+        link = federation.accept(peer.pubkey, out, peer.conn, options.get("NONCE"))
+        return partial(federation.handle, link)
+    if MUX in accepted:
+        session = out.mux = MuxSession(out, (peer.ip, peer.port), STREAM_LIMIT)
+        session.streams[0] = peer
+        start_session(peer, out)
+        return partial(handle_mux, session)
+    start_session(peer, out)
+    return partial(handle_command, peer)
+
+
+def start_session(peer, out):
+    """Join an authenticated identity to the chat and announce it"""
+    metrics.inc("sessions")
+    peer.out = out
+    peer.buckets = {}
+    peer.challenge_passed = True
+    channels.join(DEFAULT_CHANNEL, peer)
+    if IDLE_TIMEOUT:
+        peer.timer = timers.schedule(min(HEARTBEAT_INTERVAL, IDLE_TIMEOUT), check_idle, peer)
+    roster.put(LOCAL, fingerprint(peer.pubkey), peer.summary())
+    peers_changed()
+    if bus:
+        bus.publish(JOIN, dict(peer.to_dict(), pubkey=peer.pubkey, conn=id(peer.conn)))
+    if federation:
+        federation.local_join(peer.pubkey, peer.summary())
+    
+    pubkey = peer.pubkey
+    log.info("Peer authenticated: %s...", pubkey[:32])
+    
+    # Send recent chat history, or what was held while it was away; with
+    # workers the master holds the mail and answers our JOIN with it
+    if not (bus and MAILBOX_SIZE):
+        greet(peer)
     
-    # Clean up disconnected peers
-    for conn in disconnected:
-        remove_peer(conn)
+    # Announce new peer
+    broadcast_message(f"Peer {pubkey[:8]}... joined", None)
+
+
+def handle_command(peer, line):
+    """Execute one command line from an authenticated peer"""
+    out = peer.out
+    
+    # Update last seen
+    now = time.time()
+    peers.touch(peer, now)
+    
+    # Rate limits first, then load shedding; both are constant-time checks
+    command = line.split(" ", 1)[0].upper()
+    if limiter:
+        retry_after = limiter.check(peer.buckets, command, now)
+        if retry_after is not None:
+            if retry_after:
+                out.send(Frame.text(f"ERR rate-limited {command[:16]} retry-after={retry_after}"))
+            return
+    if admission and not admission.admit(command):
+        out.send(Frame.text(f"ERR busy retry-after={admission.retry_after()}"))
+        return
+    
+    # Handle commands
+    metrics.inc("commands")
+    if line.upper() == "PING":
+        out.send(PONG_FRAME)
+    
+    elif line.upper() == "PONG":
+        pass  # heartbeat answer; last_seen is all it updates
+    
+    elif line.upper().split(" ", 1)[0] == "PEERS":
+        args = line.split()[1:]
+        option = args[0].upper() if args else None
+        if option == "SUBSCRIBE":
+            subscribe_peers(peer, args[1:])
+        elif option == "UNSUBSCRIBE":
+            if not roster.unsubscribe(peer):
+                out.send(Frame.text("ERR not subscribed"))
+        else:
+            out.send(peers_reply(option))
+    
+    elif command == "STATS":
+        out.send(stats_frame())
+    
+    elif line.startswith("CHAT "):
+        message = line[5:]
+        if message_too_long(message):
+            out.send(Frame.text(f"ERR message too long, at most {MAX_MESSAGE} bytes as JSON"))
+            return
+        if not message.startswith("#"):
+            broadcast_message(message, peer.pubkey)
+            return
+        name, _, message = message.partition(" ")
+        if name not in peer.channels:
+            out.send(Frame.text(f"ERR not in {name}; JOIN it first"))
+            return
+        broadcast_message(message, peer.pubkey, None if name == DEFAULT_CHANNEL else name)
+    
+    elif line.upper().split(" ", 1)[0] in ("JOIN", "LEAVE"):
+        args = line.split()
+        if len(args) != 2:
+            out.send(Frame.text(f"ERR usage: {args[0].upper()} #channel"))
+            return
+        if args[0].upper() == "JOIN":
+            join_channel(peer, args[1])
+        elif channels.leave(args[1], peer):
+            out.send(Frame.text(f"LEFT {args[1]}"))
+        else:
+            out.send(Frame.text(f"ERR not in {args[1]}"))
+    
+    elif line.upper().split(" ", 1)[0] == "HISTORY":
+        args = line.split()[1:]
+        if args and args[0].startswith("#") and args[0] != DEFAULT_CHANNEL:
+            channel_history(peer, args[0], args[1:])
+            return
+        if args and args[0] == DEFAULT_CHANNEL:
+            args = args[1:]
+        if not args:
+            out.send(history_frame.get())
+            return
+        try:
+            since_seq = int(args[0])
+            limit = int(args[1]) if len(args) > 1 else HISTORY_PAGE_LIMIT
+        except ValueError:
+            out.send(Frame.text("ERR usage: HISTORY [since_seq] [limit]"))
+            return
+        out.send(history_page(since_seq, limit))
+    
+    else:
+        # Echo unknown commands
+        out.send(Frame.text(f"ECHO: {line}"))
+
+
+def join_channel(peer, name):
+    """JOIN: subscribe, acknowledge, then replay the channel's recent history"""
+    out = peer.out
+    try:
+        channel = channels.join(name, peer)
+    except ChannelError as e:
+        out.send(Frame.text(f"ERR {e}"))
+        return
+    if channel is None:
+        out.send(Frame.text(f"ERR already in {name}"))
+        return
+    
+    out.send(Frame.text(f"JOINED {name}"))
+    if channel is channels.default:
+        if len(chat_history):
+            out.send(history_frame.get())
+    elif len(channel.ring):
+        out.send(channel.history.get())
+
+
+def channel_history(peer, name, args):
+    """HISTORY #channel [since_seq] [limit]"""
+    out = peer.out
+    channel = channels.get(name)
+    if channel is None:
+        out.send(Frame.text(f"ERR unknown channel {name}"))
+        return
+    if not args:
+        out.send(channel.history.get())
+        return
+    try:
+        since_seq = int(args[0])
+        limit = int(args[1]) if len(args) > 1 else HISTORY_PAGE_LIMIT
+    except ValueError:
+        out.send(Frame.text("ERR usage: HISTORY [#channel] [since_seq] [limit]"))
+        return
+    out.send(Frame.from_message(channel.page(since_seq, min(limit, HISTORY_PAGE_LIMIT))))
 
 
 # -------------------------
-# Connection Handler
+# Multiplexed Connections
+# -------------------------
+
+def handle_mux(session, line):
+    """Route one line of a multiplexed connection to the identity it names"""
+    try:
+        sid, line = parse_tag(line)
+    except StreamError as e:
+        session.out.send(Frame.text(f"ERR {e}"))
+        return
+    
+    peer = session.streams.get(sid)
+    if peer is not None:
+        if line.upper() != "CLOSE":
+            handle_command(peer, line)
+        elif sid:
+            close_stream(session, sid)
+        else:
+            peer.out.send(Frame.text("ERR stream 0 closes with the connection"))
+        return
+    
+    if sid in session.pending:
+        if session.pending[sid] is None:
+            StreamOutbound(session, sid).send(Frame.text("ERR handshake in progress"))
+        else:
+            answer_stream(session, sid, line)
+    elif line.split(" ", 1)[0].upper() in ("HELLO", "RESUME"):
+        open_stream(session, sid, line)
+    else:
+        StreamOutbound(session, sid).send(Frame.text(f"ERR stream {sid} is not open"))
+
+
+def open_stream(session, sid, line):
+    """@sid HELLO <pem> [TICKET] or @sid RESUME <ticket>: add an identity"""
+    try:
+        if len(session) >= session.max_streams:
+            raise HandshakeError(f"stream limit reached ({session.max_streams})")
+        resuming = line.upper().startswith("RESUME ")
+        if resuming:
+            pubkey, role, options = parse_resume(line)
+        else:
+            pubkey, role, options = parse_hello(line)
+        admit_handshake()
+    except HandshakeError as e:
+        refuse_stream(session, sid, e)
+        return
+    
+    if resuming:
+        attach_stream(session, sid, pubkey, role, options)
+        return
+    challenge = secrets.token_hex(32)
+    deadline = timers.schedule(HANDSHAKE_TIMEOUT, expire_stream, session, sid)
+    session.pending[sid] = (pubkey, role, options, challenge, deadline)
+    StreamOutbound(session, sid).send(Frame.text(f"CHALLENGE {challenge}"))
+
+
+def answer_stream(session, sid, line):
+    """@sid RESPONSE <signature>: verify it, then attach the identity"""
+    pubkey, role, options, challenge, deadline = session.pending[sid]
+    timers.cancel(deadline)
+    session.pending[sid] = None  # verifying
+    try:
+        signature = parse_response(line)
+        if isinstance(session.out, AsyncOutbound):
+            # The other streams keep going while the pool verifies
+            asyncio.get_running_loop().create_task(verify_stream_async(
+                session, sid, pubkey, role, options, challenge, signature
+            ))
+            return
+        authenticate(pubkey, challenge, signature)
+    except HandshakeError as e:
+        refuse_stream(session, sid, e)
+        return
+    attach_stream(session, sid, pubkey, role, options)
+
+
+async def verify_stream_async(session, sid, pubkey, role, options, challenge, signature):
+    try:
+        await authenticate_async(pubkey, challenge, signature)
+    except HandshakeError as e:
+        refuse_stream(session, sid, e)
+        return
+    attach_stream(session, sid, pubkey, role, options)
+
+
+def attach_stream(session, sid, pubkey, role, options):
+    """Register an authenticated identity under its stream and greet it"""
+    session.pending.pop(sid, None)
+    if session.closed:
+        return
+    peer = register_peer(pubkey, session.addr, role, Stream(session, sid))
+    if peer is None:
+        refuse_stream(session, sid, "peer limit reached")
+        return
+    
+    # Framing and encoding are the connection's; WELCOME confirms the stream
+    out = StreamOutbound(session, sid)
+    out.send(welcome_for({}))
+    if ticket_issuer and options.get("TICKET"):
+        ticket = ticket_issuer.issue(pubkey)
+        out.send(Frame.text(f"TICKET {ticket} {ticket_issuer.lifetime}"))
+    session.streams[sid] = peer
+    session.opened += 1
+    metrics.inc("streams")
+    start_session(peer, out)
+
+
+def refuse_stream(session, sid, error):
+    session.pending.pop(sid, None)
+    metrics.inc("handshake_failures")
+    StreamOutbound(session, sid).send(Frame.text(f"ERR {error}"))
+
+
+def expire_stream(session, sid):
+    """Timer: an identity did not answer its CHALLENGE in time"""
+    if session.pending.get(sid) is None:
+        return
+    del session.pending[sid]
+    metrics.inc("handshake_timeouts")
+    StreamOutbound(session, sid).send(Frame.text("ERR handshake timeout"))
+
+
+def close_stream(session, sid, reason=None):
+    """Detach one identity; the connection and its other streams carry on"""
+    peer = session.streams.pop(sid, None)
+    if peer is None:
+        return
+    peer.out.send(Frame.text(f"CLOSED {reason}" if reason else "CLOSED"))
+    remove_peer(peer.conn)
+
+
+def close_streams(session):
+    """The connection is closing: drop every identity opened on it"""
+    session.closed = True
+    for pending in session.pending.values():
+        if pending:
+            timers.cancel(pending[4])
+    session.pending.clear()
+    for sid in [sid for sid in session.streams if sid]:
+        remove_peer(session.streams.pop(sid).conn)
+
+
+# -------------------------
+# Threaded Engine
 # -------------------------
 
 def handle_connection(conn, addr):
     """Handle individual peer connection"""
-    print(f"[+] Connection from {addr}")
-    pubkey = None
+    log.debug("Connection from %s", addr)
+    metrics.inc("connections")
+    accepted = time.perf_counter()
+    peer = None
+    
+    reader = FrameReader(conn)
+    deadline = timers.schedule(HANDSHAKE_TIMEOUT, expire_handshake, conn, addr)
     
     try:
-        # Phase 1: HELLO handshake
-        data = conn.recv(4096).decode().strip()
+        set_tcp_mode(conn, TCP_MODE)
+        
+        # Phase 1: HELLO handshake, or RESUME with a ticket
+        data = receive_hello(reader)
         if not data:
             conn.close()
             return
         
-        parts = data.split()
-        if parts[0].upper() != "HELLO" or len(parts) < 2:
-            conn.sendall(b"ERR malformed handshake\n")
-            conn.close()
-            return
+        resuming = data.upper().startswith("RESUME ")
+        if resuming:
+            client_pubkey, client_role, options = parse_resume(data)
+        else:
+            client_pubkey, client_role, options = parse_hello(data)
+        admit_handshake()
         
-        # Extract public key
-        pubkey_start = data.find("-----BEGIN PUBLIC KEY-----")
-        pubkey_end = data.find("-----END PUBLIC KEY-----")
-        if pubkey_start == -1 or pubkey_end == -1:
-            conn.sendall(b"ERR invalid public key\n")
-            conn.close()
-            return
+        # Register peer
+        peer = register_peer(client_pubkey, addr, client_role, conn)
+        if peer is None:
+            raise HandshakeError("peer limit reached")
         
-        client_pubkey = data[pubkey_start:pubkey_end + len("-----END PUBLIC KEY-----")]
+        # Phase 2: Challenge-response authentication (the ticket stands in
+        # for it on RESUME)
+        if not resuming:
+            challenge = secrets.token_hex(32)
+            conn.sendall(f"CHALLENGE {challenge}\n".encode())
+            
+            response = reader.readline() or ""
+            authenticate(client_pubkey, challenge, parse_response(response))
+        check_node(client_pubkey, options)
         
-        # Check for invite code (future feature)
-        client_role = "INITIATE"
-        if "INVITE" in data:
-            # TODO: Validate invite code
-            pass
+        timers.cancel(deadline)
+        out = ThreadedOutbound(conn, QUEUE_LIMIT, BACKPRESSURE_POLICY, **write_options())
+        handle = complete_handshake(peer, out, options)
+        handshake_latency["total"].record(time.perf_counter() - accepted)
         
-        # Register peer
-        if not register_peer(client_pubkey, addr, client_role, conn):
-            conn.sendall(b"ERR peer limit reached\n")
+        # Phase 3: Message loop, in whatever framing WELCOME acknowledged
+        reader.framing = out.framing
+        for payload in reader.frames():
+            metrics.inc("bytes_in", len(payload))
+            line = str(payload, "utf-8").strip()
+            if not line:
+                continue
+            
+            handle(line)
+    
+    except HandshakeError as e:
+        metrics.inc("handshake_failures")
+        try:
+            conn.sendall(f"ERR {e}\n".encode())
+        except OSError:
+            pass
+    
+    except Exception as e:
+        log.warning("Connection error with %s: %s", addr, e)
+    
+    finally:
+        timers.cancel(deadline)
+        if peer:
+            remove_peer(conn)
+        try:
             conn.close()
-            return
-        
-        pubkey = client_pubkey
+        except:
+            pass
+
+
+def receive_hello(reader):
+    """Read a HELLO or RESUME; HELLO spans several lines because of the PEM"""
+    lines = [reader.readline() or ""]
+    if PEM_BEGIN in lines[0]:
+        while PEM_END not in lines[-1]:
+            line = reader.readline()
+            if line is None:
+                break
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def serve_threaded(host, port, reuse_port=False):
+    """Accept connections and serve each one on its own thread"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Every worker binds the same port; the kernel spreads connections
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((host, port))
+        server_socket.listen()
         
-        # Phase 2: Challenge-response authentication
-        challenge = secrets.token_hex(32)
-        conn.sendall(f"CHALLENGE {challenge}\n".encode())
+        start_timers()
+        if bus:
+            bus.start(handle_bus_message)
+        if federation:
+            federation.start(LINK_TARGETS)
+        log.info("%s successfully (thread engine), waiting for connections", started_label())
         
-        response = conn.recv(4096).decode().strip()
-        if not response.startswith("RESPONSE "):
-            conn.sendall(b"ERR invalid challenge response\n")
-            conn.close()
-            return
+        while True:
+            conn, addr = server_socket.accept()
+            thread = threading.Thread(
+                target=handle_connection,
+                args=(conn, addr),
+                daemon=True
+            )
+            thread.start()
+
+
+# -------------------------
+# Asyncio Engine
+# -------------------------
+
+async def read_hello(reader):
+    """Read a HELLO message, which spans several lines because of the PEM"""
+    data = (await reader.readline()).decode()
+    if PEM_BEGIN in data:
+        while PEM_END not in data:
+            line = await reader.readline()
+            if not line:
+                break
+            data += line.decode()
+    return data.strip()
+
+
+async def handle_stream(reader, writer):
+    """Handle individual peer connection on the event loop"""
+    addr = writer.get_extra_info("peername")
+    log.debug("Connection from %s", addr)
+    metrics.inc("connections")
+    accepted = time.perf_counter()
+    peer = None
+    deadline = timers.schedule(HANDSHAKE_TIMEOUT, expire_handshake, writer, addr)
+    
+    try:
+        set_tcp_mode(writer.get_extra_info("socket"), TCP_MODE)
         
-        signature = response.split(" ", 1)[1]
-        if not verify_signature(client_pubkey, challenge, signature):
-            conn.sendall(b"ERR authentication failed\n")
-            conn.close()
+        # Phase 1: HELLO handshake, or RESUME with a ticket
+        data = await read_hello(reader)
+        if not data:
             return
         
-        peers[pubkey]["challenge_passed"] = True
-        
-        # Send welcome with our public key
-        server_pub = load_public_pem()
-        conn.sendall(f"WELCOME {server_pub}\n".encode())
+        resuming = data.upper().startswith("RESUME ")
+        if resuming:
+            client_pubkey, client_role, options = parse_resume(data)
+        else:
+            client_pubkey, client_role, options = parse_hello(data)
+        admit_handshake()
         
-        print(f"[✓] Peer authenticated: {pubkey[:32]}...")
+        # Register peer
+        peer = register_peer(client_pubkey, addr, client_role, writer)
+        if peer is None:
+            raise HandshakeError("peer limit reached")
         
-        # Send recent chat history
-        if chat_history:
-            history_msg = json.dumps({
-                "type": "HISTORY",
-                "messages": chat_history[-10:]
-            }) + "\n"
-            conn.sendall(history_msg.encode())
+        # Phase 2: Challenge-response authentication (the ticket stands in
+        # for it on RESUME)
+        if not resuming:
+            challenge = secrets.token_hex(32)
+            writer.write(f"CHALLENGE {challenge}\n".encode())
+            
+            response = (await reader.readline()).decode().strip()
+            await authenticate_async(client_pubkey, challenge, parse_response(response))
+        check_node(client_pubkey, options)
         
-        # Announce new peer
-        broadcast_message(f"Peer {pubkey[:8]}... joined", None)
+        timers.cancel(deadline)
+        out = AsyncOutbound(writer, QUEUE_LIMIT, BACKPRESSURE_POLICY, **write_options())
+        handle = complete_handshake(peer, out, options)
+        handshake_latency["total"].record(time.perf_counter() - accepted)
         
-        # Phase 3: Message loop
-        buffer = ""
+        # Phase 3: Message loop, in whatever framing WELCOME acknowledged
         while True:
-            data = conn.recv(4096)
-            if not data:
+            data = await read_frame(reader, out.framing)
+            if data is None:
                 break
+            metrics.inc("bytes_in", len(data))
+            
+            line = data.decode().strip()
+            if not line:
+                continue
             
-            buffer += data.decode()
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                line = line.strip()
-                
-                if not line:
-                    continue
-                
-                # Update last seen
-                peers[pubkey]["last_seen"] = time.time()
-                
-                # Handle commands
-                if line.upper() == "PING":
-                    conn.sendall(b"PONG\n")
-                
-                elif line.upper() == "PEERS":
-                    peer_list = [
-                        {
-                            "pubkey": pk[:32],
-                            "role": p["role"],
-                            "last_seen": p["last_seen"]
-                        }
-                        for pk, p in peers.items()
-                        if p.get("challenge_passed")
-                    ]
-                    response = json.dumps({"type": "PEERS", "peers": peer_list}) + "\n"
-                    conn.sendall(response.encode())
-                
-                elif line.startswith("CHAT "):
-                    message = line[5:]
-                    broadcast_message(message, pubkey)
-                
-                else:
-                    # Echo unknown commands
-                    conn.sendall(f"ECHO: {line}\n".encode())
+            handle(line)
+    
+    except HandshakeError as e:
+        metrics.inc("handshake_failures")
+        if not writer.is_closing():
+            writer.write(f"ERR {e}\n".encode())
     
     except Exception as e:
-        print(f"[-] Connection error with {addr}: {e}")
+        log.warning("Connection error with %s: %s", addr, e)
     
     finally:
-        if pubkey:
-            remove_peer(conn)
-        else:
-            try:
-                conn.close()
-            except:
-                pass
+        timers.cancel(deadline)
+        if peer:
+            remove_peer(writer)
+        writer.close()
+
+
+async def serve_asyncio(host, port, reuse_port=False):
+    """Serve every connection as a task on a single event loop"""
+    server = await asyncio.start_server(
+        handle_stream, host, port, reuse_address=True, reuse_port=reuse_port,
+        limit=MAX_FRAME
+    )
+    
+    # Bus and federation frames arrive on other threads; apply them on the loop
+    loop = asyncio.get_running_loop()
+    timers.dispatch = loop.call_soon_threadsafe
+    start_timers()
+    if bus:
+        bus.start(lambda op, body: loop.call_soon_threadsafe(handle_bus_message, op, body))
+    if federation:
+        federation.dispatch = loop.call_soon_threadsafe
+        federation.start(LINK_TARGETS)
+    log.info("%s successfully (asyncio engine), waiting for connections", started_label())
+    
+    async with server:
+        await server.serve_forever()
+
+
+def started_label():
+    if bus:
+        return f"Worker {bus.worker} (pid {os.getpid()}) started"
+    return "Server started"
+
+
+def serve(args, reuse_port=False):
+    """Run the selected engine until interrupted"""
+    start_roster()
+    start_metrics_http(args)
+    if args.engine == "asyncio":
+        asyncio.run(serve_asyncio(args.host, args.port, reuse_port))
+    else:
+        serve_threaded(args.host, args.port, reuse_port)
+
+
+# -------------------------
+# Worker Processes
+# -------------------------
+
+def fork_workers(count, args):
+    """Fork `count` workers; returns {pid: (worker id, master end of its bus)}"""
+    children = {}
+    for worker in range(1, count + 1):
+        master_end, worker_end = bus_pair()
+        pid = os.fork()
+        if pid == 0:
+            master_end.close()
+            for _, other in children.values():
+                other.close()
+            run_worker(worker, worker_end, args)
+        worker_end.close()
+        children[pid] = (worker, master_end)
+    return children
+
+
+def run_worker(worker, sock, args):
+    """Forked worker: serve the shared port until stopped, then exit"""
+    global bus, chat_log, peer_store, mailboxes
+    bus = WorkerBus(sock, worker)
+    peer_store = None  # the master owns the registry file
+    mailboxes = None  # and the mailboxes, since a peer may come back on any worker
+    if chat_log:
+        # The master appends; workers only page through it for HISTORY
+        chat_log = ChatLog(CHATLOG_DIR, readonly=True)
+    start_verify_pool(args)
+    status = 0
+    try:
+        serve(args, reuse_port=True)
+    except KeyboardInterrupt:
+        # The master and a closing bus may both ask us to stop
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        shutdown()
+    except Exception as e:
+        log.error("Worker %d failed: %s", worker, e)
+        status = 1
+    # Skip interpreter teardown: it would flush objects inherited from the master
+    logs.stop()
+    os._exit(status)
+
+
+def run_master(children):
+    """Relay between workers and persist the registry until interrupted"""
+    if mailboxes:
+        hub = BusHub(sequence_chat, peers, peers_changed, hold_mail, deliver_mail)
+    else:
+        hub = BusHub(sequence_chat, peers, peers_changed)
+    for worker, master_end in children.values():
+        hub.add_worker(worker, master_end)
+    
+    try:
+        while children:
+            pid, status = os.wait()
+            if pid in children:
+                worker, _ = children.pop(pid)
+                log.warning("Worker %d exited with status %d", worker, status)
+    except KeyboardInterrupt:
+        log.info("Shutting down workers...")
+    
+    hub.stop()
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    hub.close()
+    
+    log.info("Worker bus: %s", hub.stats())
+    peer_store.close()
+    log.info("Peer registry writes: %s", peer_store.stats())
+    if chat_log:
+        chat_log.close()
+    if mailboxes:
+        close_mailboxes()
 
 
 # -------------------------
 # Main Server
 # -------------------------
 
-def main():
+ENGINES = ("thread", "asyncio")
+
+
+def load_chat_log():
+    """Open the durable chat log and replay its tail into the history ring"""
+    global chat_log, chat_history
+    
+    chat_log = ChatLog(CHATLOG_DIR)
+    tail = chat_log.tail(MAX_CHAT_HISTORY)
+    chat_history = ChatRing(MAX_CHAT_HISTORY, first_seq=chat_log.last_seq + 1 - len(tail))
+    for message in tail:
+        chat_history.append(message)
+    log.info("Chat log at seq %d, replayed %d messages", chat_log.last_seq, len(tail))
+
+
+def close_mailboxes():
+    """Hold mail for the peers still connected too, then persist every mailbox"""
+    for peer in peers.connected():
+        if peer.challenge_passed:
+            hold_mail(peer.pubkey)
+    mailboxes.close()
+    log.info("Mailboxes: %s", mailboxes.stats())
+
+
+def start_verify_pool(args):
+    """Move signature checks off the connection handlers, if configured"""
+    global verify_pool
+    if args.verify_pool != INLINE:
+        verify_pool = VerifyPool(
+            check_signature, args.verify_pool, args.verify_workers,
+            args.verify_queue, args.verify_timeout
+        )
+
+
+def handshake_stats():
+    """Handshake latency split into key parsing and signature verification"""
+    stats = {phase: latency.stats() for phase, latency in handshake_latency.items()}
+    stats["key_cache"] = key_cache.stats()
+    if verify_pool:
+        stats["verify_pool"] = verify_pool.stats()
+    if ticket_issuer:
+        stats["tickets"] = ticket_issuer.stats()
+    return stats
+
+
+def limit_stats():
+    """Rate limiter and admission controller counters"""
+    stats = {}
+    if limiter:
+        stats["rate"] = limiter.stats()
+    if admission:
+        stats["admission"] = admission.stats()
+    return stats
+
+
+def shutdown():
+    """Flush everything that must survive a restart"""
+    timers.stop()
+    log.info("Handshake latency: %s", handshake_stats())
+    log.info("Counters: %s", metrics.snapshot()["counters"])
+    log.info("Timers: %s", timers.stats())
+    if federation:
+        federation.stop()
+        log.info("Federation: %s", federation.stats())
+    log.info("Channels: %s", channels.stats())
+    if roster:
+        log.info("Roster: %s", roster.stats())
+    log.info("Limits: %s", limit_stats())
+    if peer_store:
+        peer_store.close()
+        log.info("Peer registry writes: %s", peer_store.stats())
+    elif not bus:
+        save_peers()
+    if chat_log:
+        chat_log.close()
+    if mailboxes:
+        close_mailboxes()
+    if verify_pool:
+        verify_pool.shutdown()
+    log.info("Outbound writes: %s", write_totals(p.out for p in peers.connected() if p.out))
+    log.info("Compression: %s", compression_totals())
+
+
+def handle_sigterm(signum, frame):
+    """Treat SIGTERM like Ctrl-C so shutdown() still runs"""
+    raise KeyboardInterrupt
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="PURE Protocol Server")
+    parser.add_argument("--host", default=HOST, help="address to bind")
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on")
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="thread",
+        help="thread: one thread per peer; asyncio: one event loop for all peers"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="processes sharing the port via SO_REUSEPORT; 1 serves in-process"
+    )
+    parser.add_argument(
+        "--federate", action="store_true",
+        help="accept links from other nodes and gossip chat and peers with them"
+    )
+    parser.add_argument(
+        "--link", action="append", default=[], metavar="HOST:PORT",
+        help="keep a federation link to another node (repeatable; implies --federate)"
+    )
+    parser.add_argument(
+        "--trust-node", action="append", default=[], metavar="NODE_ID",
+        help="node ID (from that node's banner) allowed to link with us, inbound or"
+        " outbound (repeatable; federation links nothing without one)"
+    )
+    parser.add_argument(
+        "--max-peers", type=int, default=MAX_PEERS,
+        help="maximum number of registered peers"
+    )
+    parser.add_argument(
+        "--key-cache-size", type=int, default=MAX_KEYS,
+        help="parsed peer public keys kept in memory"
+    )
+    parser.add_argument(
+        "--key-cache-ttl", type=float, default=KEY_TTL,
+        help="seconds a parsed public key stays cached"
+    )
+    parser.add_argument(
+        "--verify-pool", choices=VERIFY_KINDS, default=INLINE,
+        help="where RSA signature checks run: inline, thread pool or process pool"
+    )
+    parser.add_argument(
+        "--verify-workers", type=int, default=os.cpu_count() or 1,
+        help="verification pool size"
+    )
+    parser.add_argument(
+        "--verify-queue", type=int, default=MAX_PENDING,
+        help="handshakes allowed to wait for verification before refusing more"
+    )
+    parser.add_argument(
+        "--verify-timeout", type=float, default=MAX_WAIT,
+        help="seconds a handshake may wait for verification"
+    )
+    parser.add_argument(
+        "--ticket-lifetime", type=int, default=TICKET_LIFETIME,
+        help="seconds a resumption ticket stays valid; 0 disables RESUME"
+    )
+    parser.add_argument(
+        "--persist-interval-ms", type=int, default=int(WRITE_INTERVAL * 1000),
+        help="longest a peer registry change waits before being written"
+    )
+    parser.add_argument(
+        "--persist-max-changes", type=int, default=MAX_CHANGES,
+        help="pending peer registry changes that force an immediate write"
+    )
+    parser.add_argument(
+        "--no-chatlog", action="store_true",
+        help="keep chat history in memory only"
+    )
+    parser.add_argument(
+        "--handshake-timeout", type=float, default=HANDSHAKE_TIMEOUT,
+        help="seconds a connection has to complete HELLO/RESPONSE or RESUME"
+    )
+    parser.add_argument(
+        "--heartbeat", type=float, default=HEARTBEAT_INTERVAL,
+        help="quiet seconds before the server PINGs a peer"
+    )
+    parser.add_argument(
+        "--idle-timeout", type=float, default=IDLE_TIMEOUT,
+        help="quiet seconds before a peer is disconnected; 0 keeps idle peers forever"
+    )
+    parser.add_argument(
+        "--limit", action="append", default=[], metavar="CMD=RATE/BURST",
+        help="per-peer token bucket for a command, e.g. CHAT=10/30; CMD=off removes it"
+        " (repeatable; * covers commands without their own limit)"
+    )
+    parser.add_argument(
+        "--shed-queued", type=int, default=MAX_QUEUED,
+        help="outbound frames queued across all peers before shedding load; 0 disables"
+    )
+    parser.add_argument(
+        "--shed-cpu", type=float, default=MAX_CPU,
+        help="process CPU percent (100 = one core) before shedding load; 0 disables"
+    )
+    parser.add_argument(
+        "--no-limits", action="store_true",
+        help="disable rate limits and load shedding, e.g. for benchmarks"
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, default=0,
+        help="serve Prometheus metrics on this port (workers use the following ports); 0 disables"
+    )
+    parser.add_argument(
+        "--metrics-host", default="127.0.0.1",
+        help="address the metrics endpoint binds"
+    )
+    parser.add_argument(
+        "--log-level", choices=logs.LEVELS, default="info",
+        help="least severe log messages written; debug adds one line per connection"
+    )
+    parser.add_argument(
+        "--max-streams", type=int, default=STREAM_LIMIT,
+        help="identities one multiplexed connection may authenticate; 0 refuses MUX"
+    )
+    parser.add_argument(
+        "--compress-level", type=int, choices=range(10), default=COMPRESS_LEVEL, metavar="0-9",
+        help="zlib level for connections negotiating COMPRESS=zlib; 0 refuses compression"
+    )
+    parser.add_argument(
+        "--compress-min", type=int, default=COMPRESS_MIN,
+        help="smallest write, in bytes, deflated for a compressing peer; less goes out as it is"
+    )
+    parser.add_argument(
+        "--mailbox-size", type=int, default=MAILBOX_SIZE,
+        help="chat messages held for each peer that went away; 0 disables mailboxes"
+    )
+    parser.add_argument(
+        "--mailbox-memory", type=int, default=MEMORY_BYTES,
+        help="bytes of held mail kept in memory before it spills to disk"
+    )
+    parser.add_argument(
+        "--max-mailboxes", type=int, default=MAX_MAILBOXES,
+        help="away peers mail is held for; past this the longest-gone peer's is dropped"
+    )
+    parser.add_argument(
+        "--queue-limit", type=int, default=QUEUE_LIMIT,
+        help="outbound frames buffered per peer"
+    )
+    parser.add_argument(
+        "--backpressure", choices=POLICIES, default=BACKPRESSURE_POLICY,
+        help="what to do when a peer's outbound queue is full"
+    )
+    parser.add_argument(
+        "--coalesce-us", type=int, default=COALESCE_US,
+        help="microseconds a peer's writer waits for more frames before writing"
+    )
+    parser.add_argument(
+        "--coalesce-bytes", type=int, default=COALESCE_BYTES,
+        help="queued bytes that end the wait early; also the largest single write"
+    )
+    parser.add_argument(
+        "--tcp", choices=TCP_MODES, default=TCP_MODE,
+        help="per-connection TCP_NODELAY / TCP_CORK setting"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Start the PURE protocol server"""
+    global MAX_PEERS, QUEUE_LIMIT, BACKPRESSURE_POLICY, welcome_pem, peer_store, key_cache
+    global verify_pool, ticket_issuer, COALESCE_US, COALESCE_BYTES, TCP_MODE, federation
+    global HANDSHAKE_TIMEOUT, HEARTBEAT_INTERVAL, IDLE_TIMEOUT, limiter, admission
+    global STREAM_LIMIT, COMPRESS_LEVEL, COMPRESS_MIN, MAILBOX_SIZE, mailboxes
+    
+    args = parse_args(argv)
+    logs.start(args.log_level)
+    MAX_PEERS = args.max_peers
+    QUEUE_LIMIT = args.queue_limit
+    BACKPRESSURE_POLICY = args.backpressure
+    COALESCE_US = args.coalesce_us
+    COALESCE_BYTES = args.coalesce_bytes
+    TCP_MODE = args.tcp
+    HANDSHAKE_TIMEOUT = args.handshake_timeout
+    HEARTBEAT_INTERVAL = args.heartbeat
+    IDLE_TIMEOUT = args.idle_timeout
+    STREAM_LIMIT = args.max_streams
+    COMPRESS_LEVEL = args.compress_level
+    COMPRESS_MIN = args.compress_min
+    MAILBOX_SIZE = max(args.mailbox_size, 0)
+    if TCP_MODE == TCP_CORK and not hasattr(socket, "TCP_CORK"):
+        log.warning("TCP_CORK is not available on this platform, using nodelay")
+        TCP_MODE = TCP_NODELAY
+    for target in args.link:
+        host, _, port = target.rpartition(":")
+        if not host or not port.isdigit():
+            log.error("--link expects HOST:PORT, got %r", target)
+            logs.stop()
+            return
+        LINK_TARGETS.append((host, int(port)))
+    for node in args.trust_node:
+        if len(node) != 16 or any(c not in "0123456789abcdef" for c in node):
+            log.error("--trust-node expects a 16-digit hex node ID, got %r", node)
+            logs.stop()
+            return
+        TRUSTED_NODES.append(node)
+    if args.no_limits:
+        limiter = None
+    else:
+        for spec in args.limit:
+            try:
+                limiter.configure(*parse_limit(spec))
+            except ValueError as e:
+                log.error("--limit: %s", e)
+                logs.stop()
+                return
+        admission = Admission(queued_frames, args.shed_queued, args.shed_cpu)
+        if not admission.enabled():
+            admission = None
+    federate = args.federate or bool(LINK_TARGETS)
+    if federate and not TRUSTED_NODES:
+        log.warning("Federation without --trust-node: every node link will be refused")
+    workers = args.workers
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        log.warning("SO_REUSEPORT is not available on this platform, using one process")
+        workers = 1
+    if workers > 1 and federate:
+        log.warning("Federation needs a single process, ignoring --workers")
+        workers = 1
+    declare_metrics()
+    key_cache = KeyCache(args.key_cache_size, args.key_cache_ttl)
+    if args.ticket_lifetime > 0:
+        # Workers inherit the key and the replay table, so a ticket issued by
+        # one worker is redeemed exactly once by any of them
+        replay = SharedReplaySet() if workers > 1 else None
+        ticket_issuer = TicketIssuer(lifetime=args.ticket_lifetime, replay=replay)
+    else:
+        ticket_issuer = None
+    if workers == 1:
+        start_verify_pool(args)
+    
     ensure_keys()
     load_peers()
+    if not args.no_chatlog:
+        load_chat_log()
+    if MAILBOX_SIZE:
+        mailboxes = MailStore(MAILBOX_DIR, MAILBOX_SIZE, args.max_mailboxes, args.mailbox_memory)
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
-    server_pub = load_public_pem()
+    welcome_pem = load_public_pem()
+    node_id = welcome_pem.splitlines()[1][:32]
+    if federate:
+        federation = Federation(
+            welcome_pem, sign_message, verify_signature, record_chat, node_peers_changed,
+            new_link_queue, TRUSTED_NODES
+        )
     print("\n" + "="*50)
     print("PURE Protocol Server v0.3")
     print("="*50)
-    print(f"Node ID: {server_pub.split('\n')[1][:32]}...")
-    print(f"Listening on {HOST}:{PORT}")
+    print(f"Node ID: {node_id}...")
+    print(f"Listening on {args.host}:{args.port}")
+    print(f"Engine: {args.engine}" + (f", {workers} workers" if workers > 1 else ""))
+    print(f"Backpressure: {BACKPRESSURE_POLICY} after {QUEUE_LIMIT} frames")
+    print(f"Writes: coalesce {COALESCE_US}us / {COALESCE_BYTES} bytes, tcp {TCP_MODE}")
+    idle = f"idle timeout {IDLE_TIMEOUT:g}s" if IDLE_TIMEOUT else "idle peers kept"
+    print(f"Timeouts: handshake {HANDSHAKE_TIMEOUT:g}s, heartbeat {HEARTBEAT_INTERVAL:g}s, {idle}")
+    if limiter:
+        rates = ", ".join(f"{c} {limit_label(l)}" for c, l in sorted(limiter.limits.items()))
+        print(f"Rate limits: {rates}")
+    if admission:
+        cpu = f"{admission.max_cpu:g}% cpu" if admission.max_cpu else "no cpu limit"
+        queued = f"{admission.max_queued} queued frames" if admission.max_queued else "no queue limit"
+        print(f"Load shedding: {queued}, {cpu}")
+    if STREAM_LIMIT:
+        print(f"Multiplexing: up to {STREAM_LIMIT} identities per connection")
+    if COMPRESS_LEVEL:
+        print(f"Compression: zlib level {COMPRESS_LEVEL} on request, writes of {COMPRESS_MIN}+ bytes")
+    if mailboxes:
+        print(f"Mailboxes: {MAILBOX_SIZE} messages per away peer, "
+              f"{args.mailbox_memory} bytes in memory, then {MAILBOX_DIR}")
+    if args.verify_pool != INLINE:
+        print(f"Verification: {args.verify_pool} pool, {args.verify_workers} workers")
+    if federation:
+        targets = ", ".join(f"{h}:{p}" for h, p in LINK_TARGETS) or "none"
+        print(f"Federation: node {federation.node}, links to {targets}, "
+              f"{len(TRUSTED_NODES)} trusted nodes")
     print("="*50 + "\n")
     
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind((HOST, PORT))
-        server_socket.listen()
-        
-        print("[✓] Server started successfully")
-        print("[*] Waiting for connections...\n")
-        
-        try:
-            while True:
-                conn, addr = server_socket.accept()
-                thread = threading.Thread(
-                    target=handle_connection,
-                    args=(conn, addr),
-                    daemon=True
-                )
-                thread.start()
-        
-        except KeyboardInterrupt:
-            print("\n[*] Shutting down server...")
-            save_peers()
-            print("[✓] Server stopped")
+    # Fork before any thread starts; workers only ever run the forking thread
+    children = fork_workers(workers, args) if workers > 1 else None
+    peer_store = PeerStore(
+        PEERS_PATH, peers_snapshot,
+        interval=args.persist_interval_ms / 1000,
+        max_changes=args.persist_max_changes
+    )
+    metrics.latency("peer_writes", "peer registry file write", peer_store.write_latency)
+    if chat_log:
+        metrics.latency("chatlog_commits", "chat log group-commit fsync", chat_log.commit_latency)
+    if children:
+        run_master(children)
+        log.info("Server stopped")
+        logs.stop()
+        return
+    
+    try:
+        serve(args)
+    
+    except KeyboardInterrupt:
+        log.info("Shutting down server...")
+        shutdown()
+        log.info("Server stopped")
+        logs.stop()
 
 
 if __name__ == "__main__":
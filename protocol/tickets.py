@@ -0,0 +1,159 @@
+"""
+PURE Protocol session resumption tickets
+- WELCOME can carry a short-lived ticket signed with a server HMAC key
+- RESUME <ticket> re-authenticates in one round trip, no RSA involved
+- Tickets are single-use: redeemed nonces are remembered until they expire
+- Worker processes share the HMAC key and a replay table in shared memory
+"""
+
+import base64
+import hashlib
+import hmac
+import mmap
+import multiprocessing
+import secrets
+import struct
+import threading
+import time
+from collections import deque
+
+TICKET_LIFETIME = 300  # seconds
+TICKET_VERSION = 1
+HEADER = struct.Struct(">BQ16s")  # version, expiry (unix seconds), nonce
+MAC_SIZE = 32
+
+SLOT = struct.Struct(">Q16s")  # expiry, nonce; expiry 0 marks a free slot
+SHARED_SLOTS = 65536
+PROBE_LIMIT = 64
+
+
+class TicketError(Exception):
+    """Ticket is malformed, forged, expired or already used"""
+
+
+class ReplaySet:
+    """Redeemed nonces of one process, remembered until their tickets expire"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.used = set()  # nonces redeemed and not yet expired
+        self.used_order = deque()  # (expiry, nonce), oldest first
+
+    def add(self, nonce, expiry, now):
+        """Record a redemption; False if the nonce was already redeemed"""
+        with self.lock:
+            self.forget_expired(now)
+            if nonce in self.used:
+                return False
+            self.used.add(nonce)
+            self.used_order.append((expiry, nonce))
+            return True
+
+    def forget_expired(self, now):
+        """Drop replay entries whose tickets can no longer be presented"""
+        while self.used_order and self.used_order[0][0] < now:
+            _, nonce = self.used_order.popleft()
+            self.used.discard(nonce)
+
+    def __len__(self):
+        return len(self.used)
+
+
+class SharedReplaySet:
+    """Replay table in anonymous shared memory, for workers forked after creation
+
+    An open-addressing hash table of (expiry, nonce) slots. Expired slots are
+    reused in place, so the table never needs a sweep. If every slot in a
+    probe window is live the redemption is refused (fail closed) and the
+    client falls back to a full handshake.
+    """
+
+    def __init__(self, slots=SHARED_SLOTS):
+        self.slots = slots
+        self.table = mmap.mmap(-1, slots * SLOT.size)
+        self.lock = multiprocessing.Lock()
+
+    def add(self, nonce, expiry, now):
+        """Record a redemption; False if already redeemed or the table is full"""
+        start = int.from_bytes(nonce[:8], "big") % self.slots
+        with self.lock:
+            free = None
+            for probe in range(min(PROBE_LIMIT, self.slots)):
+                offset = (start + probe) % self.slots * SLOT.size
+                slot_expiry, slot_nonce = SLOT.unpack_from(self.table, offset)
+                if slot_expiry >= now:
+                    if slot_nonce == nonce:
+                        return False
+                elif free is None:
+                    free = offset
+            if free is None:
+                return False
+            SLOT.pack_into(self.table, free, expiry, nonce)
+            return True
+
+    def __len__(self):
+        now = time.time()
+        with self.lock:
+            return sum(
+                1 for (expiry, _) in SLOT.iter_unpack(self.table) if expiry >= now
+            )
+
+
+class TicketIssuer:
+    """Issues and redeems resumption tickets bound to a peer's public key"""
+
+    def __init__(self, secret=None, lifetime=TICKET_LIFETIME, replay=None):
+        self.secret = secret or secrets.token_bytes(32)
+        self.lifetime = lifetime
+        self.replay = replay if replay is not None else ReplaySet()
+        self.issued = 0
+        self.redeemed = 0
+        self.rejected = 0
+
+    def sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()
+
+    def issue(self, pubkey_pem):
+        """New ticket for a peer that just authenticated"""
+        expiry = int(time.time()) + self.lifetime
+        payload = HEADER.pack(TICKET_VERSION, expiry, secrets.token_bytes(16))
+        payload += pubkey_pem.encode()
+        self.issued += 1
+        token = base64.urlsafe_b64encode(payload + self.sign(payload))
+        return token.decode().rstrip("=")
+
+    def redeem(self, ticket):
+        """Validate a ticket once; returns the public key PEM it was issued to"""
+        try:
+            raw = base64.urlsafe_b64decode(ticket + "=" * (-len(ticket) % 4))
+        except (ValueError, TypeError):
+            raw = b""
+
+        payload, mac = raw[:-MAC_SIZE], raw[-MAC_SIZE:]
+        if len(payload) <= HEADER.size or not hmac.compare_digest(mac, self.sign(payload)):
+            return self.reject("invalid ticket")
+
+        version, expiry, nonce = HEADER.unpack_from(payload)
+        now = time.time()
+        if version != TICKET_VERSION:
+            return self.reject("invalid ticket")
+        if expiry < now:
+            return self.reject("ticket expired")
+
+        if not self.replay.add(nonce, expiry, now):
+            return self.reject("ticket already used")
+
+        self.redeemed += 1
+        return payload[HEADER.size:].decode()
+
+    def reject(self, reason):
+        self.rejected += 1
+        raise TicketError(reason)
+
+    def stats(self):
+        return {
+            "issued": self.issued,
+            "redeemed": self.redeemed,
+            "rejected": self.rejected,
+            "replay_set": len(self.replay),
+        }
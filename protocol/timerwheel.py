@@ -0,0 +1,131 @@
+"""
+PURE Protocol timer wheel
+- Hashed timing wheel: a ring of slots, one per tick, each a set of timers
+- schedule() and cancel() are O(1); a tick only visits the timers in one slot
+- Delays longer than one revolution wait out extra rounds in their slot
+- Expired callbacks run through `dispatch`, so an event loop can own them
+"""
+
+import logging
+import threading
+import time
+
+RESOLUTION = 0.1  # seconds per tick
+SLOTS = 1024  # one revolution = SLOTS * RESOLUTION seconds
+
+log = logging.getLogger("pure.timerwheel")
+
+
+class Timer:
+    """Handle returned by schedule(); pass it to cancel()"""
+
+    __slots__ = ("slot", "rounds", "callback", "args")
+
+    def __init__(self, slot, rounds, callback, args):
+        self.slot = slot
+        self.rounds = rounds  # full revolutions left before it fires
+        self.callback = callback
+        self.args = args
+
+
+class TimerWheel:
+    """Thousands of coarse timeouts (heartbeats, deadlines) on one thread"""
+
+    def __init__(self, resolution=RESOLUTION, slots=SLOTS):
+        self.resolution = resolution
+        self.slots = [set() for _ in range(slots)]
+        self.current = 0  # slot the next tick expires
+        self.lock = threading.Lock()
+        self.dispatch = lambda fn, *args: fn(*args)
+        self.running = False
+        self.pending = 0
+        self.scheduled = 0
+        self.fired = 0
+        self.cancelled = 0
+        self.ticks = 0
+        self.late_ticks = 0  # ticks run behind schedule, e.g. after a GC pause
+        self.errors = 0
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) after roughly `delay` seconds (rounded up to a tick)"""
+        ticks = max(1, -int(-delay // self.resolution))
+        with self.lock:
+            rounds, offset = divmod(ticks - 1, len(self.slots))
+            timer = Timer((self.current + offset) % len(self.slots), rounds, callback, args)
+            self.slots[timer.slot].add(timer)
+            self.pending += 1
+            self.scheduled += 1
+            return timer
+
+    def cancel(self, timer):
+        """Forget a timer; harmless if it already fired or was cancelled"""
+        if timer is None:
+            return
+        with self.lock:
+            slot = self.slots[timer.slot]
+            if timer in slot:
+                slot.remove(timer)
+                self.pending -= 1
+                self.cancelled += 1
+
+    def tick(self):
+        """Advance one slot; returns the timers that expired"""
+        with self.lock:
+            slot = self.slots[self.current]
+            self.current = (self.current + 1) % len(self.slots)
+            self.ticks += 1
+            expired = []
+            for timer in slot:
+                if timer.rounds:
+                    timer.rounds -= 1
+                else:
+                    expired.append(timer)
+            for timer in expired:
+                slot.remove(timer)
+            self.pending -= len(expired)
+        return expired
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        """Tick on schedule; a late thread catches up instead of drifting"""
+        next_tick = time.monotonic() + self.resolution
+        while self.running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.resolution:
+                self.late_ticks += 1
+            next_tick += self.resolution
+            for timer in self.tick():
+                self.fired += 1
+                try:
+                    self.dispatch(self.fire, timer)
+                except RuntimeError:
+                    # fire() keeps callback errors in, so this is the
+                    # dispatch failing: the event loop closed, shutting down
+                    return
+
+    def fire(self, timer):
+        """Run one expired callback; its failure must not stop the wheel"""
+        try:
+            timer.callback(*timer.args)
+        except Exception as e:
+            self.errors += 1
+            log.error("Timer callback failed: %r", e)
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "cancelled": self.cancelled,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "errors": self.errors,
+        }
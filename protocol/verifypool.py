@@ -0,0 +1,146 @@
+"""
+PURE Protocol signature verification pool
+- Moves RSA verification off the connection handlers onto worker threads or processes
+- Bounded admission: handshakes beyond the queue limit are refused up front
+- Jobs that waited past their deadline are dropped unrun, with a retry-after hint
+"""
+
+import asyncio
+import concurrent.futures
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+KINDS = (INLINE, THREAD, PROCESS)
+
+MAX_PENDING = 256  # handshakes waiting for a worker before new ones are refused
+MAX_WAIT = 2.0  # seconds a handshake may wait for its verification
+
+
+class Busy(Exception):
+    """Verification refused; retry_after is a hint in whole seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"busy retry-after={retry_after}")
+        self.retry_after = retry_after
+
+
+def run_job(fn, deadline, args):
+    """Worker entry point; skips jobs whose handshake has already given up"""
+    if time.time() > deadline:
+        return None
+    return fn(*args)
+
+
+def warm_up():
+    return None
+
+
+class VerifyPool:
+    """Bounded front door to a thread or process pool running `fn`"""
+
+    def __init__(self, fn, kind=THREAD, workers=4, max_pending=MAX_PENDING, max_wait=MAX_WAIT):
+        if kind not in (THREAD, PROCESS):
+            raise ValueError(f"unknown verification pool: {kind}")
+        self.fn = fn
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.busy_time = 0.0
+
+        if kind == PROCESS:
+            # Fork now, before the server starts its own threads
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork")
+            )
+            for future in [self.executor.submit(warm_up) for _ in range(workers)]:
+                future.result()
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="verify"
+            )
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained"""
+        per_job = self.busy_time / self.completed if self.completed else 0.001
+        return max(1, math.ceil(self.pending * per_job / self.workers))
+
+    def submit(self, *args):
+        """Queue fn(*args); raises Busy when the admission queue is full"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Busy(self.retry_after())
+            self.pending += 1
+            self.submitted += 1
+
+        started = time.perf_counter()
+        future = self.executor.submit(run_job, self.fn, time.time() + self.max_wait, args)
+
+        def done(_):
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+                self.busy_time += time.perf_counter() - started
+
+        future.add_done_callback(done)
+        return future
+
+    def result(self, future):
+        """Unwrap a finished job, turning expired ones into Busy"""
+        result = future.result()
+        if result is None:
+            with self.lock:
+                self.expired += 1
+            raise Busy(self.retry_after())
+        return result
+
+    def call(self, *args):
+        """Run fn(*args) on the pool and wait for it (thread engine)"""
+        future = self.submit(*args)
+        try:
+            future.result(timeout=self.max_wait)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self.lock:
+                self.expired += 1
+            raise Busy(self.retry_after())
+        return self.result(future)
+
+    async def call_async(self, *args):
+        """Run fn(*args) on the pool without blocking the event loop"""
+        future = self.submit(*args)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), self.max_wait)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.expired += 1
+            raise Busy(self.retry_after())
+        return self.result(future)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }